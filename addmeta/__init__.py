@@ -1,4 +1,25 @@
 from .addmeta import *
 
-from . import _version
-__version__ = _version.get_versions()['version']
+
+def __getattr__(name):
+    # The version is looked up on first use, as versioneer runs git when
+    # addmeta isn't installed
+    if name == "__version__":
+        global __version__
+        __version__ = get_version()
+        return __version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_version():
+    """
+    Return the installed version of addmeta, only asking versioneer (which
+    can run git) when running from a source tree that isn't installed
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("addmeta")
+    except PackageNotFoundError:
+        from . import _version
+        return _version.get_versions()['version']
@@ -0,0 +1,168 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Controlling how many files parallel jobs process at once (addmeta
+--adaptive) and how fast files are started (addmeta --max-rate).
+
+Past some number of concurrent writers a shared filesystem gets slower for
+everyone, including addmeta. With adaptive set the controller starts with
+half the workers active, and every period (twice the number of active
+workers, and at least 4 files) compares the throughput and the median time
+spent opening and closing files with the previous period:
+
+- if the open/close latency is more than twice the lowest of the last 8
+  periods, the filesystem is under pressure and the number of active
+  workers is halved. Only recent periods are compared with, so a latency
+  that stays higher, because the files or the filesystem changed, becomes
+  the new normal rather than halving the workers again and again
+- if throughput improved, another step is taken in the same direction
+- if throughput fell, the direction is reversed
+- otherwise throughput has levelled off, near its peak, and nothing changes
+
+With max_rate no more than that many files are started per second, however
+many workers are active.
+
+Each change is recorded as a decision, printed with verbose output and
+included in the timing report.
+"""
+
+from collections import deque
+import statistics
+import time
+
+# Relative change in throughput treated as a real change, rather than noise
+TOLERANCE = 0.05
+
+# Latency, relative to the lowest of recent periods, taken as filesystem
+# pressure
+PRESSURE = 2.0
+
+# Number of periods the lowest latency is taken from
+BASELINE_PERIODS = 8
+
+
+class ConcurrencyController:
+    """
+    The number of files to process at once, out of max_workers, adjusted
+    from the latency of each file if adaptive, and the earliest time the
+    next file can be started if max_rate is set
+    """
+
+    def __init__(self, max_workers, adaptive=True, max_rate=None, min_workers=1,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_workers = max_workers
+        self.min_workers = min(min_workers, max_workers)
+        self.adaptive = adaptive
+        self.max_rate = max_rate
+        self.limit = max(self.min_workers, max_workers // 2) if adaptive else max_workers
+        self.clock = clock
+        self.sleep = sleep
+        self.direction = 1
+        self.baseline = None
+        self.recent_latencies = deque(maxlen=BASELINE_PERIODS)
+        self.throughput = None
+        self.decisions = []
+        self.waited = 0.
+        self.next_start = None
+        self._start_period()
+
+    def _start_period(self):
+        self.period_start = self.clock()
+        self.latencies = []
+
+    def wait(self):
+        """
+        Wait until the next file can be started without exceeding max_rate
+        """
+        if not self.max_rate:
+            return
+        now = self.clock()
+        if self.next_start is not None and now < self.next_start:
+            self.sleep(self.next_start - now)
+            self.waited += self.next_start - now
+            now = self.next_start
+        self.next_start = now + 1. / self.max_rate
+
+    def record(self, latency):
+        """
+        Record the open and close latency, in seconds, of a finished file.
+        Returns the decision if the number of active workers was changed
+        """
+        if not self.adaptive:
+            return None
+
+        self.latencies.append(latency)
+        if len(self.latencies) < max(4, 2 * self.limit):
+            return None
+
+        elapsed = self.clock() - self.period_start
+        throughput = len(self.latencies) / elapsed if elapsed > 0 else float("inf")
+        latency = statistics.median(self.latencies)
+        self._start_period()
+
+        previous = self.throughput
+        self.throughput = throughput
+        self.recent_latencies.append(latency)
+        self.baseline = min(self.recent_latencies)
+
+        if self.baseline > 0 and latency > PRESSURE * self.baseline:
+            limit = max(self.min_workers, self.limit // 2)
+            self.direction = 1
+            reason = f"open/close latency {1000 * latency:.1f} ms is over {PRESSURE:g} x {1000 * self.baseline:.1f} ms"
+        elif previous is None or throughput > previous * (1 + TOLERANCE):
+            limit = self.limit + self.direction
+            reason = "throughput rising" if previous is not None else "first period"
+        elif throughput < previous * (1 - TOLERANCE):
+            self.direction = -self.direction
+            limit = self.limit + self.direction
+            reason = "throughput falling"
+        else:
+            return None
+
+        limit = min(max(limit, self.min_workers), self.max_workers)
+        if limit == self.limit:
+            return None
+
+        decision = {
+            "from": self.limit,
+            "to": limit,
+            "throughput": throughput,
+            "latency": latency,
+            "reason": reason,
+        }
+        self.limit = limit
+        self.decisions.append(decision)
+        return decision
+
+    def report(self):
+        """
+        Return a summary of the controller's decisions
+        """
+        lines = [format_decision(decision) for decision in self.decisions]
+        if self.adaptive:
+            lines.append(f"Active workers: {self.limit} of {self.max_workers}, {len(self.decisions)} change(s)")
+        if self.max_rate:
+            lines.append(f"Rate limited to {self.max_rate:g} files/s, waited {self.waited:.3f} s")
+        return "\n".join(lines)
+
+def format_decision(decision):
+    return (f"Active workers {decision['from']} -> {decision['to']}: {decision['reason']} "
+            f"({decision['throughput']:.1f} files/s, open/close {1000 * decision['latency']:.1f} ms)")
+
+def file_latency(file_timings):
+    """
+    Time spent opening and closing a file, from its timings
+    """
+    return sum(file_timings.get(phase, {}).get("time", 0.) for phase in ("open", "close"))
@@ -3,19 +3,37 @@
 from __future__ import print_function
 
 
-from collections import defaultdict
-from collections.abc import Mapping
+from collections import Counter, defaultdict, deque
+from collections.abc import Mapping, Sized
+from contextlib import closing, contextmanager, redirect_stdout
 import copy
 import csv
 from datetime import datetime, timezone
+from functools import lru_cache
 import io
+from itertools import islice
+import os
 from pathlib import Path
 import re
+import warnings
 from warnings import warn
 
-from jinja2 import Template, StrictUndefined, UndefinedError
-import netCDF4 as nc
-import yaml
+from .adaptive import ConcurrencyController, file_latency, format_decision
+from .backends import BACKENDS, BackendError, H5Variable, open_dataset
+from .classic import ClassicDataset, ClassicVariable, HeaderPatchError, padding
+from .fnregex import FilenameRegexError, FilenameRegexs
+from .journal import Journal, file_state, plan_digest
+from .planfile import PlanError, PlanWriter, plan_entry, plan_header, read_plan
+from .schedule import Scheduler, make_scheduler, map_scheduled
+from .lazy import lazy_import
+from .timing import current_timings, start_timing, timed, timed_file
+from .walk import ScannedPath
+from .yamlcache import parse_yaml
+
+# Imported on first use, to keep startup fast
+jinja2 = lazy_import("jinja2")
+nc = lazy_import("netCDF4")
+np = lazy_import("numpy")
 
 
 # From https://gist.github.com/angstwad/bf22d1822c38a92ec0a9
@@ -38,8 +56,8 @@ def read_yaml(fname):
     """Open metadata yaml file and return a dict."""
 
     yamldict = {}
-    with open(fname, 'r') as yaml_file:
-        yamldict = yaml.safe_load(yaml_file)
+    with timed("read yaml"):
+        yamldict = parse_yaml(fname)
 
     return yamldict 
 
@@ -73,10 +91,11 @@ def combine_meta(fnames):
     return allmeta
 
 def get_file_metadata(filename):
-    """Get file metadata and return as a dict"""
+    """Get file metadata and return as a dict. A ScannedPath, from
+    walk_files, is not stat'ed again"""
 
     ncpath = Path(filename)
-    ncpath_stat = ncpath.stat()
+    ncpath_stat = filename.stat() if isinstance(filename, ScannedPath) else ncpath.stat()
 
     metadata = {key: getattr(ncpath_stat, 'st_'+key) for key in ["mtime", "size"]}
 
@@ -91,11 +110,16 @@ def get_file_metadata(filename):
     return metadata
 
 
-def update_history_attr(group, history, verbose=False):
+def update_history_attr(group, history, verbose=False, unique=False):
     """
     Update the history attribute with info on this invocation of addmeta.
-    Create the history attribute if it doesn't exist yet.
+    Create the history attribute if it doesn't exist yet. If unique is True
+    history is not appended if it is already the last entry.
     """
+    if unique and history_is_current(group, history):
+        if verbose: print(f"      = history: {history}")
+        return
+
     if verbose: print(f"      + history: {history}")
 
     # Grab the previous history if it exists
@@ -106,63 +130,402 @@ def update_history_attr(group, history, verbose=False):
     group.setncattr("history", history)
 
 
-def add_meta(ncfile, metadict, template_vars, sort_attrs=False, history=None, verbose=False):
+def history_is_current(group, history):
+    """
+    Return True if history is the last entry in the history attribute
+    """
+    return ("history" in group.ncattrs()
+            and group.getncattr("history").split("\n")[-1] == history)
+
+def add_meta(ncfile, metadict, template_vars, sort_attrs=False, history=None, verbose=False, skip_unchanged=False, engine="netcdf4", header_pad=0, prepared=None):
     """
-    Add meta data from a dictionary to a netCDF file
+    Add meta data from a dictionary, or a compiled AttributePlan, to a
+    netCDF file.
+
+    If skip_unchanged is True the file is first opened read-only and is
+    only opened for writing if applying the meta data would change it.
+
+    With engine="classic" the header of netCDF classic format files is
+    edited directly and rewritten in place. If the file isn't classic
+    format, or the edited header doesn't fit before the data, the netCDF4
+    library is used instead. Any other engine is the name of a storage
+    backend (see backends.py), which also falls back to netCDF4 if it
+    can't handle the file.
+
+    If header_pad is non-zero and the header of a classic format file would
+    have to grow past the data, or the file has no free space after the
+    header, the data is moved to leave header_pad bytes free after the new
+    header, so later edits can be made in place.
+
+    prepared is a PreparedFile with the attributes already rendered, see
+    prefetch_files.
+
+    Returns "updated" or "unchanged"
     """
-    rootgrp = nc.Dataset(ncfile, "r+")
+    plan = metadict if isinstance(metadict, AttributePlan) else AttributePlan(metadict)
+
+    attributes = None
+
+    if engine == "classic":
+        try:
+            with timed("open"):
+                rootgrp = ClassicDataset(ncfile)
+            attributes = render_file_attributes(rootgrp, plan, template_vars, prepared)
+            return add_meta_classic(rootgrp, plan, attributes, sort_attrs=sort_attrs, history=history,
+                                    verbose=verbose, skip_unchanged=skip_unchanged, header_pad=header_pad)
+        except HeaderPatchError as e:
+            if verbose: print(f"      ~ {e}, using netCDF4")
+    elif engine != "netcdf4":
+        try:
+            return add_meta_backend(ncfile, plan, template_vars, sort_attrs=sort_attrs, history=history,
+                                    verbose=verbose, skip_unchanged=skip_unchanged, backend=engine,
+                                    prepared=prepared)
+        except BackendError as e:
+            if verbose: print(f"      ~ {e}, using netCDF4")
 
+    return add_meta_backend(ncfile, plan, template_vars, attributes, sort_attrs=sort_attrs, history=history,
+                            verbose=verbose, skip_unchanged=skip_unchanged, header_pad=header_pad,
+                            prepared=prepared)
+
+def add_meta_backend(ncfile, plan, template_vars, attributes=None, sort_attrs=False, history=None, verbose=False, skip_unchanged=False, header_pad=0, backend="netcdf4", prepared=None):
+    """
+    Apply meta data to a netCDF file opened with a storage backend. Backends
+    raise BackendError before the file is modified if they can't handle it.
+    Returns "updated" or "unchanged"
+    """
+    if skip_unchanged:
+        with timed_open(ncfile, "r", backend=backend) as rootgrp:
+            if attributes is None:
+                attributes = render_file_attributes(rootgrp, plan, template_vars, prepared)
+            with timed("check unchanged"):
+                changed = meta_changed(rootgrp, plan, attributes, sort_attrs=sort_attrs, history=history)
+            if not changed:
+                if verbose: print("      = unchanged")
+                return "unchanged"
+
+    if header_pad:
+        if attributes is None:
+            with timed_open(ncfile, "r") as rootgrp:
+                attributes = render_file_attributes(rootgrp, plan, template_vars, prepared)
+        reserve_header_space(ncfile, plan, attributes, header_pad, sort_attrs=sort_attrs,
+                             history=history, verbose=verbose, unique_history=skip_unchanged)
+
+    with timed_open(ncfile, "r+", backend=backend) as rootgrp:
+
+        # Renaming happens first, so only attributes for variables that will
+        # exist under their new names need to be rendered
+        if attributes is None:
+            attributes = render_file_attributes(rootgrp, plan, template_vars, prepared)
+
+        # All the edits are rendered before the file is touched, and applied in
+        # one define mode session, so a classic format header is written once
+        with rootgrp.define_mode():
+            apply_meta(rootgrp, plan, attributes, sort_attrs=sort_attrs, history=history,
+                       verbose=verbose, unique_history=skip_unchanged)
+
+        if verbose and rootgrp.header_writes: print(f"      ~ header written {rootgrp.header_writes} time(s)")
+
+    return "updated"
+
+@contextmanager
+def timed_open(ncfile, mode, backend="netcdf4"):
+    """
+    Open a netCDF file with a storage backend, timing the open and close
+    """
+    with timed("open"):
+        rootgrp = open_dataset(ncfile, mode, backend=backend)
+    try:
+        yield rootgrp
+    finally:
+        with timed("close"):
+            rootgrp.close()
+
+def add_meta_classic(rootgrp, plan, attributes, sort_attrs=False, history=None, verbose=False, skip_unchanged=False, header_pad=0):
+    """
+    Apply meta data to the header of a classic format file, read into a
+    ClassicDataset, and write it back in place. Raises HeaderPatchError,
+    without modifying the file or printing anything, if that isn't possible.
+    Returns "updated" or "unchanged"
+    """
+    # Output is held back until the header is written, so nothing is
+    # reported twice if falling back to netCDF4
+    with io.StringIO() as output:
+        try:
+            with redirect_stdout(output):
+                apply_meta(rootgrp, plan, attributes, sort_attrs=sort_attrs, history=history,
+                           verbose=verbose, unique_history=skip_unchanged)
+                with timed("close"):
+                    _, shift = rootgrp.layout(header_pad)
+                    written = rootgrp.close(reserve=header_pad)
+        except HeaderPatchError:
+            raise
+        except Exception:
+            print(output.getvalue(), end='')
+            raise
+
+        print(output.getvalue(), end='')
+
+    if not written:
+        if verbose: print("      = unchanged")
+        return "unchanged"
+
+    if verbose:
+        if shift: print(f"      ~ moved data {shift} bytes to reserve header space")
+        print("      ~ header rewritten in place")
+    return "updated"
+
+def simulate_classic(rootgrp, plan, attributes, sort_attrs=False, history=None, unique_history=False):
+    """
+    Apply meta data to a ClassicDataset in memory only, without writing it.
+    Returns False if the meta data can't be applied
+    """
+    try:
+        with redirect_stdout(io.StringIO()):
+            apply_meta(rootgrp, plan, attributes, sort_attrs=sort_attrs, history=history,
+                       unique_history=unique_history)
+    except Exception:
+        return False
+
+    return True
+
+def reserve_header_space(ncfile, plan, attributes, header_pad, sort_attrs=False, history=None, verbose=False, unique_history=False):
+    """
+    Before writing a classic format file with netCDF4, move the data to leave
+    header_pad bytes free after the header it will have (see add_meta), so
+    libnetcdf doesn't have to move it without reserving any space
+    """
+    try:
+        simulated = ClassicDataset(ncfile)
+    except HeaderPatchError:
+        return
+
+    if not simulate_classic(simulated, plan, attributes, sort_attrs=sort_attrs,
+                            history=history, unique_history=unique_history):
+        return
+
+    if not simulated.changed:
+        return
+
+    _, shift = simulated.layout(header_pad)
+    if shift:
+        with timed("move data"):
+            ClassicDataset(ncfile).shift_data(shift)
+        if verbose: print(f"      ~ moved data {shift} bytes to reserve header space")
+
+def predict_header_growth(ncfiles, metadata, kwdata, fnregexs, sort_attrs=False, history=None, header_pad=0, now=None):
+    """
+    Predict, without modifying any files, how the header of each classic
+    format file would change if the meta data were applied. Yields a dict
+    for each file with the current and new header sizes, the offset of the
+    data, the free space left after the new header and the action needed:
+    "unchanged", "in place", "data shift", "not classic" or "error" if the
+    meta data can't be applied
+    """
+    template_vars = copy.deepcopy(kwdata)
+    fnregexs = FilenameRegexs(fnregexs)
+
+    if not isinstance(metadata, AttributePlan):
+        metadata = AttributePlan(metadata)
+    metadata = metadata.resolve(template_vars)
+
+    for fname in ncfiles:
+        set_file_template_vars(fname, metadata, template_vars, fnregexs, now=now)
+
+        report = dict(file=str(fname), format=None, header_size=None, new_header_size=None,
+                      data_start=None, free=None, shift=0, action="not classic")
+        try:
+            rootgrp = ClassicDataset(fname)
+        except HeaderPatchError:
+            yield report
+            continue
+
+        report.update(format=f"CDF-{rootgrp.version}", header_size=rootgrp.header_size)
+
+        attributes = metadata.render(template_vars, variables=renamed_variables(rootgrp, metadata.rename, metadata.variables))
+        if not simulate_classic(rootgrp, metadata, attributes, sort_attrs=sort_attrs, history=history):
+            report.update(action="error")
+            yield report
+            continue
+
+        header, shift = rootgrp.layout(header_pad)
+        data_start = rootgrp.data_start
+        report.update(new_header_size=len(header), data_start=data_start)
+
+        if not rootgrp.changed:
+            report.update(action="unchanged", free=rootgrp.free_space)
+        else:
+            if data_start is not None:
+                report['free'] = data_start + shift - len(header)
+            if shift:
+                report.update(action="data shift", shift=shift)
+            elif data_start is not None and len(header) > data_start:
+                # libnetcdf will move the data just enough to fit the header
+                report.update(action="data shift", shift=len(header) - data_start + padding(len(header)), free=0)
+            else:
+                report.update(action="in place")
+
+        yield report
+
+def apply_meta(rootgrp, plan, attributes, sort_attrs=False, history=None, verbose=False, unique_history=False):
+    """
+    Apply renames from the plan and rendered attributes to an open dataset
+    """
     # Rename variables and dimensions
-    if "rename" in metadict:
-        rename_dict = metadict["rename"]
-        if "variables" in rename_dict:
-            for old_name, new_name in rename_dict["variables"].items():
-                rename_var_or_dim(rootgrp, old_name, new_name, is_var=True, verbose=verbose)
-
-        if "dimensions" in rename_dict:
-            for old_name, new_name in rename_dict["dimensions"].items():
-                rename_var_or_dim(rootgrp, old_name, new_name, is_var=False, verbose=verbose)
-    
+    with timed("rename"):
+        for old_name, new_name in plan.rename['variables'].items():
+            rename_var_or_dim(rootgrp, old_name, new_name, is_var=True, verbose=verbose)
+
+        for old_name, new_name in plan.rename['dimensions'].items():
+            rename_var_or_dim(rootgrp, old_name, new_name, is_var=False, verbose=verbose)
+
     # Add metadata to matching variables
-    if "variables" in metadict:
-        for var, attr_dict in metadict["variables"].items():
-            if var in rootgrp.variables:
-                if sort_attrs:
-                    attr_dict = remove_update_sort_attrs(rootgrp.variables[var],
-                                                         attr_dict)
+    for var, attr_dict in attributes['variables'].items():
+        if sort_attrs:
+            with timed("sort"):
+                attr_dict = remove_update_sort_attrs(rootgrp.variables[var], attr_dict)
 
-                for attr, value in attr_dict.items():
-                    set_attribute(rootgrp.variables[var], attr, value, template_vars, verbose=verbose, var=var)
+        with timed("attributes"):
+            for attr, value in attr_dict.items():
+                write_attribute(rootgrp.variables[var], attr, value, verbose=verbose, var=var)
 
     # Update (or create) the history attribute
     if history:
-        update_history_attr(rootgrp, history, verbose=verbose)
+        with timed("history"):
+            update_history_attr(rootgrp, history, verbose=verbose, unique=unique_history)
 
     # Set global meta data
-    if "global" in metadict:
+    if plan.has_global:
+        attr_dict = attributes['global']
         if sort_attrs:
-            metadict['global'] = remove_update_sort_attrs(rootgrp, metadict['global'])
+            with timed("sort"):
+                attr_dict = remove_update_sort_attrs(rootgrp, attr_dict)
+
+        with timed("attributes"):
+            for attr, value in attr_dict.items():
+                write_attribute(rootgrp, attr, value, verbose=verbose)
 
-        for attr, value in metadict['global'].items():
-            set_attribute(rootgrp, attr, value, template_vars, verbose=verbose)
+def render_file_attributes(rootgrp, plan, template_vars, prepared=None):
+    """
+    Render the attributes of the plan for the variables in an open file,
+    taking them from a PreparedFile if they were rendered ahead
+    """
+    variables = renamed_variables(rootgrp, plan.rename, plan.variables)
+    if prepared is not None:
+        return prepared.select(variables)
+    with timed("render"):
+        return plan.render(template_vars, variables=variables)
+
+def renamed_variables(rootgrp, rename, names=None):
+    """
+    Return a dict of variable names after applying renames, mapped to the
+    current variable names, without modifying the file. If names is given
+    only those (new) names are looked up, so backends that open variables
+    lazily don't have to open them all
+    """
+    variables = rootgrp.variables
+    renamed = {}
+    removed = set()
 
-    rootgrp.close()
+    def exists(name):
+        return name in renamed or (name in variables and name not in removed)
+
+    for old_name, new_name in rename['variables'].items():
+        if exists(old_name) and not exists(new_name):
+            renamed[new_name] = renamed.pop(old_name, old_name)
+            removed.add(old_name)
+
+    if names is None:
+        names = [*variables, *renamed]
+    return {name: renamed.get(name, name) for name in names if exists(name)}
+
+def meta_changed(rootgrp, plan, attributes, sort_attrs=False, history=None):
+    """
+    Return True if applying the plan, with already rendered attributes, to
+    an open netCDF file would change it
+    """
+    for kind, container in (('variables', rootgrp.variables), ('dimensions', rootgrp.dimensions)):
+        if any(old_name in container for old_name in plan.rename[kind]):
+            return True
+
+    names = renamed_variables(rootgrp, plan.rename, attributes['variables'])
+    for var, attr_dict in attributes['variables'].items():
+        ncvar = rootgrp.variables[names[var]]
+        if group_attributes_changed(ncvar, attr_dict, sort_attrs=sort_attrs):
+            return True
+
+    if history and not history_is_current(rootgrp, history):
+        return True
+
+    if plan.has_global and group_attributes_changed(rootgrp, attributes['global'], sort_attrs=sort_attrs):
+        return True
+
+    return False
+
+def group_attributes_changed(ncgroup, attr_dict, sort_attrs=False):
+    """
+    Return True if setting the rendered attributes in attr_dict on a netCDF
+    group or variable would change its attributes or their order
+    """
+    current = {attr: ncgroup.getncattr(attr) for attr in ncgroup.ncattrs()}
+    expected = predict_attributes(current, attr_dict, sort_attrs=sort_attrs,
+                                  is_var=isinstance(ncgroup, (nc.Variable, ClassicVariable, H5Variable)))
+
+    return (list(current) != list(expected)
+            or not all(attribute_equal(current[attr], expected[attr]) for attr in current))
+
+def predict_attributes(current, attr_dict, sort_attrs=False, is_var=False):
+    """
+    Return the attributes, in order, that would result from applying the
+    rendered attributes in attr_dict to a group with current attributes
+    """
+    if sort_attrs:
+        # Mirror remove_update_sort_attrs: everything but a variable
+        # _FillValue is removed, merged and added back in sorted order
+        kept = {attr: value for attr, value in current.items()
+                if is_var and attr == "_FillValue"}
+        removed = {attr: value for attr, value in current.items() if attr not in kept}
+        expected, attr_dict = kept, order_dict(removed | attr_dict)
+    else:
+        expected = dict(current)
+
+    for attr, value in attr_dict.items():
+        if value is None:
+            expected.pop(attr, None)
+        else:
+            expected[attr] = value
+
+    return expected
+
+def attribute_equal(current, value):
+    """
+    Return True if an attribute value read from a file matches the value that
+    would be written. Strings must match exactly, numbers must be of the same
+    kind (integer, float) and have the same values
+    """
+    if isinstance(current, str) or isinstance(value, str):
+        return isinstance(current, str) and isinstance(value, str) and current == value
+
+    current, value = np.asarray(current), np.asarray(value)
+    return (current.dtype.kind == value.dtype.kind
+            and current.shape == value.shape
+            and np.array_equal(current, value))
 
 def match_filename_regex(filename, regexs, verbose=False):
     """
     Match a series of regexs against the filename and return a dict
     of jinja template variables
     """
-    vars = {}
+    if not isinstance(regexs, FilenameRegexs):
+        regexs = FilenameRegexs(regexs)
 
-    for regex in regexs:
-        match = re.search(regex, filename)
-        if match:
-            vars.update(match.groupdict())
-    if verbose: print(f'    Matched following filename variables: {vars}')
+    vars = regexs.match(filename)
+    if verbose: report_filename_vars(vars)
 
     return vars
 
+def report_filename_vars(vars):
+    print(f'    Matched following filename variables: {vars}')
+
 def array_to_csv(array):
     """
     Turn any list, tuple or set into a CSV string and return
@@ -202,11 +565,30 @@ def set_attribute(group, attribute, value, template_vars, verbose=False, var=Non
     """
     attr_name = f"{var}:{attribute}" if var else attribute
 
+    if not isinstance(value, CompiledAttribute):
+        value = CompiledAttribute(value)
+
+    try:
+        value = value.render(template_vars)
+    except jinja2.UndefinedError as e:
+        warn(f"Skip setting attribute '{attr_name}': {e}")
+        if verbose: print(f"      + {attr_name}: {value.source}")
+        return
+
+    write_attribute(group, attribute, value, verbose=verbose, var=var)
+
+def write_attribute(group, attribute, value, verbose=False, var=None):
+    """
+    Delete attribute if value is None, otherwise set it. The value must
+    already have been rendered
+    """
+    attr_name = f"{var}:{attribute}" if var else attribute
+
     if value is None:
-        if attribute in group.__dict__:
+        if attribute in group.ncattrs():
             try:
                 group.delncattr(attribute)
-            except UndefinedError as e:
+            except jinja2.UndefinedError as e:
                 warn(f"Could not delete attribute '{attr_name}': {e}")
                 return
             finally:
@@ -214,28 +596,7 @@ def set_attribute(group, attribute, value, template_vars, verbose=False, var=Non
         else:
             if verbose: print(f"      - {attr_name} (nothing to delete)")
     else:
-        if isinstance(value, (list, tuple)):
-            value = array_to_csv(value)
-
-        # Only valid to use jinja templates on strings
-        if isinstance(value, str):
-            try:
-                value, convert_to_number = detect_number_filter(value)
-
-                value = Template(value, undefined=StrictUndefined).render(template_vars)
-
-                if convert_to_number:
-                    # Try to convert to an integer first then a float
-                    try:
-                        value = int(value)
-                    except ValueError:
-                        value = float(value)
-            except UndefinedError as e:
-                warn(f"Skip setting attribute '{attr_name}': {e}")
-                return
-            finally:
-                if verbose: print(f"      + {attr_name}: {value}")
-
+        if verbose: print(f"      + {attr_name}: {value}")
         group.setncattr(attribute, value)
 
 def detect_number_filter(value):
@@ -261,6 +622,229 @@ def detect_number_filter(value):
     else:
         return value, False
 
+# Template variables that are different for every file. Attributes that
+# don't reference these only need to be rendered once
+PER_FILE_VARIABLES = frozenset(['__file__', '__datetime__'])
+
+@lru_cache(maxsize=None)
+def template_environment():
+    return jinja2.Environment(undefined=jinja2.StrictUndefined)
+
+def is_template(value):
+    """
+    Return True if the string contains any jinja delimiters
+    """
+    return any(delimiter in value for delimiter in ('{{', '{%', '{#'))
+
+def normalise_newlines(value):
+    """
+    Normalise newlines and remove a single trailing newline, which is all
+    jinja does when rendering a string without any template delimiters
+    """
+    lines = re.split(r'\r\n|\r|\n', value)
+    if lines[-1] == '':
+        del lines[-1]
+    return '\n'.join(lines)
+
+class CompiledAttribute:
+    """
+    An attribute value prepared once so it can be cheaply rendered for each
+    file. Lists and tuples are serialised to CSV, the "| number" filter is
+    detected and stripped, and strings are compiled to a jinja Template. Plain
+    strings without any template delimiters are rendered once here and stored
+    as constants, as are non-string values.
+
+    The top level template variables referenced are recorded in variables,
+    so it is possible to tell which attributes vary from file to file
+    """
+    __slots__ = ('source', 'value', 'template', 'convert_to_number', 'variables')
+
+    def __init__(self, source):
+        self.source = source
+        self.template = None
+        self.convert_to_number = False
+        self.variables = frozenset()
+
+        value = source
+        if isinstance(value, (list, tuple)):
+            value = array_to_csv(value)
+
+        # Only valid to use jinja templates on strings
+        if isinstance(value, str):
+            value, self.convert_to_number = detect_number_filter(value)
+            if is_template(value):
+                self._compile(value)
+            else:
+                value = normalise_newlines(value)
+
+        self.value = value
+
+    def _compile(self, value):
+        from jinja2 import meta
+
+        environment = template_environment()
+        self.template = environment.from_string(value)
+        self.variables = frozenset(meta.find_undeclared_variables(environment.parse(value)))
+
+    @classmethod
+    def constant(cls, source, value):
+        """
+        Return a CompiledAttribute with an already rendered value
+        """
+        compiled = cls.__new__(cls)
+        compiled.source = source
+        compiled.value = value
+        compiled.template = None
+        compiled.convert_to_number = False
+        compiled.variables = frozenset()
+        return compiled
+
+    # Templates can't be pickled, so recompile from the template string
+    # when sent to worker processes
+    def __getstate__(self):
+        return (self.source, self.value, self.template is not None, self.convert_to_number)
+
+    def __setstate__(self, state):
+        self.source, self.value, is_templated, self.convert_to_number = state
+        self.template = None
+        self.variables = frozenset()
+        if is_templated:
+            self._compile(self.value)
+
+    @property
+    def is_constant(self):
+        return self.template is None
+
+    def render(self, template_vars):
+        """
+        Return the attribute value, expanding jinja template variables
+        """
+        if self.template is None:
+            return self.value
+
+        value = self.template.render(template_vars)
+
+        if self.convert_to_number:
+            # Try to convert to an integer first then a float
+            try:
+                value = int(value)
+            except ValueError:
+                value = float(value)
+
+        return value
+
+class AttributePlan:
+    """
+    Metadata, as returned by combine_meta, compiled once into the renames and
+    attributes to apply to every file. Attribute values are CompiledAttribute
+    objects, so applying the plan to a file only renders the templated values
+    """
+
+    def __init__(self, metadict):
+        rename = metadict.get("rename") or {}
+        self.rename = {
+            "variables": dict(rename.get("variables") or {}),
+            "dimensions": dict(rename.get("dimensions") or {}),
+        }
+
+        self.variables = {
+            var: compile_attributes(attr_dict)
+            for var, attr_dict in (metadict.get("variables") or {}).items()
+        }
+
+        self.has_global = "global" in metadict
+        self.global_attrs = compile_attributes(metadict.get("global") or {})
+
+        # The per-file template variables (see PER_FILE_VARIABLES) referenced
+        # by any attribute. Found once here, rather than for every file, and
+        # unchanged by resolve, which only renders attributes that don't
+        # reference them
+        self.file_variables = frozenset().union(
+            *[value.variables & PER_FILE_VARIABLES for _, _, value in self.attributes()]
+        )
+
+    def attributes(self):
+        """
+        Iterate over all (var, attr, CompiledAttribute), var is None for
+        global attributes
+        """
+        for var, attr_dict in self.variables.items():
+            for attr, value in attr_dict.items():
+                yield var, attr, value
+        for attr, value in self.global_attrs.items():
+            yield None, attr, value
+
+    def resolve(self, template_vars):
+        """
+        Return a copy of the plan with every attribute that doesn't reference a
+        per-file template variable rendered once with template_vars and stored
+        as a constant. Attributes that reference undefined template variables
+        are dropped with a warning
+        """
+        def resolve_attributes(attr_dict, var=None):
+            constant = {
+                attr: value for attr, value in attr_dict.items()
+                if not value.is_constant and not value.variables & PER_FILE_VARIABLES
+            }
+            rendered = render_attributes(constant, template_vars, var=var)
+            return {
+                attr: CompiledAttribute.constant(value.source, rendered[attr]) if attr in constant else value
+                for attr, value in attr_dict.items()
+                if attr not in constant or attr in rendered
+            }
+
+        resolved = copy.copy(self)
+        resolved.variables = {
+            var: resolve_attributes(attr_dict, var=var)
+            for var, attr_dict in self.variables.items()
+        }
+        resolved.global_attrs = resolve_attributes(self.global_attrs)
+
+        return resolved
+
+    def render(self, template_vars, variables=None, skipped=None):
+        """
+        Render all attributes with template_vars and return a dict with
+        'variables' and 'global' keys, in the same layout as the metadata.
+        Attributes that reference undefined template variables are skipped
+        with a warning, or appended to skipped, see render_attributes. If
+        variables is given only attributes for variables in it are rendered
+        """
+        return {
+            "variables": {
+                var: render_attributes(attr_dict, template_vars, var=var, skipped=skipped)
+                for var, attr_dict in self.variables.items()
+                if variables is None or var in variables
+            },
+            "global": render_attributes(self.global_attrs, template_vars, skipped=skipped),
+        }
+
+def compile_attributes(attr_dict):
+    """
+    Compile a dict of attribute values to CompiledAttribute objects
+    """
+    return {attr: CompiledAttribute(value) for attr, value in attr_dict.items()}
+
+def render_attributes(attr_dict, template_vars, var=None, skipped=None):
+    """
+    Render a dict of CompiledAttribute objects, skipping, with a warning, any
+    that reference undefined template variables. If skipped is a list the
+    (var, message) of each is appended to it instead of warning, as warnings
+    can't be caught per file in a thread
+    """
+    rendered = {}
+    for attr, value in attr_dict.items():
+        try:
+            rendered[attr] = value.render(template_vars)
+        except jinja2.UndefinedError as e:
+            attr_name = f"{var}:{attr}" if var else attr
+            message = f"Skip setting attribute '{attr_name}': {e}"
+            if skipped is None:
+                warn(message)
+            else:
+                skipped.append((var, message))
+    return rendered
+
 def serialise_dict_values(dictionary):
     """Serialise any list or arrays values in a dictionary"""
     return {k: array_to_csv(v) if isinstance(v, (tuple, list)) else v for k, v in dictionary.items()}
@@ -275,35 +859,640 @@ def load_data_files(datafiles):
 
     return namespace_dict
 
-def find_and_add_meta(ncfiles, metadata, kwdata, fnregexs, sort_attrs=False, history=None, verbose=False):
+class ProcessingErrors(Exception):
+    """
+    Files failed when find_and_add_meta was asked to keep going. failures is
+    a list of (file, exception) and counts the counts of all files
+    """
+
+    def __init__(self, failures, counts):
+        self.failures = failures
+        self.counts = counts
+        lines = [f"{len(failures)} file(s) failed:"]
+        lines.extend(f"  {fname}: {type(error).__name__}: {error}" for fname, error in failures)
+        super().__init__("\n".join(lines))
+
+def find_and_add_meta(ncfiles, metadata, kwdata, fnregexs, sort_attrs=False, history=None, verbose=False, jobs=1, skip_unchanged=False, now=None, engine="netcdf4", header_pad=0, journal=None, resume=False, keep_going=False, prefetch=0, scheduler=None, adaptive=False, max_rate=None):
     """
     Add meta data from 1 or more yaml formatted files to one or more
     netCDF files
+
+    ncfiles can be any iterable, such as a generator reading file names from
+    a pipe. Files are started as they are produced, and are never all held
+    in memory
+
+    If jobs is greater than one the files are spread over a pool of that many
+    worker processes. A value less than one uses all available CPUs. Output
+    and errors are still reported per file, in the order of ncfiles
+
+    If skip_unchanged is True files are only opened for writing if the meta
+    data would change them. A datetime can be given as now to fix the value
+    of __datetime__.now, so reruns can leave files unchanged
+
+    engine selects how files are written and header_pad how much space to
+    reserve after the header of classic format files, see add_meta
+
+    If journal is the name of a file, every file is recorded in it as it is
+    finished, and with resume files already completed with the same meta
+    data are skipped, see Journal. By default processing stops at the first
+    file that fails. With keep_going the remaining files are processed and
+    ProcessingErrors is raised at the end if any failed
+
+    If prefetch is greater than zero, and files are processed in this
+    process, up to prefetch files ahead of the one being written are stat'ed
+    and have their attributes rendered in a pool of threads, see
+    prefetch_files
+
+    scheduler is a Scheduler, or the name of one, deciding the order files
+    are processed in and, with jobs, how many from the same directory are
+    processed at once, see schedule.py
+
+    With adaptive, and jobs, the number of files processed at once is
+    adjusted to the throughput and the latency of opening and closing files.
+    max_rate limits the number of files started per second. See adaptive.py
+
+    Returns a Counter of the number of files "updated", "unchanged",
+    "failed" and, when resuming, "skipped"
     """
 
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+
     template_vars = copy.deepcopy(kwdata)
 
+    # Compile the metadata and filename regexs once, rather than for every
+    # file, and render attributes that are the same for every file. Invalid
+    # regexs raise FilenameRegexError before any file is opened
+    with timed("compile"):
+        fnregexs = FilenameRegexs(fnregexs)
+        if not isinstance(metadata, AttributePlan):
+            metadata = AttributePlan(metadata)
+        metadata = metadata.resolve(template_vars)
+
+    options = dict(
+        sort_attrs=sort_attrs,
+        history=history,
+        verbose=verbose,
+        skip_unchanged=skip_unchanged,
+        now=now,
+        engine=engine,
+        header_pad=header_pad,
+    )
+
+    counts = Counter(updated=0, unchanged=0, failed=0)
+    failures = []
+
+    if isinstance(scheduler, str):
+        scheduler = make_scheduler(scheduler, fnregexs=fnregexs)
+
+    controller = None
+    if (adaptive and jobs > 1) or max_rate:
+        controller = ConcurrencyController(jobs, adaptive=adaptive and jobs > 1, max_rate=max_rate)
+
+    if journal is not None:
+        journal = Journal(journal)
+        digest = plan_digest(metadata, template_vars, fnregexs, sort_attrs=sort_attrs, history=history)
+        if resume:
+            journal.load()
+            ncfiles = journal.pending(ncfiles, digest, counts)
+        journal.open()
+
+    if scheduler is not None:
+        with timed("schedule"):
+            ncfiles = scheduler.order(ncfiles)
+
+    def finished(fname, status, error=None):
+        """
+        Record a file once it is done. Raises its error unless keeping going
+        """
+        if journal is not None:
+            journal.record(fname, "failed" if error is not None else status, digest, error)
+        if error is None:
+            counts[status] += 1
+            return
+        counts["failed"] += 1
+        if not keep_going:
+            report_counts(counts, verbose)
+            raise error
+        if verbose: print(f"  Failed: {type(error).__name__}: {error}")
+        failures.append((fname, error))
+
     if verbose: print("Processing netCDF files:")
-    for fname in ncfiles:
-        if verbose: print(f"  {fname}")
 
+    try:
+        if jobs == 1 and prefetch > 0:
+            with closing(prefetch_files(ncfiles, metadata, template_vars, fnregexs, prefetch, verbose=verbose, now=now)) as prefetched:
+                for fname, prepared in prefetched:
+                    if controller is not None:
+                        controller.wait()
+                    try:
+                        status = process_prepared(prepared, metadata, **options)
+                    except Exception as e:
+                        finished(fname, None, e)
+                    else:
+                        finished(fname, status)
+        elif jobs == 1:
+            for fname in ncfiles:
+                if controller is not None:
+                    controller.wait()
+                try:
+                    status = process_file(fname, metadata, template_vars, fnregexs, **options)
+                except Exception as e:
+                    finished(fname, None, e)
+                else:
+                    finished(fname, status)
+        else:
+            process_parallel(ncfiles, metadata, template_vars, fnregexs, options, jobs, finished, scheduler, controller)
+    finally:
+        if journal is not None:
+            journal.close()
+
+    if verbose and controller is not None:
+        print(controller.report())
+    report_counts(counts, verbose)
+    if failures:
+        raise ProcessingErrors(failures, counts)
+    return counts
+
+def process_parallel(ncfiles, metadata, template_vars, fnregexs, options, jobs, finished, scheduler=None, controller=None, worker=None):
+    """
+    Process files in a pool of jobs worker processes, calling
+    finished(fname, status, error) for each in the order of ncfiles, or
+    the order they were started if the scheduler limits how many files of a
+    group are processed at once. A ConcurrencyController decides how many
+    are processed at once, from the timings of each file. worker processes
+    a list of files, by default with process_file
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    limited = (scheduler is not None and scheduler.max_per_group) or controller is not None
+    if limited and scheduler is None:
+        scheduler = Scheduler()
+    timings = current_timings()
+    worker = worker or _worker_process_files
+
+    if limited:
+        # Files are started one at a time, so each can wait for room in its
+        # group
+        max_workers, chunksize = jobs, 1
+    elif isinstance(ncfiles, Sized):
+        max_workers = min(jobs, max(len(ncfiles), 1))
+        chunksize = max(1, len(ncfiles) // (jobs * 4))
+    else:
+        # A stream of files, of unknown length, each is started as soon as
+        # it arrives
+        max_workers, chunksize = jobs, 1
+
+    # Send the merged metadata and template data to each worker once, when
+    # it starts, rather than pickling them along with every file name
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(metadata, template_vars, fnregexs, options, timings is not None or controller is not None),
+    ) as executor:
+        # Results are returned in the order files were started regardless of
+        # which worker finishes first
+        if limited:
+            results = map_scheduled(executor, worker, ncfiles, scheduler, window=jobs * 2, controller=controller)
+        else:
+            results = map_bounded(executor, worker, ncfiles, chunksize=chunksize, window=jobs * 4)
+        for fname, (output, caught, status, error, file_timings) in results:
+            if file_timings is not None and timings is not None:
+                timings.files[os.fspath(fname)] = file_timings
+            print(output, end='')
+            if controller is not None and file_timings is not None:
+                decision = controller.record(file_latency(file_timings))
+                if decision is not None:
+                    message = format_decision(decision)
+                    if options["verbose"]: print(f"  {message}")
+                    if timings is not None:
+                        timings.decisions.append(dict(decision, message=message))
+            for message, category in caught:
+                warn(message, category)
+            try:
+                finished(fname, status, error)
+            except Exception:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+def map_bounded(executor, fn, iterable, chunksize=1, window=1):
+    """
+    Call fn in executor with chunks of chunksize items from iterable, and
+    yield each item and its result in order. fn takes a list of items and
+    returns a list of results. Unlike executor.map no more than window
+    chunks are submitted at once, so an iterable of any length can be
+    streamed in bounded memory
+    """
+    items = iter(iterable)
+    pending = deque()
+
+    def submit():
+        chunk = list(islice(items, chunksize))
+        if chunk:
+            pending.append((chunk, executor.submit(fn, chunk)))
+
+    for _ in range(window):
+        submit()
+
+    while pending:
+        chunk, future = pending.popleft()
+        results = future.result()
+        submit()
+        yield from zip(chunk, results)
+
+def report_counts(counts, verbose=False):
+    if verbose: print(format_counts(counts))
+
+def format_counts(counts):
+    report = f"Files updated: {counts['updated']}, unchanged: {counts['unchanged']}, failed: {counts['failed']}"
+    if counts.get("skipped"):
+        report += f", skipped: {counts['skipped']}"
+    return report
+
+def process_file(fname, metadata, template_vars, fnregexs, sort_attrs=False, history=None, verbose=False, skip_unchanged=False, now=None, engine="netcdf4", header_pad=0):
+    """
+    Populate the per-file template variables for fname and add meta data.
+
+    Returns "updated" or "unchanged"
+    """
+    if not isinstance(metadata, AttributePlan):
+        metadata = AttributePlan(metadata)
+
+    if verbose: print(f"  {fname}")
+
+    with timed_file(fname):
+        set_file_template_vars(fname, metadata, template_vars, fnregexs, verbose=verbose, now=now)
+
+        return add_meta(
+            fname,
+            metadata,
+            template_vars,
+            sort_attrs=sort_attrs,
+            history=history,
+            verbose=verbose,
+            skip_unchanged=skip_unchanged,
+            engine=engine,
+            header_pad=header_pad,
+        )
+
+def set_file_template_vars(fname, metadata, template_vars, fnregexs, verbose=False, now=None):
+    """
+    Set the per-file template variables for fname in template_vars. The
+    filename regexs and file stat are only evaluated if an attribute in the
+    AttributePlan references them, or with verbose, when the variables
+    matched are always reported. If now is given it is used for
+    __datetime__.now
+    """
+    file_variables = metadata.file_variables
+
+    if '__file__' in file_variables:
         # Match supplied regex against filename and add metadata
-        template_vars['__file__'] = match_filename_regex(fname, fnregexs, verbose)
+        with timed("filename regex"):
+            template_vars['__file__'] = match_filename_regex(fname, fnregexs, verbose)
 
         # Add file metadata
-        template_vars['__file__'].update(get_file_metadata(fname))
+        with timed("file stat"):
+            template_vars['__file__'].update(get_file_metadata(fname))
+    elif verbose:
+        match_filename_regex(fname, fnregexs, verbose)
 
+    if '__datetime__' in file_variables:
         # Add special __datetime__.now template variable
-        template_vars['__datetime__'] = {'now':  isoformat(datetime.now(timezone.utc)) }
+        template_vars['__datetime__'] = {'now':  isoformat(now or datetime.now(timezone.utc)) }
 
-        add_meta(
-            fname,
+class PreparedFile:
+    """
+    The template variables and rendered attributes of a file, prepared ahead
+    of writing it by prefetch_files. Attributes are rendered for every
+    variable in the plan, and those the file doesn't have are dropped by
+    select once it is opened. error is any exception raised preparing it.
+    state is the modification time and size of a file read from a plan, if
+    it mustn't have changed since it was planned
+    """
+
+    def __init__(self, fname, template_vars=None, attributes=None, skipped=(), filename_vars=None, error=None, state=None):
+        self.fname = fname
+        self.template_vars = template_vars
+        self.attributes = attributes
+        self.skipped = skipped
+        self.filename_vars = filename_vars
+        self.error = error
+        self.state = state
+
+    def __fspath__(self):
+        return os.fspath(self.fname)
+
+    def select(self, variables):
+        """
+        Return the attributes for the variables in the file, warning of any
+        attributes for them skipped when rendering
+        """
+        for var, message in self.skipped:
+            if var is None or var in variables:
+                warn(message)
+        return {
+            "variables": {
+                var: attr_dict for var, attr_dict in self.attributes["variables"].items() if var in variables
+            },
+            "global": self.attributes["global"],
+        }
+
+def prepare_file(fname, metadata, template_vars, fnregexs, verbose=False, now=None, state=False):
+    """
+    Stat, match the filename regexs of and render the attributes for fname,
+    without opening it. Runs in a prefetch thread, so nothing is printed or
+    warned, and exceptions are returned in the PreparedFile. With state,
+    the modification time and size of the file are recorded for a plan
+    """
+    try:
+        with timed_file(fname, total=False):
+            file_stat = file_state(fname) if state else None
+            template_vars = dict(template_vars)
+            set_file_template_vars(fname, metadata, template_vars, fnregexs, now=now)
+            filename_vars = fnregexs.match(fname) if verbose else None
+            skipped = []
+            with timed("render"):
+                attributes = metadata.render(template_vars, skipped=skipped)
+    except Exception as e:
+        return PreparedFile(fname, error=e)
+    return PreparedFile(fname, template_vars, attributes, skipped, filename_vars, state=file_stat)
+
+def _prepare_files(fnames, *args, **kwargs):
+    return [prepare_file(fname, *args, **kwargs) for fname in fnames]
+
+def prefetch_files(ncfiles, metadata, template_vars, fnregexs, depth, verbose=False, now=None):
+    """
+    Prepare files in a pool of depth threads, up to depth files ahead of the
+    one being written, yielding each file and its PreparedFile in order.
+    Stat'ing files, on a slow filesystem, and rendering overlap with writing
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+
+    prepare = partial(_prepare_files, metadata=metadata, template_vars=template_vars,
+                      fnregexs=fnregexs, verbose=verbose, now=now)
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        for fname, prepared in map_bounded(executor, prepare, ncfiles, window=depth):
+            yield fname, prepared
+
+def process_prepared(prepared, metadata, sort_attrs=False, history=None, verbose=False, skip_unchanged=False, now=None, engine="netcdf4", header_pad=0):
+    """
+    Add meta data to a file prepared by prefetch_files. Returns "updated" or
+    "unchanged"
+    """
+    if verbose: print(f"  {prepared.fname}")
+
+    with timed_file(prepared.fname):
+        if prepared.error is not None:
+            raise prepared.error
+        if prepared.filename_vars is not None:
+            report_filename_vars(prepared.filename_vars)
+
+        return add_meta(
+            prepared.fname,
             metadata,
-            template_vars,
+            prepared.template_vars,
             sort_attrs=sort_attrs,
             history=history,
-            verbose=verbose
+            verbose=verbose,
+            skip_unchanged=skip_unchanged,
+            engine=engine,
+            header_pad=header_pad,
+            prepared=prepared,
+        )
+
+def plan_files(ncfiles, metadata, template_vars, fnregexs, jobs=1, verbose=False, now=None, state=False):
+    """
+    Prepare files, as prefetch_files does, in a pool of jobs worker
+    processes if jobs is greater than one, yielding each file and its
+    PreparedFile in order. metadata is a resolved AttributePlan. With
+    state, the state of each file is recorded, see prepare_file
+    """
+    options = dict(verbose=verbose, now=now, state=state)
+    if jobs == 1:
+        for fname in ncfiles:
+            yield fname, prepare_file(fname, metadata, template_vars, fnregexs, **options)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # As for process_parallel, the metadata and template data are sent to
+    # each worker once, when it starts
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(metadata, template_vars, fnregexs, options),
+    ) as executor:
+        yield from map_bounded(executor, _worker_prepare_files, ncfiles, chunksize=16, window=jobs * 4)
+
+def make_plan(planfile, ncfiles, metadata, kwdata, fnregexs, sort_attrs=False, history=None, verbose=False, jobs=1, now=None, keep_going=False, addmeta_version=None):
+    """
+    Write a plan of the meta data to add to each of ncfiles to planfile,
+    without opening any of them, for apply_plan. Attributes skipped for
+    undefined template variables are warned about for every file, before
+    any file is modified. Files that can't be planned, such as files that
+    don't exist, are reported together at the end with ProcessingErrors,
+    and the plan is only written if there are none, or with keep_going.
+
+    Returns a Counter of the number of files "planned" and "failed"
+    """
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    template_vars = copy.deepcopy(kwdata)
+
+    with timed("compile"):
+        fnregexs = FilenameRegexs(fnregexs)
+        if not isinstance(metadata, AttributePlan):
+            metadata = AttributePlan(metadata)
+        metadata = metadata.resolve(template_vars)
+
+    # The file's stat is rendered into the plan, so it mustn't change
+    state = '__file__' in metadata.file_variables
+    counts = Counter(planned=0, failed=0)
+    failures = []
+
+    if verbose: print("Planning netCDF files:")
+
+    header = plan_header(metadata, sort_attrs=sort_attrs, history=history, addmeta_version=addmeta_version)
+    with PlanWriter(planfile, header) as writer:
+        for fname, prepared in plan_files(ncfiles, metadata, template_vars, fnregexs, jobs=jobs, verbose=verbose, now=now, state=state):
+            if verbose: print(f"  {fname}")
+            if prepared.filename_vars is not None:
+                report_filename_vars(prepared.filename_vars)
+            try:
+                if prepared.error is not None:
+                    raise prepared.error
+                entry = plan_entry(fname, prepared.attributes, prepared.skipped, prepared.state)
+            except Exception as e:
+                if verbose: print(f"  Failed: {type(e).__name__}: {e}")
+                counts["failed"] += 1
+                failures.append((fname, e))
+                continue
+            for var, message in prepared.skipped:
+                warn(f"{fname}: {message}")
+            writer.write(entry)
+            counts["planned"] += 1
+
+        if verbose: print(f"Files planned: {counts['planned']}, failed: {counts['failed']}")
+        if failures and not keep_going:
+            raise ProcessingErrors(failures, counts)
+
+    if failures:
+        raise ProcessingErrors(failures, counts)
+    return counts
+
+def read_plan_file(planfile):
+    """
+    Read a plan written by make_plan. Returns its header, an AttributePlan
+    with its renames and the names of its variables, to apply the
+    attributes with, and a generator of a PreparedFile for each file
+    """
+    header, entries = read_plan(planfile)
+
+    metadict = {
+        "rename": header["rename"],
+        "variables": {var: {} for var in header["variables"]},
+    }
+    if header["has_global"]:
+        metadict["global"] = {}
+
+    prepared = (
+        PreparedFile(
+            entry["file"],
+            attributes={"variables": entry["variables"], "global": entry["global"]},
+            skipped=[tuple(skip) for skip in entry.get("skipped", [])],
+            state=entry.get("state"),
         )
+        for entry in entries
+    )
+    return header, AttributePlan(metadict), prepared
+
+def apply_prepared(prepared, metadata, **options):
+    """
+    Add meta data to a file read from a plan, warning if it has changed
+    since it was planned. Returns "updated" or "unchanged"
+    """
+    if prepared.state is not None and file_state(prepared.fname) != prepared.state:
+        warn(f"{prepared.fname} has changed since it was planned, attributes from its size or modification time may be out of date")
+    return process_prepared(prepared, metadata, **options)
+
+def apply_plan(prepared_files, metadata, sort_attrs=False, history=None, verbose=False, jobs=1, skip_unchanged=False, engine="netcdf4", header_pad=0, keep_going=False):
+    """
+    Add meta data to PreparedFiles read from a plan with read_plan_file.
+    Nothing is rendered, only the netCDF files are read and written, in a
+    pool of jobs worker processes if jobs is greater than one. The other
+    options are as for find_and_add_meta, and sort_attrs and history should
+    be those of the plan.
+
+    Returns a Counter of the number of files "updated", "unchanged" and
+    "failed"
+    """
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    options = dict(
+        sort_attrs=sort_attrs,
+        history=history,
+        verbose=verbose,
+        skip_unchanged=skip_unchanged,
+        engine=engine,
+        header_pad=header_pad,
+    )
+
+    counts = Counter(updated=0, unchanged=0, failed=0)
+    failures = []
+
+    def finished(prepared, status, error=None):
+        """
+        Count a file once it is done. Raises its error unless keeping going
+        """
+        if error is None:
+            counts[status] += 1
+            return
+        counts["failed"] += 1
+        if not keep_going:
+            report_counts(counts, verbose)
+            raise error
+        if verbose: print(f"  Failed: {type(error).__name__}: {error}")
+        failures.append((os.fspath(prepared), error))
+
+    if verbose: print("Applying plan to netCDF files:")
+
+    if jobs == 1:
+        for prepared in prepared_files:
+            try:
+                status = apply_prepared(prepared, metadata, **options)
+            except Exception as e:
+                finished(prepared, None, e)
+            else:
+                finished(prepared, status)
+    else:
+        process_parallel(prepared_files, metadata, None, None, options, jobs, finished, worker=_worker_apply_files)
+
+    report_counts(counts, verbose)
+    if failures:
+        raise ProcessingErrors(failures, counts)
+    return counts
+
+# Arguments shared by every file processed in a worker process, set once by
+# _init_worker when the process starts
+_worker_args = None
+
+def _init_worker(metadata, template_vars, fnregexs, options, timing=False):
+    global _worker_args
+    _worker_args = (metadata, template_vars, fnregexs, options)
+    if timing:
+        start_timing()
+
+def _worker_process_files(fnames):
+    """
+    Process files in a worker process, see capture_process_file
+    """
+    return [capture_process_file(fname, *_worker_args) for fname in fnames]
+
+def _worker_prepare_files(fnames):
+    """
+    Prepare files for a plan in a worker process. A plan only needs their
+    attributes, so their template variables aren't sent back
+    """
+    metadata, template_vars, fnregexs, options = _worker_args
+    prepared_files = [prepare_file(fname, metadata, template_vars, fnregexs, **options) for fname in fnames]
+    for prepared in prepared_files:
+        prepared.template_vars = None
+    return prepared_files
+
+def _worker_apply_files(prepared_files):
+    """
+    Apply PreparedFiles read from a plan in a worker process
+    """
+    metadata, _, _, options = _worker_args
+    return [capture_output(prepared, apply_prepared, prepared, metadata, **options) for prepared in prepared_files]
+
+def capture_process_file(fname, metadata, template_vars, fnregexs, options):
+    """
+    Process a single file, capturing output and warnings, see capture_output
+    """
+    return capture_output(fname, process_file, fname, metadata, template_vars, fnregexs, **options)
+
+def capture_output(fname, fn, *args, **kwargs):
+    """
+    Call fn to process fname, capturing output and warnings. They are
+    returned, along with the status, any exception raised and the file's
+    timings if they are being recorded, so they can be reported by another
+    process
+    """
+    status, error = None, None
+    with io.StringIO() as output, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        with redirect_stdout(output):
+            try:
+                status = fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+        timings = current_timings()
+        file_timings = timings.files.pop(os.fspath(fname), None) if timings is not None else None
+        return output.getvalue(), [(str(w.message), w.category) for w in caught], status, error, file_timings
 
 def skip_comments(file):
     """Skip lines that begin with a comment character (#) or are empty
@@ -336,7 +1525,7 @@ def delete_group_attributes(ncgroup):
     for attr in ncgroup.ncattrs():
         # Not allow to add _FillValue as attr after variable creation
         # Thus can't add it back on while sorting
-        if not (isinstance(ncgroup, nc.Variable) and attr == "_FillValue"):
+        if not (isinstance(ncgroup, (nc.Variable, ClassicVariable, H5Variable)) and attr == "_FillValue"):
             deleted[attr] = ncgroup.getncattr(attr)
             ncgroup.delncattr(attr)
     
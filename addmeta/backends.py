@@ -0,0 +1,419 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Storage backends used to open netCDF files for reading and editing
+attributes.
+
+A backend is a function, or class, called with a filename and a mode ("r"
+or "r+") that returns an object with the parts of the netCDF4.Dataset API
+used by addmeta: ncattrs, getncattr, setncattr and delncattr on the dataset
+and on the members of its variables mapping, renameVariable,
+renameDimension, a dimensions mapping, data_model, define_mode(),
+header_writes and close(). Backends are registered by name in BACKENDS.
+
+netcdf4 (the default) uses netCDF4-python, and handles any netCDF file.
+
+h5py edits the attributes of netCDF4 (HDF5) files with h5py, only opening
+the variables that are named, rather than building objects for every
+variable, dimension and group in the file as netCDF4-python does. It can't
+rename, and doesn't support NETCDF4_CLASSIC files.
+
+Backends other than netcdf4 raise BackendError, before modifying the file,
+if they can't handle it, and the caller should use netcdf4 instead.
+"""
+
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+BACKENDS = {}
+
+# Attributes used by libnetcdf to implement the netCDF-4 data model, which
+# are not visible as netCDF attributes
+HIDDEN_ATTRIBUTES = frozenset([
+    "CLASS", "DIMENSION_LIST", "NAME", "REFERENCE_LIST",
+    "_IsNetcdf4", "_NCProperties", "_Netcdf4Coordinates", "_Netcdf4Dimid",
+    "_SuperblockVersion", "_nc3_strict",
+])
+
+# Prefix of the HDF5 name of a variable with the same name as a dimension
+# it doesn't use as its first dimension
+NON_COORD_PREFIX = "_nc4_non_coord_"
+
+# Start of the NAME attribute of a dimension without a coordinate variable
+DIMENSION_ONLY = b"This is a netCDF dimension but not a netCDF variable"
+
+# The attribute types netCDF4-python can write
+SUPPORTED_TYPES = ('i1', 'u1', 'i2', 'u2', 'i4', 'u4', 'i8', 'u8', 'f4', 'f8')
+
+FILL_VALUE_ERROR = "_FillValue attribute must be set when variable is created (using fill_value keyword to createVariable)"
+
+
+class BackendError(Exception):
+    """
+    The backend can't open or edit the file, use netcdf4 instead
+    """
+
+
+def register_backend(name, opener):
+    """
+    Register opener, called with a filename and mode, as a backend
+    """
+    BACKENDS[name] = opener
+
+def open_dataset(filename, mode="r", backend="netcdf4"):
+    """
+    Open a netCDF file with the named backend
+    """
+    return BACKENDS[backend](filename, mode)
+
+def open_netcdf4(filename, mode="r"):
+    """
+    Open a file with netCDF4-python, which is imported on first use
+    """
+    from .batched import BatchedDataset
+    try:
+        return BatchedDataset(filename, mode)
+    except OSError as e:
+        # The traceback holds the Dataset that failed to open, which would
+        # otherwise be deallocated as the interpreter exits, when netCDF4
+        # can no longer clean it up and reports an error
+        raise e.with_traceback(None)
+
+
+class H5Group:
+    """
+    netCDF attributes of an HDF5 group or dataset, read and written the
+    same way as netCDF4-python. Like libnetcdf, attributes that are set are
+    written when the file is closed, in the order of the netCDF attributes,
+    and only if their value has changed, so a rewritten attribute moves
+    after the unchanged ones
+    """
+
+    def __init__(self, h5obj):
+        self._h5obj = h5obj
+        self._names = None
+        self._pending = {}
+
+    def ncattrs(self):
+        if self._names is None:
+            self._names = [name for name in self._h5obj.attrs if name not in HIDDEN_ATTRIBUTES]
+        return list(self._names)
+
+    def getncattr(self, name):
+        if name in self._pending:
+            return decode_value(self._pending[name])
+        if name not in self.ncattrs():
+            raise AttributeError(f"NetCDF: Attribute not found: {name}")
+        return decode_attribute(self._h5obj.attrs.get_id(name))
+
+    def setncattr(self, name, value):
+        if name in HIDDEN_ATTRIBUTES:
+            raise AttributeError(f"NetCDF: Attempt to define reserved attribute: {name}")
+        self._pending[name] = encode_value(name, value)
+        if name not in self.ncattrs():
+            self._names.append(name)
+
+    def delncattr(self, name):
+        if name not in self.ncattrs():
+            raise AttributeError(f"NetCDF: Attribute not found: {name}")
+        self._names.remove(name)
+        self._pending.pop(name, None)
+        if name in self._h5obj.attrs:
+            del self._h5obj.attrs[name]
+
+    def flush(self):
+        """
+        Write the attributes that have been set to a new value
+        """
+        for name in self.ncattrs():
+            if name in self._pending:
+                encoded = self._pending.pop(name)
+                if not stored_value(self._h5obj, name, encoded):
+                    write_value(self._h5obj, name, encoded)
+
+
+class H5Variable(H5Group):
+
+    def __init__(self, name, h5obj):
+        super().__init__(h5obj)
+        self.name = name
+
+    def setncattr(self, name, value):
+        if name == "_FillValue":
+            raise AttributeError(FILL_VALUE_ERROR)
+        super().setncattr(name, value)
+
+
+class H5Members(Mapping):
+    """
+    The variables or dimensions of an HDF5 file, opened by name only when
+    they are looked up. Iterating has to open every object in the file
+    """
+
+    def __init__(self, h5file, variables=True):
+        self._h5file = h5file
+        self._variables = variables
+        self._cache = {}
+
+    def _lookup(self, name):
+        if name not in self._cache:
+            self._cache[name] = self._find(name)
+        return self._cache[name]
+
+    def _find(self, name):
+        import h5py
+
+        if self._variables and NON_COORD_PREFIX + name in self._h5file:
+            return H5Variable(name, self._h5file[NON_COORD_PREFIX + name])
+
+        h5obj = self._h5file.get(name)
+        if not isinstance(h5obj, h5py.Dataset):
+            return None
+
+        dimension_only = h5obj.attrs.get("NAME", b"").startswith(DIMENSION_ONLY)
+        if self._variables and not dimension_only:
+            return H5Variable(name, h5obj)
+        if not self._variables and "CLASS" in h5obj.attrs and h5obj.attrs["CLASS"] == b"DIMENSION_SCALE":
+            return h5obj
+
+        return None
+
+    def opened(self):
+        """
+        Return the members that have been looked up
+        """
+        return [member for member in self._cache.values() if member is not None]
+
+    def __getitem__(self, name):
+        member = self._lookup(name)
+        if member is None:
+            raise KeyError(name)
+        return member
+
+    def __contains__(self, name):
+        return self._lookup(name) is not None
+
+    def __iter__(self):
+        for name in link_names(self._h5file):
+            if self._variables and name.startswith(NON_COORD_PREFIX):
+                name = name[len(NON_COORD_PREFIX):]
+            if name in self:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class H5Dataset(H5Group):
+    """
+    A netCDF4 format file opened with h5py
+    """
+
+    data_model = 'NETCDF4'
+    header_writes = 0
+
+    def __init__(self, filename, mode="r"):
+        try:
+            import h5py
+        except ImportError:
+            raise BackendError("h5py is not installed")
+
+        try:
+            h5file = h5py.File(filename, mode)
+        except OSError:
+            raise BackendError(f"{filename} is not a netCDF4 format file")
+
+        if "_nc3_strict" in h5file.attrs:
+            h5file.close()
+            raise BackendError(f"{filename} is a NETCDF4_CLASSIC file")
+
+        super().__init__(h5file)
+        self.filename = filename
+        self.variables = H5Members(h5file)
+        self.dimensions = H5Members(h5file, variables=False)
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextmanager
+    def define_mode(self):
+        # Attributes are written as they are set
+        yield self
+
+    def renameVariable(self, old_name, new_name):
+        self._rename(self.variables, old_name)
+
+    def renameDimension(self, old_name, new_name):
+        self._rename(self.dimensions, old_name)
+
+    def _rename(self, container, old_name):
+        if old_name not in container:
+            raise KeyError(old_name)
+        raise BackendError("renaming isn't supported by the h5py backend")
+
+    def close(self):
+        if self._h5obj.file.mode == 'r+':
+            for group in [self, *self.variables.opened()]:
+                group.flush()
+        self._h5obj.close()
+
+
+def link_names(h5group):
+    """
+    Return the names of the members of an HDF5 group in creation order, as
+    used by libnetcdf for variable ids, if it is tracked
+    """
+    import h5py
+
+    names = []
+    if h5group.id.get_create_plist().get_link_creation_order():
+        h5group.id.links.iterate(names.append, idx_type=h5py.h5.INDEX_CRT_ORDER)
+        return [name.decode() for name in names]
+    return list(h5group)
+
+def decode_attribute(attr):
+    """
+    Return the value of an HDF5 attribute as netCDF4-python would
+    """
+    import h5py
+
+    h5type = attr.get_type()
+    if attr.get_space().get_simple_extent_type() == h5py.h5s.NULL:
+        return ""
+
+    value = np.empty(attr.shape, dtype=attr.dtype)
+    attr.read(value)
+
+    if isinstance(h5type, h5py.h5t.TypeStringID):
+        if not h5type.is_variable_str():
+            # NC_CHAR
+            return value.tobytes().decode('utf-8', errors='replace').replace('\x00', '')
+        # NC_STRING
+        strings = [s.decode('utf-8', errors='replace') if isinstance(s, bytes) else s
+                   for s in value.flat]
+        strings = [s.replace('\x00', '') for s in strings]
+        return strings[0] if len(strings) == 1 else strings
+
+    if value.shape == ():
+        return value.item()
+    elif value.size == 1:
+        return value.flat[0]
+    return value
+
+def encode_value(name, value):
+    """
+    Return the kind of attribute ("char", "string" or "number") netCDF4-python
+    would write for value in a netCDF4 file, and the data to write
+    """
+    value_arr = np.array(value)
+    if value_arr.ndim > 1:
+        raise ValueError('multi-dimensional array attributes not supported')
+
+    if value_arr.dtype.char in 'SU':
+        if value_arr.size > 1:
+            strings = [s if isinstance(s, str) else s.decode() for s in value_arr.flat]
+            return "string", [s or '\x00' for s in strings]
+
+        data = value_arr.item()
+        if isinstance(data, str):
+            try:
+                data = data.encode('ascii')
+            except UnicodeError:
+                return "string", [data or '\x00']
+
+        return "char", data or b'\x00'
+
+    if value_arr.dtype.str[1:] not in SUPPORTED_TYPES:
+        raise TypeError(f'illegal data type for attribute {name!r}, must be one of '
+                        f'{SUPPORTED_TYPES}, got {value_arr.dtype.str[1:]}')
+
+    return "number", np.atleast_1d(value_arr)
+
+def decode_value(encoded):
+    """
+    Return an encoded attribute value as it will be read back
+    """
+    kind, data = encoded
+    if kind == "char":
+        return data.decode('utf-8', errors='replace').replace('\x00', '')
+    if kind == "string":
+        strings = [s.replace('\x00', '') for s in data]
+        return strings[0] if len(strings) == 1 else strings
+    return data[0] if data.size == 1 else data
+
+def stored_value(h5obj, name, encoded):
+    """
+    Return True if an encoded attribute value is already stored, with the
+    same type
+    """
+    import h5py
+
+    if name not in h5obj.attrs:
+        return False
+
+    kind, data = encoded
+    attr = h5obj.attrs.get_id(name)
+    h5type = attr.get_type()
+    if attr.get_space().get_simple_extent_type() == h5py.h5s.NULL:
+        return False
+
+    if kind == "number":
+        return (not isinstance(h5type, h5py.h5t.TypeStringID) and attr.dtype == data.dtype
+                and attr.shape == data.shape and np.array_equal(h5obj.attrs[name], data))
+
+    if not isinstance(h5type, h5py.h5t.TypeStringID) or h5type.is_variable_str() != (kind == "string"):
+        return False
+
+    value = np.empty(attr.shape, dtype=attr.dtype)
+    attr.read(value)
+    if kind == "char":
+        return attr.shape == () and value.tobytes() == data
+    return [s.decode() if isinstance(s, bytes) else s for s in value.flat] == data
+
+def write_value(h5obj, name, encoded):
+    """
+    Write an encoded attribute value, replacing any existing attribute
+    """
+    import h5py
+
+    kind, data = encoded
+    if name in h5obj.attrs:
+        del h5obj.attrs[name]
+
+    if kind == "char":
+        # A scalar fixed length string, as written by libnetcdf
+        h5type = h5py.h5t.C_S1.copy()
+        h5type.set_size(len(data))
+        h5type.set_strpad(h5py.h5t.STR_NULLTERM)
+        attr = h5py.h5a.create(h5obj.id, name.encode(), h5type, h5py.h5s.create(h5py.h5s.SCALAR))
+        attr.write(np.array(data, dtype=f'S{len(data)}'), mtype=h5type)
+    elif kind == "string":
+        h5obj.attrs.create(name, data, dtype=h5py.string_dtype('utf-8'))
+    else:
+        h5obj.attrs.create(name, data)
+
+
+register_backend("netcdf4", open_netcdf4)
+register_backend("h5py", H5Dataset)
@@ -0,0 +1,65 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+The netcdf4 storage backend, a netCDF4-python Dataset that batches edits
+into a single define mode session. It is in its own module so netCDF4 is
+only imported when a file is opened with it.
+"""
+
+from contextlib import contextmanager
+
+import netCDF4 as nc
+
+
+class BatchedDataset(nc.Dataset):
+    """
+    netCDF4 Dataset that can hold define mode open over a series of edits.
+    Outside define_mode every attribute or rename call on a file with a
+    classic data model ends define mode, which rewrites the header and can
+    move the data. header_writes counts how many times define mode was ended
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Set directly, as setting attributes on a Dataset creates netCDF attributes
+        self.__dict__['header_writes'] = 0
+        self.__dict__['_in_define_mode'] = False
+
+    def _redef(self):
+        if not self._in_define_mode:
+            super()._redef()
+
+    def _enddef(self):
+        if not self._in_define_mode:
+            super()._enddef()
+            self.__dict__['header_writes'] += 1
+
+    @contextmanager
+    def define_mode(self):
+        """
+        Make all edits inside the context in a single define mode session
+        """
+        if self.data_model == 'NETCDF4':
+            # No define mode, metadata is written when the file is closed
+            yield self
+            return
+
+        self._redef()
+        self.__dict__['_in_define_mode'] = True
+        try:
+            yield self
+        finally:
+            self.__dict__['_in_define_mode'] = False
+            self._enddef()
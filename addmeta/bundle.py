@@ -0,0 +1,116 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Metadata bundles: the merged meta data, template data and filename regexs
+from the metadata, data and cmdlineargs files of a run, written once by
+`addmeta compile` and loaded by `addmeta --bundle`.
+
+A bundle is a short text header followed by JSON, with the types YAML has
+that JSON doesn't tagged as in the YAML cache, so the YAML is never parsed
+again and every job applies exactly the same values, with the same types, as
+were compiled. Reading a bundle never runs any code. The header records the
+bundle format version, the addmeta version that wrote it and a SHA-256
+digest of the JSON, which is checked when it is read. The digest only
+detects corruption: anyone who can write a bundle can change the meta data
+it applies, so bundles should be kept where only those trusted to choose the
+meta data can write them.
+"""
+
+from datetime import datetime, timezone
+import hashlib
+import json
+
+from .fnregex import FilenameRegexError, FilenameRegexs
+from .yamlcache import decode, encode
+
+MAGIC = b"addmeta bundle"
+
+# Changed whenever the contents of a bundle change incompatibly
+BUNDLE_VERSION = 2
+
+
+class BundleError(Exception):
+    """
+    The file isn't a bundle this version of addmeta can read
+    """
+
+
+def check_regexs(fnregexs):
+    """
+    Compile each filename regex, raising BundleError for any that are
+    invalid
+    """
+    try:
+        FilenameRegexs(fnregexs)
+    except FilenameRegexError as e:
+        raise BundleError(str(e))
+
+def write_bundle(fname, metadata, kwdata, fnregexs, sources=(), addmeta_version=None):
+    """
+    Write a bundle of merged metadata (from combine_meta), template data
+    (from load_data_files) and filename regexs. sources are the files they
+    were read from, recorded for reference. Returns the digest of the bundle
+    """
+    check_regexs(fnregexs)
+    contents = {
+        "metadata": metadata,
+        "kwdata": kwdata,
+        "fnregex": list(fnregexs),
+        "sources": [str(source) for source in sources],
+        "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "addmeta": addmeta_version,
+    }
+    try:
+        data = json.dumps(encode(contents)).encode()
+    except TypeError as e:
+        raise BundleError(f"Meta data can't be stored in a bundle: {e}")
+    digest = hashlib.sha256(data).hexdigest()
+    header = b" ".join([MAGIC, str(BUNDLE_VERSION).encode(), (addmeta_version or "unknown").encode(), digest.encode()])
+
+    with open(fname, "wb") as f:
+        f.write(header + b"\n")
+        f.write(data)
+
+    return digest
+
+def read_bundle(fname):
+    """
+    Read a bundle, returning a dict with "metadata", "kwdata", "fnregex",
+    "sources", "created", "addmeta" and "digest" keys
+    """
+    with open(fname, "rb") as f:
+        header = f.readline().split()
+        data = f.read()
+
+    if header[:2] != MAGIC.split():
+        raise BundleError(f"{fname} is not an addmeta bundle")
+    try:
+        version, written_by, digest = int(header[2]), header[3].decode(), header[4].decode()
+    except (IndexError, ValueError):
+        raise BundleError(f"{fname} has an invalid bundle header")
+    if version != BUNDLE_VERSION:
+        raise BundleError(
+            f"{fname} is bundle version {version}, written by addmeta {written_by}, "
+            f"this version of addmeta reads version {BUNDLE_VERSION}: recompile it"
+        )
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise BundleError(f"{fname} is corrupt, its digest doesn't match")
+
+    try:
+        contents = decode(json.loads(data))
+    except (TypeError, ValueError) as e:
+        raise BundleError(f"{fname} has invalid contents: {e}")
+    contents["digest"] = digest
+    return contents
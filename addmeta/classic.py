@@ -0,0 +1,463 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Read, edit and rewrite the header of netCDF classic format files (CDF-1,
+CDF-2 and CDF-5) directly, without going through libnetcdf.
+
+The header is parsed into ClassicDataset and ClassicVariable objects which
+mimic the parts of the netCDF4.Dataset and netCDF4.Variable API used by
+addmeta, so the same code can apply meta data to either. When the edited
+header still fits in the space before the first variable's data it is
+written back in place, otherwise HeaderPatchError is raised and the caller
+should use netCDF4 instead.
+
+See https://docs.unidata.ucar.edu/netcdf-c/current/file_format_specifications.html
+"""
+
+import struct
+import unicodedata
+
+from .backends import FILL_VALUE_ERROR, BackendError
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Format version byte following the "CDF" magic
+CDF1, CDF2, CDF5 = 1, 2, 5
+
+# List tags
+NC_DIMENSION = 0x0A
+NC_VARIABLE = 0x0B
+NC_ATTRIBUTE = 0x0C
+
+# External data types and their big-endian numpy dtypes
+NC_CHAR = 2
+NC_TYPES = {
+    1: '>i1',     # NC_BYTE
+    NC_CHAR: 'S1',
+    3: '>i2',     # NC_SHORT
+    4: '>i4',     # NC_INT
+    5: '>f4',     # NC_FLOAT
+    6: '>f8',     # NC_DOUBLE
+    7: '>u1',     # NC_UBYTE
+    8: '>u2',     # NC_USHORT
+    9: '>u4',     # NC_UINT
+    10: '>i8',    # NC_INT64
+    11: '>u8',    # NC_UINT64
+}
+
+# Only NC_BYTE to NC_DOUBLE are valid before CDF-5
+CLASSIC_TYPES = (1, 2, 3, 4, 5, 6)
+
+# libnetcdf aligns the start of the data to 4 bytes, so a file with less
+# free space than this after the header has no space reserved
+ALIGNMENT = 4
+
+# Bytes copied at a time when moving data
+SHIFT_CHUNK = 16 * 1024 * 1024
+
+
+class HeaderPatchError(BackendError):
+    """
+    The requested edit can't be made by rewriting the header in place
+    """
+
+
+def padding(length):
+    """Number of bytes needed to pad length to a 4 byte boundary"""
+    return -length % 4
+
+
+class ClassicAttribute:
+    """
+    An attribute stored as its netCDF type and the raw big-endian bytes of
+    its values, so attributes that aren't edited are written back unchanged
+    """
+    __slots__ = ('nc_type', 'nelems', 'data')
+
+    def __init__(self, nc_type, nelems, data):
+        self.nc_type = nc_type
+        self.nelems = nelems
+        self.data = data
+
+    @classmethod
+    def from_value(cls, value, version):
+        """
+        Convert a value to an attribute following the same rules as
+        netCDF4-python: strings are stored as NC_CHAR, python ints as NC_INT
+        (NC_INT64 for CDF-5) and python floats as NC_DOUBLE
+        """
+        if isinstance(value, str):
+            data = unicodedata.normalize('NFC', value).encode('utf-8')
+            # netCDF4-python stores an empty string as a single null byte
+            return cls(NC_CHAR, len(data) or 1, data or b'\x00')
+
+        array = np.atleast_1d(np.asarray(value))
+        if array.ndim != 1 or array.dtype.kind not in 'iuf':
+            raise HeaderPatchError(f"unsupported attribute value {value!r}")
+
+        if array.dtype.itemsize == 8 and array.dtype.kind == 'i' and version != CDF5:
+            array = array.astype('i4')
+
+        for nc_type, dtype in NC_TYPES.items():
+            if nc_type != NC_CHAR and np.dtype(dtype).newbyteorder('=') == array.dtype.newbyteorder('='):
+                break
+        else:
+            raise HeaderPatchError(f"unsupported attribute type {array.dtype}")
+
+        if version != CDF5 and nc_type not in CLASSIC_TYPES:
+            raise HeaderPatchError(f"attribute type {array.dtype} not supported by CDF-{version}")
+
+        return cls(nc_type, len(array), array.astype(NC_TYPES[nc_type]).tobytes())
+
+    @property
+    def value(self):
+        """
+        The attribute value as returned by netCDF4-python: a str for NC_CHAR,
+        otherwise a numpy scalar or, for more than one value, array
+        """
+        if self.nc_type == NC_CHAR:
+            return self.data.decode('utf-8', 'replace').replace('\x00', '')
+
+        array = np.frombuffer(self.data, dtype=NC_TYPES[self.nc_type])
+        array = array.astype(array.dtype.newbyteorder('='))
+        return array[0] if len(array) == 1 else array
+
+
+class ClassicGroup:
+    """
+    Attribute methods shared by the dataset and its variables
+    """
+
+    def __init__(self, dataset, attributes):
+        self._dataset = dataset
+        self._attributes = attributes
+
+    def ncattrs(self):
+        return list(self._attributes)
+
+    def getncattr(self, name):
+        try:
+            return self._attributes[name].value
+        except KeyError:
+            raise AttributeError(f"NetCDF: Attribute not found: {name}")
+
+    def setncattr(self, name, value):
+        name = unicodedata.normalize('NFC', name)
+        # Replacing an attribute keeps its position, like libnetcdf
+        self._attributes[name] = ClassicAttribute.from_value(value, self._dataset.version)
+
+    def delncattr(self, name):
+        try:
+            del self._attributes[name]
+        except KeyError:
+            raise AttributeError(f"NetCDF: Attribute not found: {name}")
+
+
+class ClassicVariable(ClassicGroup):
+
+    def __init__(self, dataset, name, dimids, attributes, nc_type, vsize, begin):
+        super().__init__(dataset, attributes)
+        self.name = name
+        self.dimids = dimids
+        self.nc_type = nc_type
+        self.vsize = vsize
+        self.begin = begin
+
+    def setncattr(self, name, value):
+        if name == "_FillValue":
+            raise AttributeError(FILL_VALUE_ERROR)
+        super().setncattr(name, value)
+
+
+class ClassicDataset(ClassicGroup):
+    """
+    The header of a netCDF classic format file. Edits are made in memory
+    and only written to the file by close(). header_writes counts how many
+    times the header has been written
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header_writes = 0
+        self.dimensions = {}
+        self.variables = {}
+
+        with open(filename, 'rb') as f:
+            # The header is almost always smaller than this, read more if not
+            self._buffer = f.read(65536)
+            self._file = f
+            self._offset = 0
+
+            magic = self._read(4)
+            if magic[:3] != b'CDF' or magic[3] not in (CDF1, CDF2, CDF5):
+                raise HeaderPatchError(f"{filename} is not a netCDF classic format file")
+            self.version = magic[3]
+
+            self._numrecs = self._read(8 if self.version == CDF5 else 4)
+            self._read_dimensions()
+            super().__init__(self, self._read_attributes())
+            self._read_variables()
+
+            self.header_size = self._offset
+            del self._buffer, self._file
+
+        self._original = self.encode()
+
+    # Reading
+
+    def _read(self, size):
+        while self._offset + size > len(self._buffer):
+            more = self._file.read(max(size, 65536))
+            if not more:
+                raise HeaderPatchError(f"{self.filename}: truncated header")
+            self._buffer += more
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return data
+
+    def _read_int(self):
+        return struct.unpack('>i', self._read(4))[0]
+
+    def _read_non_neg(self):
+        if self.version == CDF5:
+            return struct.unpack('>q', self._read(8))[0]
+        return self._read_int()
+
+    def _read_offset(self):
+        if self.version == CDF1:
+            return self._read_int()
+        return struct.unpack('>q', self._read(8))[0]
+
+    def _read_name(self):
+        length = self._read_non_neg()
+        name = self._read(length).decode('utf-8')
+        self._read(padding(length))
+        return name
+
+    def _read_list(self, tag):
+        list_tag = self._read_int()
+        count = self._read_non_neg()
+        if list_tag not in (0, tag) or (list_tag == 0 and count != 0):
+            raise HeaderPatchError(f"{self.filename}: malformed header")
+        return count
+
+    def _read_dimensions(self):
+        for _ in range(self._read_list(NC_DIMENSION)):
+            name = self._read_name()
+            self.dimensions[name] = self._read_non_neg()
+
+    def _read_attributes(self):
+        attributes = {}
+        for _ in range(self._read_list(NC_ATTRIBUTE)):
+            name = self._read_name()
+            nc_type = self._read_int()
+            if nc_type not in NC_TYPES:
+                raise HeaderPatchError(f"{self.filename}: unknown attribute type {nc_type}")
+            nelems = self._read_non_neg()
+            size = nelems * np.dtype(NC_TYPES[nc_type]).itemsize
+            attributes[name] = ClassicAttribute(nc_type, nelems, self._read(size))
+            self._read(padding(size))
+        return attributes
+
+    def _read_variables(self):
+        for _ in range(self._read_list(NC_VARIABLE)):
+            name = self._read_name()
+            dimids = [self._read_non_neg() for _ in range(self._read_non_neg())]
+            attributes = self._read_attributes()
+            nc_type = self._read_int()
+            vsize = self._read_non_neg() if self.version == CDF5 else struct.unpack('>I', self._read(4))[0]
+            begin = self._read_offset()
+            self.variables[name] = ClassicVariable(self, name, dimids, attributes, nc_type, vsize, begin)
+
+    # Writing
+
+    def _non_neg(self, value):
+        return struct.pack('>q' if self.version == CDF5 else '>i', value)
+
+    def _encode_name(self, name):
+        data = name.encode('utf-8')
+        return self._non_neg(len(data)) + data + b'\x00' * padding(len(data))
+
+    def _encode_list(self, tag, count):
+        if count == 0:
+            return struct.pack('>i', 0) + self._non_neg(0)
+        return struct.pack('>i', tag) + self._non_neg(count)
+
+    def _encode_attributes(self, attributes):
+        parts = [self._encode_list(NC_ATTRIBUTE, len(attributes))]
+        for name, attr in attributes.items():
+            parts += [
+                self._encode_name(name),
+                struct.pack('>i', attr.nc_type),
+                self._non_neg(attr.nelems),
+                attr.data,
+                b'\x00' * padding(len(attr.data)),
+            ]
+        return b''.join(parts)
+
+    def encode(self):
+        """
+        Return the header as bytes
+        """
+        parts = [b'CDF' + bytes([self.version]), self._numrecs]
+
+        parts.append(self._encode_list(NC_DIMENSION, len(self.dimensions)))
+        for name, length in self.dimensions.items():
+            parts += [self._encode_name(name), self._non_neg(length)]
+
+        parts.append(self._encode_attributes(self._attributes))
+
+        parts.append(self._encode_list(NC_VARIABLE, len(self.variables)))
+        for var in self.variables.values():
+            parts += [self._encode_name(var.name), self._non_neg(len(var.dimids))]
+            parts += [self._non_neg(dimid) for dimid in var.dimids]
+            parts += [
+                self._encode_attributes(var._attributes),
+                struct.pack('>i', var.nc_type),
+                self._non_neg(var.vsize) if self.version == CDF5 else struct.pack('>I', var.vsize),
+                struct.pack('>i' if self.version == CDF1 else '>q', var.begin),
+            ]
+
+        return b''.join(parts)
+
+    @property
+    def data_start(self):
+        """
+        Offset of the first variable's data, the header can't grow past this.
+        None if there are no variables
+        """
+        return min((var.begin for var in self.variables.values()), default=None)
+
+    @property
+    def free_space(self):
+        """
+        Bytes free between the end of the header, as read, and the data.
+        None if there are no variables
+        """
+        data_start = self.data_start
+        return None if data_start is None else data_start - self.header_size
+
+    @property
+    def changed(self):
+        return self.encode() != self._original
+
+    def layout(self, reserve=0):
+        """
+        Return the edited header and the number of bytes the data would have
+        to move to fit it.
+
+        If reserve is non-zero and the data has to move, or the file had no
+        free space after the header to begin with, the data is moved far
+        enough to leave reserve bytes free after the new header, in the same
+        way as h_minfree in nc__enddef
+        """
+        header = self.encode()
+        data_start = self.data_start
+        if data_start is None:
+            return header, 0
+
+        unpadded = self.free_space < ALIGNMENT
+        if len(header) <= data_start and not (reserve and unpadded):
+            return header, 0
+
+        new_start = len(header) + reserve
+        new_start += padding(new_start)
+        return header, max(new_start - data_start, 0)
+
+    def close(self, reserve=0):
+        """
+        Write the header back to the file if it has changed. If the new
+        header doesn't fit before the data, HeaderPatchError is raised without
+        modifying the file, unless reserve is non-zero in which case the data
+        is moved (see layout). Returns True if the file was written
+        """
+        header = self.encode()
+        if header == self._original:
+            return False
+
+        header, shift = self.layout(reserve)
+        if shift:
+            if not reserve:
+                raise HeaderPatchError(
+                    f"header would grow to {len(header)} bytes, only {self.data_start} available"
+                )
+            # Writes the header with the new offsets
+            self.shift_data(shift)
+        else:
+            self._write(header)
+
+        return True
+
+    def shift_data(self, shift):
+        """
+        Move all the variable data shift bytes further into the file, and
+        update the header offsets to match, making room for a larger header
+        """
+        data_start = self.data_start
+        if self.version == CDF1:
+            end = max(var.begin for var in self.variables.values()) + shift
+            if end > 2**31 - 1:
+                raise HeaderPatchError("CDF-1 offsets can't address moved data")
+
+        with open(self.filename, 'r+b') as f:
+            end = f.seek(0, 2)
+            # Copy backwards so data isn't overwritten before it is moved
+            position = end
+            while position > data_start:
+                size = min(SHIFT_CHUNK, position - data_start)
+                position -= size
+                f.seek(position)
+                data = f.read(size)
+                f.seek(position + shift)
+                f.write(data)
+            f.seek(data_start)
+            f.write(b'\x00' * shift)
+
+        for var in self.variables.values():
+            var.begin += shift
+
+        # The offsets on disk have to be updated whether or not the rest of
+        # the header changes
+        self._write(self.encode())
+
+    def _write(self, header):
+        with open(self.filename, 'r+b') as f:
+            # Clear any of the old header left over if the new one is shorter
+            f.write(header + b'\x00' * max(self.header_size - len(header), 0))
+
+        self._original = header
+        self.header_size = len(header)
+        self.header_writes += 1
+
+    # Renaming, mimicking netCDF4.Dataset
+
+    def renameVariable(self, old_name, new_name):
+        self._rename(self.variables, old_name, new_name)
+        self.variables[new_name].name = new_name
+
+    def renameDimension(self, old_name, new_name):
+        self._rename(self.dimensions, old_name, new_name)
+
+    def _rename(self, container, old_name, new_name):
+        new_name = unicodedata.normalize('NFC', new_name)
+        if old_name not in container:
+            raise KeyError(old_name)
+        if new_name in container:
+            raise HeaderPatchError(f"name {new_name} already in use")
+        # Keep the original order, as it determines ids
+        items = list(container.items())
+        container.clear()
+        container.update((new_name if name == old_name else name, value) for name, value in items)
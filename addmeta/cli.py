@@ -19,21 +19,43 @@ limitations under the License.
 """
 
 import argparse
+from contextlib import contextmanager
+import cProfile
 from datetime import datetime, timezone
-from glob import glob
+from glob import has_magic, iglob
+from itertools import chain
 import os
 from pathlib import Path
 from platform import python_version
 import sys
+from warnings import warn
 
+import addmeta
 from addmeta import (
+    AttributePlan,
+    FilenameRegexError,
+    FilenameRegexs,
+    PlanError,
+    ProcessingErrors,
+    apply_plan,
+    dict_merge,
+    format_counts,
     find_and_add_meta,
     combine_meta,
     list_from_file,
     skip_comments,
     load_data_files,
-    __version__ as addmeta_version,
+    make_plan,
+    read_plan_file,
+    predict_header_growth,
+    BACKENDS,
 )
+from addmeta.bundle import BundleError, read_bundle, write_bundle
+from addmeta.schedule import SCHEDULERS, make_scheduler
+from addmeta.shard import SHARDERS, parse_shard, shard_files
+from addmeta.timing import start_timing, stop_timing
+from addmeta.walk import walk_files
+from addmeta.yamlcache import KEYS, UnsafeCacheError, start_yaml_cache, stop_yaml_cache, use_libyaml
 
 
 def parse_args(args):
@@ -48,14 +70,60 @@ def parse_args(args):
     parser.add_argument("-l","--metalist", help="File containing a list of meta-data files", action='append')
     parser.add_argument("-d","--datafiles", help="One or more key/value data files in YAML format", action='append')
     parser.add_argument("-f","--fnregex", help="Extract metadata from filename using regex", default=[], action='append')
+    parser.add_argument("--bundle", help="Metadata bundle written by 'addmeta compile', applied before any other meta data, data files and filename regexs given", action='store')
     parser.add_argument("--datavar", help="Key/value pair to be added as data variable, e.g. --datavar 'var=value'", default=[], action='append')
     parser.add_argument("-s","--sort", help="Sort global and variable attributes lexicographically, ignoring case", action="store_true")
     parser.add_argument("--update-history", help="Update (or create) the history global attribute", action="store_true")
+    parser.add_argument("--skip-unchanged", help="Only open files for writing if the meta data would change them", action="store_true")
+    parser.add_argument("--now", help="Fixed ISO8601 datetime to use for __datetime__.now and the history timestamp, so reruns produce identical meta data", type=parse_datetime, action='store')
+    parser.add_argument("--engine", help="How to write files: 'netcdf4' (default), 'classic' to rewrite the header of netCDF classic format files in place, or 'h5py' to edit netCDF4 format files with h5py, falling back to netcdf4 when that isn't possible", choices=[*BACKENDS, "classic"], action='store')
+    parser.add_argument("--header-pad", help="Bytes of free space to reserve after the header of netCDF classic format files when the data has to be moved, or the file has no free space", type=int, action='store')
+    parser.add_argument("--header-report", help="Report how the header of each classic format file would change, and which would need the data moved, without modifying any files", action="store_true")
+    parser.add_argument("-j","--jobs", help="Number of worker processes used to process files in parallel (0 uses all available CPUs)", type=int, action='store')
+    parser.add_argument("--profile", help="Print a table of the time spent in each phase of the run", action="store_true")
+    parser.add_argument("--profile-json", help="Write the time spent in each phase, in total and for each file, to a JSON file", action='store')
+    parser.add_argument("--profile-dump", help="Write a cProfile dump of the run (of the main process only when using --jobs) to a file", action='store')
+    parser.add_argument("--yaml-cache", help="Directory in which to cache parsed YAML files (default: $ADDMETA_YAML_CACHE, or no cache)", action='store')
+    parser.add_argument("--yaml-cache-size", help="Maximum size of the YAML cache in MB, the least recently used entries are removed (default: 100)", type=float, action='store')
+    parser.add_argument("--yaml-cache-key", help="Identify unchanged YAML files by modification time and size ('mtime', the default) or by a hash of their contents ('content')", choices=KEYS, action='store')
+    parser.add_argument("--libyaml", help="Parse YAML files with the libyaml C loader, if it is available", action="store_true")
+    parser.add_argument("--files-from", help="Read netCDF file names, one per line, from a file, or from standard input if '-'. Files are processed as they are read", action='store')
+    parser.add_argument("-0","--null", help="File names read with --files-from are separated by NUL characters, as written by find -print0", action="store_true")
+    parser.add_argument("-r","--recursive", help="Process the netCDF files found in a directory and all its subdirectories, can be repeated", action='append', metavar="DIR")
+    parser.add_argument("--include", help="With --recursive only process files whose names match this glob pattern, can be repeated (default: *.nc)", action='append', metavar="PATTERN")
+    parser.add_argument("--exclude", help="With --recursive skip files and directories whose names match this glob pattern, can be repeated", action='append', metavar="PATTERN")
+    parser.add_argument("--scan-threads", help="Number of directories listed at once with --recursive (default: 8)", type=int)
+    parser.add_argument("--prefetch", help="Without --jobs, stat files and render their attributes in this many threads, up to this many files ahead of the one being written (default: 0, off)", type=int, metavar="DEPTH")
+    parser.add_argument("--schedule", help="Order to process files in: as given (input, the default), grouped by directory, largest first (size), or grouped by the variables the filename regexs match (fnregex)", choices=SCHEDULERS.keys())
+    parser.add_argument("--max-per-directory", help="With --jobs, process at most this many files from the same directory at once", type=int, metavar="N")
+    parser.add_argument("--adaptive", help="With --jobs, adjust how many files are processed at once to the filesystem's throughput and latency", action="store_true")
+    parser.add_argument("--max-rate", help="Start at most this many files per second", type=float, metavar="FILES_PER_SECOND")
+    parser.add_argument("--shard", help="Only process the files in shard INDEX of COUNT, numbered from 0, so COUNT jobs given the same files process each exactly once", type=parse_shard, metavar="INDEX/COUNT")
+    parser.add_argument("--shard-by", help="How files are divided into shards: by a hash of their path (hash, the default), or balancing the total size of each shard (size)", choices=SHARDERS.keys())
+    parser.add_argument("--list-files", help="Print the files that would be processed, one per line, without modifying them", action="store_true")
+    parser.add_argument("--journal", help="Record each file in this journal as it is finished, so the run can be resumed", action='store')
+    parser.add_argument("--resume", help="Skip files the journal records as finished with the same meta data, and unchanged since", action='store_true')
+    parser.add_argument("-k","--keep-going", help="Carry on when a file fails, and report all the failures at the end", action='store_true')
     parser.add_argument("-v","--verbose", help="Verbose output", action='store_true')
     parser.add_argument("files", help="netCDF files", nargs='*')
 
     return (parser, parser.parse_args(args))
 
+def parse_datetime(value):
+    """
+    Parse an ISO8601 datetime string, assuming UTC if no timezone is given
+    """
+    try:
+        # fromisoformat doesn't support Z until python3.11
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid ISO8601 datetime: {value}")
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+
+    return dt
+
 def parse_key_value_pairs(pairs):
     """
     Parse a list of key=value strings into a dictionary
@@ -72,7 +140,193 @@ def main(args):
     """
     Main routine. Takes return value from parse.parse_args as input
     """
-    metafiles = []
+    with profiling(args.profile, args.profile_json, args.profile_dump), yaml_reading(args):
+        run(args)
+
+@contextmanager
+def profiling(table=False, json_file=None, dump_file=None):
+    """
+    Record the time spent in each phase if table or json_file is set, and
+    print it as a table or write it to json_file. If dump_file is set write
+    a cProfile dump to it
+    """
+    timings = start_timing() if table or json_file else None
+    profiler = cProfile.Profile() if dump_file else None
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(dump_file)
+        if timings is not None:
+            stop_timing()
+            if table: print(timings.report())
+            if json_file: timings.write_json(json_file)
+
+@contextmanager
+def yaml_reading(args):
+    """
+    Select the YAML loader and start the YAML cache if one is given. The
+    cache hits and time saved are printed in verbose mode
+    """
+    if args.libyaml and not use_libyaml():
+        warn("libyaml is not available, using the python YAML loader")
+
+    cache_dir = args.yaml_cache or os.environ.get("ADDMETA_YAML_CACHE")
+    cache = None
+    if cache_dir:
+        try:
+            cache = start_yaml_cache(
+                cache_dir,
+                max_size=int((args.yaml_cache_size or 100) * 1024 * 1024),
+                key=args.yaml_cache_key or "mtime",
+            )
+        except UnsafeCacheError as e:
+            warn(f"{e}, not caching parsed YAML")
+
+    try:
+        yield
+    finally:
+        if cache is not None:
+            stop_yaml_cache()
+            if args.verbose: print(cache.report())
+        use_libyaml(False)
+
+def run(args):
+    """
+    Add meta data as specified by the parsed arguments
+    """
+    verbose = args.verbose
+    metadata, kwdata, fnregexs = load_meta(args)
+    
+    if args.update_history:
+        history = build_history(args.files, now=args.now)
+    else:
+        history = None
+
+    metadata, files = input_files(args, metadata)
+
+    if args.list_files:
+        for fname in files:
+            print(fname)
+        return
+
+    if args.header_report:
+        print_header_report(
+            predict_header_growth(
+                files,
+                metadata,
+                kwdata,
+                fnregexs,
+                sort_attrs=args.sort,
+                history=history,
+                header_pad=args.header_pad or 0,
+                now=args.now,
+            )
+        )
+        return
+
+    scheduler = None
+    if args.schedule is not None or args.max_per_directory is not None:
+        scheduler = make_scheduler(args.schedule or "input", max_per_group=args.max_per_directory, fnregexs=fnregexs)
+
+    try:
+        counts = find_and_add_meta(
+            files,
+            metadata,
+            kwdata,
+            fnregexs,
+            sort_attrs=args.sort,
+            history=history,
+            verbose=verbose,
+            jobs=1 if args.jobs is None else args.jobs,
+            skip_unchanged=args.skip_unchanged,
+            now=args.now,
+            engine=args.engine or "netcdf4",
+            header_pad=args.header_pad or 0,
+            journal=args.journal,
+            resume=args.resume,
+            keep_going=args.keep_going,
+            prefetch=args.prefetch or 0,
+            scheduler=scheduler,
+            adaptive=args.adaptive,
+            max_rate=args.max_rate,
+        )
+    except ProcessingErrors as e:
+        if not verbose:
+            print(format_counts(e.counts))
+        sys.exit(f"Error: {e}")
+
+    if (args.skip_unchanged or args.resume) and not verbose:
+        print(format_counts(counts))
+
+def load_meta(args):
+    """
+    Return the merged meta data, template data and checked filename regexs
+    given by the parsed arguments
+    """
+    kwdata = load_kwdata(args)
+    metafiles = collect_metafiles(args)
+    metadata = combine_meta(metafiles)
+    fnregexs = args.fnregex
+
+    if args.bundle is not None:
+        metadata, kwdata, fnregexs = apply_bundle(args.bundle, metadata, kwdata, fnregexs, args.verbose)
+
+    # Check the filename regexs before any file is touched
+    try:
+        fnregexs = FilenameRegexs(fnregexs)
+    except FilenameRegexError as e:
+        sys.exit(f"Error: {e}")
+
+    return metadata, kwdata, fnregexs
+
+def input_files(args, metadata):
+    """
+    Return the meta data, compiled to an AttributePlan if directories are
+    walked, and the files to process, from the command line, --files-from
+    and --recursive, limited to the shard given by --shard
+    """
+    files = args.files
+    if args.files_from is not None:
+        files = chain(files, read_files_from(args.files_from, null=args.null))
+    if args.recursive:
+        # Compiled here to find out if the files need to be stat'ed, which
+        # is then done while listing the directories
+        metadata = AttributePlan(metadata)
+        files = chain(files, walk_directories(args, stat='__file__' in metadata.file_variables or args.shard_by == "size"))
+    if args.shard is not None:
+        files = shard_files(files, args.shard, args.shard_by or "hash")
+
+    return metadata, files
+
+def walk_directories(args, stat=False):
+    """
+    Yield the files found in the --recursive directories, exiting with an
+    error if one of them can't be listed
+    """
+    # Checked first, so nothing is processed if a directory is mistyped
+    for root in args.recursive:
+        if not os.path.isdir(root):
+            sys.exit(f"Error: {root} is not a directory")
+    try:
+        yield from walk_files(
+            args.recursive,
+            include=args.include or ["*.nc"],
+            exclude=args.exclude or [],
+            threads=args.scan_threads or 8,
+            stat=stat,
+        )
+    except OSError as e:
+        sys.exit(f"Error: can't list directory {e.filename}: {e.strerror}")
+
+def load_kwdata(args):
+    """
+    Return the template data from the --datafiles and --datavar arguments
+    """
     verbose = args.verbose
     kwdata = {}
 
@@ -91,6 +345,14 @@ def main(args):
             if verbose: print(f"Error parsing datavar: {e}")
             raise
 
+    return kwdata
+
+def collect_metafiles(args):
+    """
+    Return the meta data files from the --metalist and --metafiles arguments
+    """
+    metafiles = []
+
     if (args.metalist is not None):
         for line in args.metalist:
             metafiles.extend(list_from_file(line))
@@ -98,22 +360,81 @@ def main(args):
     if (args.metafiles is not None):
         metafiles.extend(args.metafiles)
 
-    if verbose: print("metafiles: "," ".join([str(f) for f in metafiles]))
-    
-    if args.update_history:
-        history = build_history(args.files)
-    else:
-        history = None
+    if args.verbose: print("metafiles: "," ".join([str(f) for f in metafiles]))
 
-    find_and_add_meta(
-        args.files,
-        combine_meta(metafiles),
-        kwdata,
-        args.fnregex,
-        sort_attrs=args.sort,
-        history=history,
-        verbose=verbose,
-    )
+    return metafiles
+
+def apply_bundle(fname, metadata, kwdata, fnregexs, verbose=False):
+    """
+    Return the metadata, template data and filename regexs from a bundle,
+    with those given on the command line merged on top
+    """
+    try:
+        bundle = read_bundle(fname)
+    except (OSError, BundleError) as e:
+        sys.exit(f"Error: {e}")
+
+    if verbose: print(f"bundle: {fname} (sha256 {bundle['digest']}, written by addmeta {bundle['addmeta']} at {bundle['created']})")
+
+    merged = bundle["metadata"]
+    dict_merge(merged, metadata)
+    merged_kwdata = {**bundle["kwdata"], **kwdata}
+
+    return merged, merged_kwdata, bundle["fnregex"] + list(fnregexs)
+
+def decode_names(names, null):
+    """
+    Decode file names read as bytes, skipping empty and, unless separated by
+    NUL characters, blank names and trailing carriage returns
+    """
+    for name in names:
+        if not null:
+            name = name.rstrip(b"\r")
+            if not name.strip():
+                continue
+        if name:
+            yield os.fsdecode(name)
+
+def read_files_from(source, null=False, chunk_size=65536):
+    """
+    Yield file names read from source, a file name or '-' for standard
+    input, separated by newlines or, if null is True, NUL characters. Names
+    are yielded as they are read, so only one chunk is held in memory
+    """
+    separator = b"\0" if null else b"\n"
+    stream = sys.stdin.buffer if source == "-" else open(source, "rb")
+    try:
+        remainder = b""
+        while True:
+            # read1 returns what is available rather than waiting for a whole chunk
+            read = getattr(stream, "read1", stream.read)
+            chunk = read(chunk_size)
+            if not chunk:
+                break
+            *names, remainder = (remainder + chunk).split(separator)
+            yield from decode_names(names, null)
+        yield from decode_names([remainder], null)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+def print_header_report(reports):
+    """
+    Print the predicted header changes from predict_header_growth as a table
+    """
+    columns = ["header_size", "new_header_size", "data_start", "free", "shift"]
+
+    def fmt(value):
+        return "-" if value is None else str(value)
+
+    print(f"{'format':<8}" + "".join(f"{c:>16}" for c in columns) + f"  {'action':<12}file")
+    shifts = 0
+    for report in reports:
+        shifts += report['action'] == 'data shift'
+        print(f"{fmt(report['format']):<8}"
+              + "".join(f"{fmt(report[c]):>16}" for c in columns)
+              + f"  {report['action']:<12}{report['file']}")
+    print(f"{shifts} file(s) would need the data moved")
 
 def safe_join_lists(list1, list2):
     """
@@ -132,27 +453,78 @@ def safe_join_lists(list1, list2):
 
 def resolve_relative_paths(files, base_path):
     """
-    Resolve relative paths for a list of files against a base path.
+    Resolve relative paths for a list of files against a base path,
+    expanding glob patterns. Yields the paths of the files that exist
     """
-    resolved = []
     for file in files:
         file = os.path.expandvars(file)
-        if os.path.isabs(file):
-            resolved.extend(glob(file))
+        if not has_magic(file):
+            # A plain path, checking it exists is much cheaper than globbing
+            if not os.path.isabs(file):
+                file = str(base_path / file)
+            if os.path.lexists(file):
+                yield file
+        elif os.path.isabs(file):
+            yield from iglob(file)
         else:
-            resolved.extend([str(f) for f in base_path.glob(file)])
-    return resolved
+            yield from map(str, base_path.glob(file))
 
-def build_history(files):
-    time_stamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+def build_history(files, now=None, argv=None):
+    """
+    Return the history entry for this invocation. argv is the command line,
+    by default sys.argv
+    """
+    time_stamp = (now or datetime.now(timezone.utc)).isoformat(timespec='seconds')
     python_exe = f"python{python_version()}"
 
-    # The list of files given on the commandline is not needed in the history
-    args = " ".join([a for a in sys.argv if a not in files])
+    # The list of files given on the commandline is not needed in the history.
+    # A set, as there can be a very large number of them
+    files = set(files)
+    args = " ".join([a for a in (sys.argv if argv is None else argv) if a not in files])
   
-    return f"{time_stamp} : addmeta {addmeta_version} : {python_exe} {args}"
+    return f"{time_stamp} : addmeta {addmeta.__version__} : {python_exe} {args}"
 
-def main_parse_args(args):
+def read_cmdlineargs(cmdlinefile):
+    """
+    Parse the arguments in a cmdlineargs file, with paths relative to the
+    directory of the file
+    """
+    cmdlinefile = Path(cmdlinefile)
+    with open(cmdlinefile, 'r') as file:
+        newargs = [line for line in skip_comments(file)]
+    _, new_parsed_args = parse_args(newargs)
+
+    # Convert relative paths in metafiles to be relative to cmdlineargs file
+    if new_parsed_args.metafiles is not None:
+        new_parsed_args.metafiles = list(resolve_relative_paths(new_parsed_args.metafiles, cmdlinefile.parent))
+
+    # Convert relative paths in datafiles to be relative to cmdlineargs file
+    if new_parsed_args.datafiles is not None:
+        new_parsed_args.datafiles = list(resolve_relative_paths(new_parsed_args.datafiles, cmdlinefile.parent))
+
+    # Convert a relative bundle path to be relative to cmdlineargs file
+    if new_parsed_args.bundle is not None:
+        new_parsed_args.bundle = str(cmdlinefile.parent / os.path.expandvars(new_parsed_args.bundle))
+
+    # Convert relative --recursive directories to be relative to cmdlineargs file
+    if new_parsed_args.recursive is not None:
+        new_parsed_args.recursive = [str(cmdlinefile.parent / os.path.expandvars(d)) for d in new_parsed_args.recursive]
+
+    # Convert a relative journal path to be relative to cmdlineargs file
+    if new_parsed_args.journal is not None:
+        new_parsed_args.journal = str(cmdlinefile.parent / os.path.expandvars(new_parsed_args.journal))
+
+    # Convert a relative --files-from path, other than standard input
+    if new_parsed_args.files_from not in (None, "-"):
+        new_parsed_args.files_from = str(cmdlinefile.parent / os.path.expandvars(new_parsed_args.files_from))
+
+    # Expand (glob) patterns in positional arguments (files) and convert relative paths
+    if new_parsed_args.files is not None:
+        new_parsed_args.files = list(resolve_relative_paths(new_parsed_args.files, cmdlinefile.parent))
+
+    return new_parsed_args
+
+def main_parse_args(args, require_files=True):
     """
     Call main with list of arguments. Callable from tests
     """
@@ -164,24 +536,9 @@ def main_parse_args(args):
         # and parse
         cmdlinefile = Path(parsed_args.cmdlineargs)
         try:
-            with open(cmdlinefile, 'r') as file:
-                newargs = [line for line in skip_comments(file)]
+            new_parsed_args = read_cmdlineargs(cmdlinefile)
         except FileNotFoundError:
             sys.exit(f"Error: cmdlineargs file '{cmdlinefile}' not found")
-        else:
-            _, new_parsed_args = parse_args(newargs)
-
-        # Convert relative paths in metafiles to be relative to cmdlineargs file
-        if new_parsed_args.metafiles is not None:
-            new_parsed_args.metafiles = resolve_relative_paths(new_parsed_args.metafiles, cmdlinefile.parent)
-
-        # Convert relative paths in datafiles to be relative to cmdlineargs file
-        if new_parsed_args.datafiles is not None:
-            new_parsed_args.datafiles = resolve_relative_paths(new_parsed_args.datafiles, cmdlinefile.parent)
-
-        # Expand (glob) patterns in positional arguments (files) and convert relative paths
-        if new_parsed_args.files is not None:
-            new_parsed_args.files = resolve_relative_paths(new_parsed_args.files, cmdlinefile.parent)
 
         # Combine new and existing parsed arguments, ommitting cmdlineargs 
         # option.  Adding additional command line arguments may require 
@@ -192,11 +549,65 @@ def main_parse_args(args):
         parsed_args.fnregex = safe_join_lists(parsed_args.fnregex, new_parsed_args.fnregex)
         parsed_args.datavar = safe_join_lists(parsed_args.datavar, new_parsed_args.datavar)
         parsed_args.verbose = parsed_args.verbose or new_parsed_args.verbose
+        if parsed_args.jobs is None:
+            parsed_args.jobs = new_parsed_args.jobs
+        if parsed_args.now is None:
+            parsed_args.now = new_parsed_args.now
+        if parsed_args.engine is None:
+            parsed_args.engine = new_parsed_args.engine
+        if parsed_args.header_pad is None:
+            parsed_args.header_pad = new_parsed_args.header_pad
+        parsed_args.skip_unchanged = parsed_args.skip_unchanged or new_parsed_args.skip_unchanged
+        parsed_args.header_report = parsed_args.header_report or new_parsed_args.header_report
+        parsed_args.profile = parsed_args.profile or new_parsed_args.profile
+        if parsed_args.profile_json is None:
+            parsed_args.profile_json = new_parsed_args.profile_json
+        if parsed_args.profile_dump is None:
+            parsed_args.profile_dump = new_parsed_args.profile_dump
+        if parsed_args.yaml_cache is None:
+            parsed_args.yaml_cache = new_parsed_args.yaml_cache
+        if parsed_args.yaml_cache_size is None:
+            parsed_args.yaml_cache_size = new_parsed_args.yaml_cache_size
+        if parsed_args.yaml_cache_key is None:
+            parsed_args.yaml_cache_key = new_parsed_args.yaml_cache_key
+        parsed_args.libyaml = parsed_args.libyaml or new_parsed_args.libyaml
+        if parsed_args.bundle is None:
+            parsed_args.bundle = new_parsed_args.bundle
+        if parsed_args.files_from is None:
+            parsed_args.files_from = new_parsed_args.files_from
+        parsed_args.null = parsed_args.null or new_parsed_args.null
+        parsed_args.recursive = safe_join_lists(parsed_args.recursive, new_parsed_args.recursive)
+        parsed_args.include = safe_join_lists(parsed_args.include, new_parsed_args.include)
+        parsed_args.exclude = safe_join_lists(parsed_args.exclude, new_parsed_args.exclude)
+        if parsed_args.scan_threads is None:
+            parsed_args.scan_threads = new_parsed_args.scan_threads
+        if parsed_args.prefetch is None:
+            parsed_args.prefetch = new_parsed_args.prefetch
+        if parsed_args.schedule is None:
+            parsed_args.schedule = new_parsed_args.schedule
+        if parsed_args.max_per_directory is None:
+            parsed_args.max_per_directory = new_parsed_args.max_per_directory
+        parsed_args.adaptive = parsed_args.adaptive or new_parsed_args.adaptive
+        if parsed_args.max_rate is None:
+            parsed_args.max_rate = new_parsed_args.max_rate
+        if parsed_args.shard is None:
+            parsed_args.shard = new_parsed_args.shard
+        if parsed_args.shard_by is None:
+            parsed_args.shard_by = new_parsed_args.shard_by
+        parsed_args.list_files = parsed_args.list_files or new_parsed_args.list_files
+        if parsed_args.journal is None:
+            parsed_args.journal = new_parsed_args.journal
+        parsed_args.resume = parsed_args.resume or new_parsed_args.resume
+        parsed_args.keep_going = parsed_args.keep_going or new_parsed_args.keep_going
         parsed_args.cmdlineargs = None
 
 
+    if parsed_args.resume and parsed_args.journal is None:
+        parser.print_usage()
+        sys.exit('Error: --resume requires --journal')
+
     # Have to manually check positional arguments
-    if len(parsed_args.files) < 1:
+    if require_files and len(parsed_args.files) < 1 and parsed_args.files_from is None and not parsed_args.recursive:
         parser.print_usage()
         sys.exit('Error: no files specified')
     
@@ -204,11 +615,181 @@ def main_parse_args(args):
     # otherwise py.test will fail
     return parsed_args
 
+def command_output(parser, args):
+    """
+    Return the output file of a subcommand, which must be its first argument,
+    and the remaining arguments. Otherwise the value of an option given
+    before it, such as a meta data file, could be taken for the output and
+    overwritten
+    """
+    parser.add_argument("output", help="File to write")
+    if not args or args[0] in ("-h", "--help"):
+        parser.parse_args(args)
+    if args[0].startswith("-"):
+        parser.print_usage()
+        sys.exit(f"Error: the output file must be the first argument to {parser.prog}, before any options")
+    return args[0], args[1:]
+
+def compile_command(args):
+    """
+    addmeta compile: write the meta data, data files and filename regexs
+    given by the remaining arguments to a bundle
+    """
+    parser = argparse.ArgumentParser(
+        prog="addmeta compile",
+        usage="addmeta compile OUTPUT [options]",
+        description="Merge meta data, data files and filename regexs into a bundle for addmeta --bundle. "
+        "The bundle file to write comes first, followed by the same -c, -m, -l, -d, -f, --datavar and --bundle "
+        "options as addmeta",
+        epilog="A bundle's checksum only detects corruption: anyone who can write a bundle decides the meta data "
+        "it applies, so write bundles where only those trusted with the meta data can change them",
+    )
+    output, rest = command_output(parser, args)
+
+    args = main_parse_args(rest, require_files=False)
+    if args.files:
+        sys.exit(f"Error: addmeta compile doesn't take netCDF files: {' '.join(args.files)}")
+
+    with yaml_reading(args):
+        kwdata = load_kwdata(args)
+        metafiles = collect_metafiles(args)
+        metadata = combine_meta(metafiles)
+    fnregexs = args.fnregex
+    if args.bundle is not None:
+        metadata, kwdata, fnregexs = apply_bundle(args.bundle, metadata, kwdata, fnregexs, args.verbose)
+
+    try:
+        digest = write_bundle(
+            output, metadata, kwdata, fnregexs,
+            sources=[*metafiles, *(args.datafiles or [])],
+            addmeta_version=addmeta.__version__,
+        )
+    except BundleError as e:
+        sys.exit(f"Error: {e}")
+
+    if args.verbose: print(f"Wrote {output} (sha256 {digest})")
+
+def plan_command(args):
+    """
+    addmeta plan: work out the meta data to add to each file given by the
+    remaining arguments, and write it to a plan, without modifying any file
+    """
+    parser = argparse.ArgumentParser(
+        prog="addmeta plan",
+        usage="addmeta plan OUTPUT [options] [files ...]",
+        description="Stat files, match filename regexs and render templates for every file, without modifying any, "
+        "and write the attributes to add to each to a plan for addmeta apply. "
+        "The plan file to write comes first, followed by the same options as addmeta to give the meta data and files",
+    )
+    output, rest = command_output(parser, args)
+
+    args = main_parse_args(rest)
+
+    with profiling(args.profile, args.profile_json, args.profile_dump), yaml_reading(args):
+        metadata, kwdata, fnregexs = load_meta(args)
+        history = build_history(args.files, now=args.now) if args.update_history else None
+        metadata, files = input_files(args, metadata)
+
+        try:
+            make_plan(
+                output,
+                files,
+                metadata,
+                kwdata,
+                fnregexs,
+                sort_attrs=args.sort,
+                history=history,
+                verbose=args.verbose,
+                jobs=1 if args.jobs is None else args.jobs,
+                now=args.now,
+                keep_going=args.keep_going,
+                addmeta_version=addmeta.__version__,
+            )
+        except ProcessingErrors as e:
+            sys.exit(f"Error: {e}")
+
+def apply_command(args):
+    """
+    addmeta apply: add the meta data in a plan written by addmeta plan
+    """
+    parser = argparse.ArgumentParser(
+        prog="addmeta apply",
+        description="Add the meta data in a plan written by addmeta plan to the files in it. "
+        "Only the files are read and written, nothing is rendered",
+    )
+    parser.add_argument("plan", help="Plan file written by addmeta plan")
+    parser.add_argument("-j","--jobs", help="Number of worker processes used to write files in parallel (0 uses all available CPUs)", type=int, default=1)
+    parser.add_argument("--skip-unchanged", help="Only open files for writing if the meta data would change them", action="store_true")
+    parser.add_argument("--engine", help="How to write files, as for addmeta --engine", choices=[*BACKENDS, "classic"], default="netcdf4")
+    parser.add_argument("--header-pad", help="Bytes of free space to reserve after the header of netCDF classic format files, as for addmeta --header-pad", type=int, default=0)
+    parser.add_argument("--shard", help="Only write the files in shard INDEX of COUNT, as for addmeta --shard", type=parse_shard, metavar="INDEX/COUNT")
+    parser.add_argument("--shard-by", help="How files are divided into shards, as for addmeta --shard-by", choices=SHARDERS.keys(), default="hash")
+    parser.add_argument("-k","--keep-going", help="Carry on when a file fails, and report all the failures at the end", action='store_true')
+    parser.add_argument("-v","--verbose", help="Verbose output", action='store_true')
+    args = parser.parse_args(args)
+
+    try:
+        header, metadata, prepared = read_plan_file(args.plan)
+    except (OSError, PlanError) as e:
+        sys.exit(f"Error: {e}")
+
+    if args.shard is not None:
+        prepared = shard_files(prepared, args.shard, args.shard_by)
+
+    try:
+        counts = apply_plan(
+            prepared,
+            metadata,
+            sort_attrs=header["sort_attrs"],
+            history=header["history"],
+            verbose=args.verbose,
+            jobs=args.jobs,
+            skip_unchanged=args.skip_unchanged,
+            engine=args.engine,
+            header_pad=args.header_pad,
+            keep_going=args.keep_going,
+        )
+    except PlanError as e:
+        sys.exit(f"Error: {e}")
+    except ProcessingErrors as e:
+        if not args.verbose:
+            print(format_counts(e.counts))
+        sys.exit(f"Error: {e}")
+
+    if args.skip_unchanged and not args.verbose:
+        print(format_counts(counts))
+
+def serve_command(args):
+    from addmeta.server import serve_main
+    serve_main(args)
+
+def submit_command(args):
+    from addmeta.server import submit_main
+    submit_main(args)
+
+# Subcommands, given as the first argument, and the functions that run them
+# with the remaining arguments
+COMMANDS = {
+    "compile": compile_command,
+    "plan": plan_command,
+    "apply": apply_command,
+    "serve": serve_command,
+    "submit": submit_command,
+}
+
 def main_argv():
     """
     Call main and pass command line arguments. This is required for setup.py entry_points
     """
-    main(main_parse_args(sys.argv[1:]))
+    argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        # A file named like a command can still be given as ./name
+        if os.path.exists(argv[0]):
+            warn(f"'{argv[0]}' is taken as the addmeta {argv[0]} command, not the file of that name. "
+                 f"To add meta data to the file give it as ./{argv[0]}")
+        COMMANDS[argv[0]](argv[1:])
+        return
+    main(main_parse_args(argv))
 
 if __name__ == "__main__":
 
@@ -0,0 +1,108 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Filename regexs (--fnregex), compiled and checked once before any file is
+processed.
+
+Each regex is searched for in the filename in turn, and the named groups of
+every one that matches are combined into the __file__ template variables,
+later regexs overriding earlier ones. Joining the regexs into a single
+pattern (a lookahead per regex) was tried, but was slower than searching
+for each compiled regex.
+"""
+
+import re
+from warnings import warn
+
+
+class FilenameRegexError(ValueError):
+    """
+    A filename regex is invalid
+    """
+
+
+class FilenameRegexs:
+    """
+    A sequence of compiled filename regexs. Given a FilenameRegexs, returns
+    it unchanged, so the regexs are only compiled, and checked, once
+    """
+
+    def __new__(cls, regexs=()):
+        if isinstance(regexs, FilenameRegexs):
+            return regexs
+        return super().__new__(cls)
+
+    def __init__(self, regexs=()):
+        if regexs is self:
+            return
+
+        self.sources = tuple(regexs)
+        self.patterns = tuple(compile_filename_regex(regex) for regex in self.sources)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __eq__(self, other):
+        return isinstance(other, FilenameRegexs) and other.sources == self.sources
+
+    def __repr__(self):
+        return f"FilenameRegexs({list(self.sources)!r})"
+
+    @property
+    def groups(self):
+        """
+        The names of all the groups the regexs can set, in order
+        """
+        return list(dict.fromkeys(name for pattern in self.patterns for name in pattern.groupindex))
+
+    def match(self, filename):
+        """
+        Return a dict of the named groups of every regex found in filename
+        """
+        vars = {}
+        for pattern in self.patterns:
+            match = pattern.search(filename)
+            if match:
+                vars.update(match.groupdict())
+        return vars
+
+    def match_all(self, filenames):
+        """
+        Match each of filenames, yielding each filename and a dict of the
+        variables matched in it, in order. Nothing is kept, so a list of any
+        length can be matched in one pass, to group or order the files
+        before they are processed
+        """
+        for filename in filenames:
+            yield filename, self.match(filename)
+
+
+def compile_filename_regex(regex):
+    """
+    Compile a filename regex, raising FilenameRegexError if it isn't valid.
+    Warns if it has no named groups, as it can't set any variables
+    """
+    try:
+        pattern = re.compile(regex)
+    except (re.error, TypeError) as e:
+        raise FilenameRegexError(f"Invalid filename regex {regex!r}: {e}") from None
+
+    if not pattern.groupindex:
+        warn(f"Filename regex {regex!r} has no named groups, so sets no template variables")
+
+    return pattern
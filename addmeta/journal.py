@@ -0,0 +1,169 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+A checkpoint journal of the files processed (addmeta --journal), so a run
+that stops partway through, from a walltime limit, node failure or a bad
+file, can be resumed without processing every file again.
+
+The journal is appended to with one JSON object per line as each file is
+finished:
+
+    {"file": path, "status": "updated", "plan": digest,
+     "mtime_ns": ..., "size": ..., "time": ...}
+
+status is "updated", "unchanged" or "failed", with an "error" for failed
+files. plan is a digest of everything that decides the meta data written
+(see plan_digest) and mtime_ns and size are those of the file once it was
+finished. When resuming, a file is skipped if its last entry completed with
+the same plan and the file hasn't changed since. A line left incomplete by
+a crash is ignored.
+"""
+
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+
+# Changed whenever the way plans are digested changes, so old journals
+# aren't trusted
+JOURNAL_VERSION = 1
+
+COMPLETED = ("updated", "unchanged")
+
+
+def plan_digest(plan, template_vars, fnregexs, sort_attrs=False, history=False):
+    """
+    Return a digest of a resolved AttributePlan, the template variables
+    (before any per-file variables are set) and filename regexs it is
+    rendered with, and the options that change what is written. A history
+    entry changes every run, so only whether there is one is included
+    """
+    attributes = [
+        (var, attr, value.source if value.template is not None else value.value)
+        for var, attr, value in plan.attributes()
+    ]
+    spec = {
+        "version": JOURNAL_VERSION,
+        "rename": plan.rename,
+        "has_global": plan.has_global,
+        "attributes": attributes,
+        "template_vars": template_vars,
+        "fnregex": list(fnregexs),
+        "sort_attrs": sort_attrs,
+        "history": bool(history),
+    }
+    encoded = json.dumps(spec, sort_keys=True, default=repr).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def file_state(fname):
+    """
+    Return the modification time and size of fname, or None if it can't be
+    stat'ed
+    """
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+class Journal:
+    """
+    An append-only journal of processed files
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.entries = {}
+        self.file = None
+
+    def load(self):
+        """
+        Read the last entry for each file from an existing journal
+        """
+        self.entries = {}
+        try:
+            f = open(self.path, "r")
+        except FileNotFoundError:
+            return self.entries
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry["file"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    # Incomplete last line from a run that was killed
+                    continue
+        return self.entries
+
+    def open(self):
+        if self.file is None:
+            self.file = open(self.path, "a")
+            # Start on a new line if the last one was left incomplete
+            if self.file.tell() > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self.file.write("\n")
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, fname, status, plan, error=None):
+        """
+        Append an entry for fname, flushed straight away so it survives the
+        process being killed
+        """
+        entry = {
+            "file": os.path.abspath(fname),
+            "status": status,
+            "plan": plan,
+            **(file_state(fname) or {}),
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def is_complete(self, fname, plan):
+        """
+        True if fname was finished with plan and hasn't changed since
+        """
+        entry = self.entries.get(os.path.abspath(fname))
+        if entry is None or entry["status"] not in COMPLETED or entry.get("plan") != plan:
+            return False
+        state = file_state(fname)
+        return state is not None and all(entry.get(key) == value for key, value in state.items())
+
+    def pending(self, fnames, plan, counts):
+        """
+        Yield the files in fnames that aren't complete, counting the others
+        as "skipped" in counts
+        """
+        for fname in fnames:
+            if self.is_complete(fname, plan):
+                counts["skipped"] += 1
+            else:
+                yield fname
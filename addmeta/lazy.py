@@ -0,0 +1,68 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Lazily imported modules, so `addmeta --help` and runs that don't need a
+dependency don't pay the time to import it.
+
+    nc = lazy_import("netCDF4")
+
+returns a stand-in that imports netCDF4 on first attribute access and then
+passes attribute lookups on to it. Names that must exist at import time,
+such as base classes, can't be taken from a lazy module without loading it.
+"""
+
+import importlib
+import importlib.util
+import sys
+
+
+class LazyModule:
+    """
+    A module that is imported on first attribute access. Nothing is added
+    to sys.modules until then, so other imports of the module, or its
+    submodules, are unaffected
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError(f"can't set {attr!r} on lazily imported module {self._name!r}")
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return a LazyModule for the top level module name, or the module itself
+    if it has already been imported. Raises ModuleNotFoundError if it isn't
+    installed
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+
+    return LazyModule(name)
@@ -0,0 +1,160 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Plans of the meta data to add to each file, written by `addmeta plan` and
+applied by `addmeta apply`.
+
+`addmeta plan` does everything that doesn't need the files to be opened:
+compiling the meta data, matching filename regexs, stat'ing files and
+rendering templates. The plan is JSON lines, a header followed by one entry
+per file:
+
+    {"addmeta_plan": 1, "addmeta": version, "created": ...,
+     "rename": {"variables": {...}, "dimensions": {...}},
+     "variables": [names], "has_global": true, "sort_attrs": false,
+     "history": entry or null}
+    {"file": path, "variables": {var: {attr: value}}, "global": {attr: value},
+     "skipped": [[var, message]], "state": {"mtime_ns": ..., "size": ...}}
+
+Attribute values are as they will be written, null to delete an attribute.
+Attributes are rendered for every variable in the meta data, and those a
+file doesn't have are left out when it is opened, after renaming. skipped
+lists the attributes that couldn't be rendered, for undefined template
+variables. If any attribute uses the file's stat the state of the file is
+recorded, and a file that has changed since it was planned is warned about,
+as attributes from its size or modification time may be out of date.
+
+A plan is written to a temporary file and renamed once it is complete, so
+a plan that exists is never partial.
+"""
+
+from datetime import datetime, timezone
+import json
+import os
+
+# Changed whenever the contents of a plan change incompatibly
+PLAN_VERSION = 1
+
+# Types of attribute values that can be stored in a plan
+VALUE_TYPES = (str, int, float, bool, type(None))
+
+
+class PlanError(Exception):
+    """
+    The file isn't a plan this version of addmeta can read, or a value can't
+    be stored in one
+    """
+
+
+def plan_header(plan, sort_attrs=False, history=None, addmeta_version=None):
+    """
+    Return the header of a plan for a resolved AttributePlan
+    """
+    return {
+        "addmeta_plan": PLAN_VERSION,
+        "addmeta": addmeta_version,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rename": plan.rename,
+        "variables": list(plan.variables),
+        "has_global": plan.has_global,
+        "sort_attrs": sort_attrs,
+        "history": history,
+    }
+
+def check_values(attr_dict, var=None):
+    """
+    Raise PlanError if any rendered value in attr_dict can't be stored in
+    a plan
+    """
+    for attr, value in attr_dict.items():
+        if not isinstance(value, VALUE_TYPES):
+            attr_name = f"{var}:{attr}" if var else attr
+            raise PlanError(f"Value of attribute '{attr_name}' can't be stored in a plan: {value!r}")
+
+def plan_entry(fname, attributes, skipped=(), state=None):
+    """
+    Return the plan entry for a file with rendered attributes, as returned
+    by AttributePlan.render. The path is made absolute, so the plan can be
+    applied from any directory
+    """
+    for var, attr_dict in attributes["variables"].items():
+        check_values(attr_dict, var)
+    check_values(attributes["global"])
+
+    entry = {"file": os.path.abspath(fname), "variables": attributes["variables"], "global": attributes["global"]}
+    if skipped:
+        entry["skipped"] = [list(skip) for skip in skipped]
+    if state is not None:
+        entry["state"] = state
+    return entry
+
+
+class PlanWriter:
+    """
+    Write a plan, one entry at a time. The plan is only created if the
+    context exits without an exception
+    """
+
+    def __init__(self, path, header):
+        self.path = os.fspath(path)
+        self.header = header
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(f"{self.path}.tmp", "w")
+        self.write(self.header)
+        return self
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+
+    def __exit__(self, exc_type, *exc):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.file.name, self.path)
+        else:
+            os.remove(self.file.name)
+
+
+def read_plan(path):
+    """
+    Read the header of a plan, returning it and a generator of the entries
+    for each file. The generator raises PlanError, with its line number, at
+    an entry that isn't valid
+    """
+    f = open(path, "r")
+    try:
+        header = json.loads(f.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or "addmeta_plan" not in header:
+        f.close()
+        raise PlanError(f"{path} is not an addmeta plan")
+    if header["addmeta_plan"] != PLAN_VERSION:
+        f.close()
+        raise PlanError(f"{path} is a version {header['addmeta_plan']} plan, this version of addmeta reads version {PLAN_VERSION}")
+
+    def entries():
+        with f:
+            for number, line in enumerate(f, start=2):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if not isinstance(entry, dict) or "file" not in entry:
+                    raise PlanError(f"{path} is corrupt, line {number} is not a valid plan entry")
+                yield entry
+
+    return header, entries()
@@ -0,0 +1,192 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Schedulers deciding the order files are processed in, and how many files
+sharing a storage resource are processed at once (addmeta --schedule).
+
+A scheduler has an order(files) method returning the files in the order
+they should be started, and a group(fname) method returning the resource a
+file uses, by default its directory. With max_per_group set, no more than
+that many files of a group are processed at once by parallel jobs, and
+files from other groups are started instead. Schedulers are registered by
+name in SCHEDULERS, so a policy for other resources, such as the Lustre
+OSTs a file is striped over, can be added by subclassing Scheduler.
+
+input (the default) keeps the order the files were given, and is the only
+scheduler that processes files as they arrive. The others read the whole
+list first.
+
+directory processes the files in each directory together, directories in
+the order they were first seen.
+
+size processes the largest files first, so the slowest files are started
+early rather than being left to run on their own at the end.
+
+fnregex processes the files whose filename regexs (--fnregex) match the
+same variables together, such as all the files of one frequency, groups in
+the order they were first seen.
+"""
+
+from collections import Counter, deque
+import os
+
+from .fnregex import FilenameRegexs
+
+SCHEDULERS = {}
+
+
+def register_scheduler(name, scheduler):
+    """
+    Register a Scheduler subclass by name
+    """
+    SCHEDULERS[name] = scheduler
+
+def make_scheduler(name="input", max_per_group=None, fnregexs=()):
+    """
+    Return an instance of the named scheduler. fnregexs are the filename
+    regexs, for schedulers that group files by them
+    """
+    return SCHEDULERS[name](max_per_group=max_per_group, fnregexs=fnregexs)
+
+def file_size(fname):
+    """
+    Size of fname, from the stat cached by walk_files if it found it, or 0
+    if it can't be stat'ed so problems are reported in order
+    """
+    try:
+        return fname.stat().st_size if hasattr(fname, "stat") else os.stat(fname).st_size
+    except OSError:
+        return 0
+
+
+class Scheduler:
+    """
+    Process files in the order given, grouped by directory for max_per_group
+    """
+
+    def __init__(self, max_per_group=None, fnregexs=()):
+        self.max_per_group = max_per_group
+        self.fnregexs = fnregexs
+
+    def order(self, files):
+        return files
+
+    def group(self, fname):
+        return os.path.dirname(os.path.abspath(fname))
+
+
+class DirectoryScheduler(Scheduler):
+    """
+    Process the files in each directory together
+    """
+
+    def order(self, files):
+        groups = {}
+        for fname in files:
+            groups.setdefault(self.group(fname), []).append(fname)
+        return [fname for group in groups.values() for fname in group]
+
+
+class SizeScheduler(Scheduler):
+    """
+    Process the largest files first
+    """
+
+    def order(self, files):
+        # Stable, so files of the same size keep their order
+        return sorted(files, key=file_size, reverse=True)
+
+
+class FilenameRegexScheduler(Scheduler):
+    """
+    Process the files whose filename regexs match the same variables
+    together
+    """
+
+    def order(self, files):
+        groups = {}
+        for fname, variables in FilenameRegexs(self.fnregexs).match_all(files):
+            groups.setdefault(tuple(sorted(variables.items())), []).append(fname)
+        return [fname for group in groups.values() for fname in group]
+
+
+register_scheduler("input", Scheduler)
+register_scheduler("directory", DirectoryScheduler)
+register_scheduler("size", SizeScheduler)
+register_scheduler("fnregex", FilenameRegexScheduler)
+
+
+def map_scheduled(executor, fn, items, scheduler, window=1, controller=None):
+    """
+    Call fn in executor with each item from items as a single item list,
+    and yield each item and its result in the order they were started, as
+    map_bounded does. No more than scheduler.max_per_group items of a group
+    are started until the results of earlier ones have been yielded. Items
+    held back are started as soon as there is room, up to window of them,
+    and later items of other groups are started in the meantime.
+
+    If a ConcurrencyController is given its limit is used as the window,
+    and it can delay starting each item
+    """
+    items = iter(items)
+    limit = scheduler.max_per_group
+    running = Counter()
+    pending = deque()
+    waiting = deque()
+    exhausted = False
+
+    def has_room(group):
+        return limit is None or running[group] < limit
+
+    def size():
+        return controller.limit if controller is not None else window
+
+    def start(item, group):
+        if controller is not None:
+            controller.wait()
+        running[group] += 1
+        pending.append((item, group, executor.submit(fn, [item])))
+
+    def fill():
+        nonlocal exhausted
+        # Items that were held back go first
+        for _ in range(len(waiting)):
+            if len(pending) >= size():
+                return
+            item, group = waiting.popleft()
+            if has_room(group):
+                start(item, group)
+            else:
+                waiting.append((item, group))
+
+        while len(pending) < size() and len(waiting) < size() and not exhausted:
+            try:
+                item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            group = scheduler.group(item)
+            if has_room(group):
+                start(item, group)
+            else:
+                waiting.append((item, group))
+
+    fill()
+    while pending:
+        item, group, future = pending.popleft()
+        results = future.result()
+        running[group] -= 1
+        fill()
+        yield item, results[0]
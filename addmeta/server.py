@@ -0,0 +1,434 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+A persistent addmeta process that accepts jobs over a Unix domain socket,
+so scripts that call addmeta many times don't pay for interpreter startup,
+imports and reading the meta data every time.
+
+    addmeta serve --profile ocean=ocean/metadata.args &
+    addmeta submit --profile ocean output/ocean_*.nc
+
+A profile is a cmdlineargs file (see addmeta -c) giving the meta data,
+data files, bundle, filename regexs and options to apply. Its meta data is
+compiled once, as the command line does, and recompiled when the
+cmdlineargs file or any of the files it names change. Options that choose
+the files or how a run is carried out, which the server can't honour, are
+refused. A client can also name a cmdlineargs file that wasn't given to the
+server as the profile.
+
+The protocol is one JSON object per line. A client sends a single request,
+{"profile": name, "files": [...], "verbose": bool, "argv": [...]}, and the
+server replies with one line per file, {"file", "status", "output",
+"warnings", "error"}, as each is processed, then {"done": true, "counts"}.
+Processing stops at the first file that fails, as with the command line.
+{"command": "status"} and {"command": "shutdown"} are also accepted.
+
+Requests are handled one at a time, as neither netCDF4 nor the redirected
+output are thread safe.
+"""
+
+import argparse
+import copy
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+
+from addmeta import AttributePlan, capture_process_file, format_counts
+from addmeta.cli import build_history, collect_metafiles, load_meta, parse_args, read_cmdlineargs, yaml_reading
+
+# Options a profile can't use, as the files come from each request and are
+# processed one at a time
+UNSUPPORTED_OPTIONS = (
+    "cmdlineargs", "files", "files_from", "null", "recursive", "include", "exclude", "scan_threads",
+    "jobs", "prefetch", "schedule", "max_per_directory", "adaptive", "max_rate", "shard", "shard_by",
+    "list_files", "header_report", "journal", "resume", "keep_going", "profile", "profile_json",
+    "profile_dump",
+)
+
+
+def default_socket():
+    """
+    Socket used if none is given, $ADDMETA_SOCKET or one per user in the
+    temporary directory
+    """
+    return os.environ.get(
+        "ADDMETA_SOCKET", os.path.join(tempfile.gettempdir(), f"addmeta-{os.getuid()}.sock")
+    )
+
+def file_signature(fname):
+    """
+    Return the modification time and size of fname, or None if it doesn't
+    exist
+    """
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ProfileError(Exception):
+    """
+    A profile can't be loaded
+    """
+
+
+def check_options(args, cmdlinefile):
+    """
+    Raise ProfileError for any option in args a profile can't use
+    """
+    _, defaults = parse_args([])
+    refused = [
+        "netCDF files" if dest == "files" else "--" + dest.replace("_", "-")
+        for dest in UNSUPPORTED_OPTIONS
+        if getattr(args, dest) != getattr(defaults, dest)
+    ]
+    if refused:
+        raise ProfileError(f"{cmdlinefile}: {', '.join(refused)} can't be used in a profile")
+
+
+class Profile:
+    """
+    The options and compiled meta data from a cmdlineargs file
+    """
+
+    def __init__(self, name, cmdlinefile):
+        self.name = name
+        self.cmdlinefile = Path(cmdlinefile).resolve()
+        self.signature = None
+        self.loads = 0
+
+    def sources(self):
+        """
+        The cmdlineargs file and all the files it names that the compiled
+        meta data depends on
+        """
+        return [
+            self.cmdlinefile,
+            *(self.args.metalist or []),
+            *self.metafiles,
+            *(self.args.datafiles or []),
+            *([self.args.bundle] if self.args.bundle is not None else []),
+        ]
+
+    def current_signature(self):
+        return tuple(file_signature(fname) for fname in self.sources())
+
+    def load(self):
+        """
+        Read the cmdlineargs file and compile its meta data, as the command
+        line does. Raises ProfileError if it can't be loaded
+        """
+        self.signature = None
+        # Taken before each file is read, so a change made while loading
+        # isn't missed
+        cmdline_signature = file_signature(self.cmdlinefile)
+        try:
+            self.args = read_cmdlineargs(self.cmdlinefile)
+        except SystemExit:
+            raise ProfileError(f"{self.cmdlinefile}: invalid arguments")
+        check_options(self.args, self.cmdlinefile)
+        self.args.verbose = False
+        self.metafiles = collect_metafiles(self.args)
+        signature = (cmdline_signature, *self.current_signature()[1:])
+
+        try:
+            with yaml_reading(self.args):
+                metadata, kwdata, self.fnregexs = load_meta(self.args)
+        except SystemExit as e:
+            # The command line's errors exit, which mustn't stop the server
+            raise ProfileError(f"{self.cmdlinefile}: {str(e.code).removeprefix('Error: ')}")
+
+        self.template_vars = copy.deepcopy(kwdata)
+        self.plan = AttributePlan(metadata).resolve(self.template_vars)
+        self.signature = signature
+        self.loads += 1
+
+    def refresh(self):
+        """
+        Load the profile if it hasn't been, or any of its files have changed.
+        Returns True if it was loaded
+        """
+        if self.signature is not None and self.current_signature() == self.signature:
+            return False
+        self.load()
+        return True
+
+    def options(self, files, verbose=False, argv=None):
+        """
+        The keyword arguments to process_file for a request
+        """
+        args = self.args
+        history = build_history(files, now=args.now, argv=argv) if args.update_history else None
+        return dict(
+            sort_attrs=args.sort,
+            history=history,
+            verbose=verbose,
+            skip_unchanged=args.skip_unchanged,
+            now=args.now,
+            engine=args.engine or "netcdf4",
+            header_pad=args.header_pad or 0,
+        )
+
+    def status(self):
+        return {"cmdlineargs": str(self.cmdlinefile), "loads": self.loads}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    # Requests are handled one at a time, so a client that connects and
+    # doesn't send a request times out rather than holding up the server
+    timeout = 30
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            line = self.rfile.readline()
+        except socket.timeout:
+            # Not yet an alias of TimeoutError before python 3.10
+            self.send({"error": f"no request received within {self.timeout} s"})
+            return
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            self.send({"error": f"invalid request: {e}"})
+            return
+
+        command = request.get("command", "process")
+        if command == "status":
+            self.send({name: profile.status() for name, profile in self.server.profiles.items()})
+        elif command == "shutdown":
+            self.send({"done": True})
+            self.server.stopping = True
+        elif command == "process":
+            self.process(request)
+        else:
+            self.send({"error": f"unknown command: {command}"})
+
+    def process(self, request):
+        try:
+            profile = self.server.profile(request["profile"])
+            reloaded = profile.refresh()
+        except Exception as e:
+            self.send({"error": f"{type(e).__name__}: {e}"})
+            return
+
+        files = request.get("files", [])
+        verbose = request.get("verbose", False)
+        options = profile.options(files, verbose=verbose, argv=request.get("argv"))
+        template_vars = dict(profile.template_vars)
+        counts = {"updated": 0, "unchanged": 0, "failed": 0}
+
+        if verbose and reloaded:
+            self.send({"output": f"Loaded profile {profile.name} from {profile.cmdlinefile}\n"})
+
+        for fname in files:
+            output, caught, status, error, _ = capture_process_file(
+                fname, profile.plan, template_vars, profile.fnregexs, options
+            )
+            result = {
+                "file": fname,
+                "status": "failed" if error is not None else status,
+                "output": output,
+                "warnings": [message for message, _ in caught],
+            }
+            if error is not None:
+                result["error"] = f"{type(error).__name__}: {error}"
+            counts[result["status"]] += 1
+            self.send(result)
+            if error is not None:
+                break
+
+        self.send({"done": True, "counts": counts})
+
+
+class AddmetaServer(socketserver.UnixStreamServer):
+    """
+    Serve requests on a Unix domain socket until a shutdown request
+    """
+
+    def __init__(self, socket_path, profiles=None):
+        self.socket_path = str(socket_path)
+        self.profiles = {name: Profile(name, fname) for name, fname in (profiles or {}).items()}
+        self.stopping = False
+        remove_stale_socket(self.socket_path)
+        # Only the user running the server can connect
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(self.socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def profile(self, name):
+        """
+        Return the named profile, or one for the cmdlineargs file name
+        """
+        if name not in self.profiles:
+            if not os.path.isfile(name):
+                raise KeyError(f"no profile named {name}")
+            self.profiles[name] = Profile(name, name)
+        return self.profiles[name]
+
+    def serve(self):
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+def remove_stale_socket(socket_path):
+    """
+    Remove a socket left behind by a server that didn't exit cleanly. Raises
+    RuntimeError if a server is still listening on it, or if it isn't a
+    socket, so nothing else is ever removed
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+        else:
+            raise RuntimeError(f"an addmeta server is already listening on {socket_path}")
+
+def request(message, socket_path=None):
+    """
+    Send a request to the server and yield each message in the reply
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path or default_socket()))
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as reply:
+            for line in reply:
+                yield json.loads(line)
+
+def submit(files, profile, socket_path=None, verbose=False, argv=None):
+    """
+    Send files to the server to be processed with the named profile,
+    printing the output as each file is done. Returns the counts of files
+    "updated", "unchanged" and "failed"
+    """
+    if os.path.isfile(profile):
+        # A cmdlineargs file, which the server may not be running in the same directory as
+        profile = os.path.abspath(profile)
+    message = {
+        "profile": profile,
+        "files": [os.path.abspath(fname) for fname in files],
+        "verbose": verbose,
+        "argv": sys.argv if argv is None else argv,
+    }
+    counts = {"updated": 0, "unchanged": 0, "failed": 0}
+    for result in request(message, socket_path):
+        if "error" in result and "file" not in result:
+            raise RuntimeError(f"addmeta server: {result['error']}")
+        print(result.get("output", ""), end="")
+        for warning in result.get("warnings", []):
+            print(f"Warning: {warning}", file=sys.stderr)
+        if "error" in result:
+            print(f"Error processing {result['file']}: {result['error']}", file=sys.stderr)
+        if result.get("done"):
+            counts = result["counts"]
+    if verbose:
+        print(format_counts(counts))
+    return counts
+
+def parse_profiles(values):
+    profiles = {}
+    for value in values:
+        name, sep, fname = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Invalid profile: {value}. Expected format: name=cmdlineargs")
+        profiles[name] = fname
+    return profiles
+
+def serve_main(args):
+    """
+    addmeta serve: run the server in the foreground
+    """
+    parser = argparse.ArgumentParser(prog="addmeta serve", description="Process addmeta jobs sent to a Unix domain socket")
+    parser.add_argument("--socket", help="Path of the socket (default: $ADDMETA_SOCKET or one per user in the temporary directory)", default=default_socket())
+    parser.add_argument("-p", "--profile", help="Named profile given as name=cmdlineargs file, can be repeated", default=[], action='append')
+    parsed = parser.parse_args(args)
+
+    try:
+        profiles = parse_profiles(parsed.profile)
+        server = AddmetaServer(parsed.socket, profiles)
+    except (argparse.ArgumentTypeError, RuntimeError) as e:
+        sys.exit(f"Error: {e}")
+
+    # Load the profiles now, so errors are reported at startup
+    try:
+        for profile in server.profiles.values():
+            profile.refresh()
+    except ProfileError as e:
+        server.server_close()
+        os.unlink(server.socket_path)
+        sys.exit(f"Error: {e}")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"addmeta server listening on {parsed.socket}", flush=True)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+def submit_main(args):
+    """
+    addmeta submit: the client
+    """
+    parser = argparse.ArgumentParser(prog="addmeta submit", description="Send netCDF files to an addmeta server")
+    parser.add_argument("--socket", help="Path of the socket (default: $ADDMETA_SOCKET or one per user in the temporary directory)", default=default_socket())
+    parser.add_argument("-p", "--profile", help="Name of the profile, or a cmdlineargs file, to apply")
+    parser.add_argument("--status", help="Print the profiles the server has loaded", action="store_true")
+    parser.add_argument("--shutdown", help="Stop the server", action="store_true")
+    parser.add_argument("-v", "--verbose", help="Verbose output", action='store_true')
+    parser.add_argument("files", help="netCDF files", nargs='*')
+    parsed = parser.parse_args(args)
+
+    try:
+        if parsed.status or parsed.shutdown:
+            for reply in request({"command": "status" if parsed.status else "shutdown"}, parsed.socket):
+                if parsed.status:
+                    print(json.dumps(reply, indent=2))
+            return
+
+        if parsed.profile is None:
+            parser.error("a profile is required")
+
+        counts = submit(parsed.files, parsed.profile, parsed.socket, verbose=parsed.verbose)
+    except (OSError, RuntimeError) as e:
+        sys.exit(f"Error: {e}")
+
+    if counts["failed"]:
+        sys.exit(1)
@@ -0,0 +1,125 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Dividing the files to process between independent jobs (addmeta --shard
+INDEX/COUNT), so COUNT jobs, for example on different nodes, each given the
+same files and a different INDEX from 0 to COUNT-1, process every file
+exactly once.
+
+Shards are chosen by one of the methods in SHARDERS:
+
+hash (the default) puts each file in a shard chosen from a SHA-256 hash of
+its absolute path. It doesn't depend on anything but the path, so the files
+are filtered as they arrive and a file stays in the same shard whatever
+other files are given, in whatever order. Shards are balanced in the number
+of files, on average.
+
+size balances the total size of the shards: the files are taken largest
+first, each added to the shard with the smallest total so far. It reads the
+whole list of files first, and every job must see the same sizes, so the
+shards should be listed before any job changes a file (addmeta --list-files)
+and each job given its list with --files-from.
+
+Both keep the files of a shard in the order they were given.
+"""
+
+import argparse
+import hashlib
+import heapq
+import os
+
+from .schedule import file_size
+
+SHARDERS = {}
+
+
+def register_sharder(name, sharder):
+    """
+    Register a function sharder(files, index, count) returning the files in
+    shard index of count
+    """
+    SHARDERS[name] = sharder
+
+def parse_shard(value):
+    """
+    Parse INDEX/COUNT, for use as an argparse type
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard: {value}. Expected INDEX/COUNT, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Invalid shard: {value}. INDEX must be from 0 to COUNT-1")
+    return index, count
+
+def shard_key(fname):
+    """
+    The normalised absolute path a file's shard is decided by
+    """
+    return os.path.abspath(os.fspath(fname))
+
+def path_shard(fname, count):
+    """
+    Shard of count that fname is in when sharding by hash
+    """
+    digest = hashlib.sha256(os.fsencode(shard_key(fname))).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+def hash_shard(files, index, count):
+    """
+    Yield the files in shard index of count by hash of their path
+    """
+    for fname in files:
+        if path_shard(fname, count) == index:
+            yield fname
+
+def size_shards(files, count):
+    """
+    Return the shard of count each of files is in, balancing the total size
+    of the shards. Ties are broken by path, so the result doesn't depend on
+    the order of files
+    """
+    files = list(files)
+    sizes = [file_size(fname) for fname in files]
+    sized = sorted(range(len(files)), key=lambda n: (-sizes[n], shard_key(files[n])))
+    # (total size, shard) of every shard, smallest first
+    totals = [(0, shard) for shard in range(count)]
+    shards = [None] * len(files)
+    for n in sized:
+        total, shard = heapq.heappop(totals)
+        shards[n] = shard
+        heapq.heappush(totals, (total + sizes[n], shard))
+    return files, shards
+
+def size_shard(files, index, count):
+    """
+    Return the files in shard index of count, balancing the total size of
+    the shards
+    """
+    files, shards = size_shards(files, count)
+    return [fname for fname, shard in zip(files, shards) if shard == index]
+
+
+register_sharder("hash", hash_shard)
+register_sharder("size", size_shard)
+
+
+def shard_files(files, shard, method="hash"):
+    """
+    Return the files in shard, an (INDEX, COUNT) tuple as returned by
+    parse_shard, divided by the named method
+    """
+    index, count = shard
+    return SHARDERS[method](files, index, count)
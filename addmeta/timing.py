@@ -0,0 +1,170 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Time spent in each phase of a run, per file and in total.
+
+Code wraps each phase in `with timed("phase"):`, and each file in
+`with timed_file(fname):`. Until start_timing() is called these return a
+shared context manager that does nothing, so the cost when timing is off is
+a function call and a global lookup. The file phases are being attributed to
+is kept per thread, so files can be prepared in other threads (see
+prefetch_files).
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import threading
+import time
+
+_timings = None
+
+_NOT_TIMING = nullcontext()
+
+
+class Timings:
+    """
+    Accumulated time and number of calls of each phase, for the run as a
+    whole (phases outside any file) and for each file
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.wall_time = None
+        self.run = {}
+        self.files = {}
+        # Decisions made while running, such as changes to the number of
+        # active workers, each a dict with a "message"
+        self.decisions = []
+        self._local = threading.local()
+
+    @property
+    def _current(self):
+        return getattr(self._local, "current", self.run)
+
+    @_current.setter
+    def _current(self, phases):
+        self._local.current = phases
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def file(self, fname, total=True):
+        """
+        Attribute phases inside the context to fname, and time them as its
+        total unless total is False
+        """
+        previous, self._current = self._current, self.files.setdefault(str(fname), {})
+        try:
+            with self.phase("total") if total else nullcontext():
+                yield
+        finally:
+            self._current = previous
+
+    def add(self, name, elapsed, calls=1):
+        phase = self._current.setdefault(name, {"time": 0., "calls": 0})
+        phase["time"] += elapsed
+        phase["calls"] += calls
+
+    def totals(self):
+        """
+        Return the time and calls of each phase summed over the run and all
+        files, in the order phases were first seen
+        """
+        totals = {}
+        for phases in [self.run, *self.files.values()]:
+            for name, phase in phases.items():
+                total = totals.setdefault(name, {"time": 0., "calls": 0})
+                total["time"] += phase["time"]
+                total["calls"] += phase["calls"]
+
+        # The per file total is reported separately
+        total = totals.pop("total", None)
+        if total is not None:
+            totals["per file total"] = total
+        return totals
+
+    def stop(self):
+        self.wall_time = time.perf_counter() - self.start
+
+    def as_dict(self):
+        return {
+            "wall_time": self.wall_time,
+            "files": len(self.files),
+            "phases": self.totals(),
+            "decisions": self.decisions,
+            "per_file": self.files,
+        }
+
+    def report(self):
+        """
+        Return a summary table of the time spent in each phase
+        """
+        wall_time = self.wall_time or (time.perf_counter() - self.start)
+        lines = [f"{'phase':<20}{'calls':>10}{'total (s)':>12}{'mean (ms)':>12}{'% of run':>10}"]
+        for name, phase in self.totals().items():
+            mean = 1000 * phase["time"] / phase["calls"] if phase["calls"] else 0.
+            percent = 100 * phase["time"] / wall_time if wall_time else 0.
+            lines.append(f"{name:<20}{phase['calls']:>10}{phase['time']:>12.3f}{mean:>12.3f}{percent:>10.1f}")
+        lines.append(f"{len(self.files)} file(s) in {wall_time:.3f} s")
+        lines.extend(decision["message"] for decision in self.decisions)
+        return "\n".join(lines)
+
+    def write_json(self, fname):
+        with open(fname, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def start_timing():
+    """
+    Start recording timings and return the Timings object
+    """
+    global _timings
+    _timings = Timings()
+    return _timings
+
+def stop_timing():
+    """
+    Stop recording timings and return them, or None if they weren't started
+    """
+    global _timings
+    timings, _timings = _timings, None
+    if timings is not None:
+        timings.stop()
+    return timings
+
+def current_timings():
+    return _timings
+
+def timed(name):
+    """
+    Context manager timing the named phase
+    """
+    if _timings is None:
+        return _NOT_TIMING
+    return _timings.phase(name)
+
+def timed_file(fname, total=True):
+    """
+    Context manager attributing phases to fname
+    """
+    if _timings is None:
+        return _NOT_TIMING
+    return _timings.file(fname, total=total)
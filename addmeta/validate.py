@@ -1,24 +1,35 @@
 import argparse
 from urllib.parse import urlparse
-import requests
 import json
-from jsonschema import Draft202012Validator
-from netCDF4 import Dataset
 from pathlib import Path
-from referencing import Registry, Resource
 
+from .backends import BACKENDS, BackendError, open_dataset
+from .lazy import lazy_import
+from .shard import SHARDERS, parse_shard, shard_files
 
-def get_metadata_from_file(filepath):
+# Imported on first use, requests is only needed for schemas given as URLs
+jsonschema = lazy_import("jsonschema")
+referencing = lazy_import("referencing")
+requests = lazy_import("requests")
+
+
+def get_metadata_from_file(filepath, engine="netcdf4"):
     """
     Get the global and variable attributes from a netcdf file and return them
-    as a nested dictionary.
+    as a nested dictionary. engine is the storage backend used to read the
+    file, falling back to netcdf4 if it can't.
     """
     d = {"global": {}, "variables": {}}
 
     def _get_nc_attrs(nc_group):
         return {attr: nc_group.getncattr(attr) for attr in nc_group.ncattrs()}
 
-    with Dataset(filepath, "r") as ds:
+    try:
+        ds = open_dataset(filepath, "r", backend=engine)
+    except BackendError:
+        ds = open_dataset(filepath, "r")
+
+    with ds:
         d["global"] = _get_nc_attrs(ds)
 
         for v in ds.variables.keys():
@@ -43,7 +54,7 @@ def retrieve_from_filesystem_or_httpx(path_or_url):
         path = Path(path_or_url)
         contents = json.loads(path.read_text())
 
-    return Resource.from_contents(contents)
+    return referencing.Resource.from_contents(contents)
 
 
 def get_schema_validator(schema_source):
@@ -54,17 +65,17 @@ def get_schema_validator(schema_source):
     Returns the Validator for the schema
     """
     # Build the registry to resolve the refs
-    registry = Registry(retrieve=retrieve_from_filesystem_or_httpx)
+    registry = referencing.Registry(retrieve=retrieve_from_filesystem_or_httpx)
 
-    return Draft202012Validator({"$ref": schema_source}, registry=registry)
+    return jsonschema.Draft202012Validator({"$ref": schema_source}, registry=registry)
 
 
-def validate_file(filepath, schema_validator):
+def validate_file(filepath, schema_validator, engine="netcdf4"):
     # Validate will raise an ValidationError if filepath is non-compliant
-    schema_validator.validate(get_metadata_from_file(filepath))
+    schema_validator.validate(get_metadata_from_file(filepath, engine=engine))
 
 
-def parse_args():
+def parse_args(args=None):
     parser = argparse.ArgumentParser(
         prog="validate",
         description="Validates a list of netCDF files against a json-schema. "
@@ -78,22 +89,44 @@ def parse_args():
         required=True,
         help="The URL or file path of the schema to validate against.",
     )
+    parser.add_argument(
+        "--engine",
+        choices=list(BACKENDS),
+        default="netcdf4",
+        help="Storage backend used to read the files, 'h5py' only reads the attributes of netCDF4 format files.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="INDEX/COUNT",
+        help="Only validate the files in shard INDEX of COUNT, numbered from 0, divided as by addmeta --shard.",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=list(SHARDERS),
+        default="hash",
+        help="How files are divided into shards: by a hash of their path (hash, the default), or balancing the total size of each shard (size).",
+    )
     parser.add_argument("files", help="netCDF files to validate", nargs="+")
     parser.add_argument("-v", "--verbose", help="Verbose output", action="store_true")
 
-    return parser.parse_args()
+    return parser.parse_args(args)
 
 
-def main():
-    args = parse_args()
+def main(args=None):
+    args = parse_args(args)
 
     schema_validator = get_schema_validator(args.schema)
 
-    for f in args.files:
+    files = args.files
+    if args.shard is not None:
+        files = shard_files(files, args.shard, args.shard_by)
+
+    for f in files:
         if args.verbose:
             print(f"Validating {f}")
 
-        validate_file(f, schema_validator)
+        validate_file(f, schema_validator, engine=args.engine)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Finding files in directory trees (addmeta --recursive) with os.scandir.
+
+Several directories are listed at once by a pool of threads, as on a
+parallel filesystem most of the time listing a directory is spent waiting
+on the metadata server. Files are still yielded in a fixed order, depth
+first with the entries of each directory sorted by name, as soon as the
+directories containing them have been listed.
+
+Files are yielded as ScannedPath strings, which keep the os.DirEntry they
+were found with. The DirEntry caches its stat result, so get_file_metadata
+uses it rather than stat'ing the file again, and with stat=True the files
+are stat'ed by the listing threads.
+"""
+
+from collections import deque
+from fnmatch import fnmatchcase
+from itertools import islice
+import os
+
+
+class ScannedPath(str):
+    """
+    The path of a file found by walk_files, with the os.DirEntry for it
+    """
+
+    def __new__(cls, entry):
+        path = super().__new__(cls, entry.path)
+        path.entry = entry
+        return path
+
+    def stat(self):
+        """
+        The stat result of the file, cached by the DirEntry
+        """
+        return self.entry.stat()
+
+    def __reduce__(self):
+        # A DirEntry can't be pickled, so send a plain path to worker processes
+        return (str, (str(self),))
+
+
+def matches(name, patterns):
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+def scan_directory(path, include, exclude, stat=False):
+    """
+    List a directory, returning the files whose names match one of the
+    include patterns, and the subdirectories, leaving out any entry whose
+    name matches an exclude pattern. Symbolic links to directories are not
+    followed
+    """
+    files, directories = [], []
+    with os.scandir(path) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+
+    for entry in entries:
+        if matches(entry.name, exclude):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            directories.append(entry.path)
+        elif entry.is_file() and matches(entry.name, include):
+            if stat:
+                entry.stat()
+            files.append(ScannedPath(entry))
+
+    return files, directories
+
+def walk_files(roots, include=("*.nc",), exclude=(), threads=4, stat=False):
+    """
+    Yield the files below each of the root directories whose names match an
+    include pattern and not an exclude pattern. Directories whose names match
+    an exclude pattern are skipped. Up to threads directories are listed at
+    once. If stat is True the files are stat'ed as they are found
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    include, exclude = tuple(include), tuple(exclude)
+    # Directories listed ahead of the one being yielded, bounding the number
+    # of listings held in memory
+    window = 4 * max(threads, 1)
+
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+        # [path, future] of each directory still to be yielded, in depth
+        # first order, so the order doesn't depend on which listing finishes
+        # first. Only the first window of them are being listed
+        pending = deque([os.fspath(root), None] for root in roots)
+        try:
+            while pending:
+                for item in islice(pending, window):
+                    if item[1] is None:
+                        item[1] = executor.submit(scan_directory, item[0], include, exclude, stat)
+                _, future = pending.popleft()
+                files, directories = future.result()
+                pending.extendleft([directory, None] for directory in reversed(directories))
+                yield from files
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
@@ -0,0 +1,281 @@
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Parsing YAML files, with the libyaml C loader if requested, and an on-disk
+cache of parsed files.
+
+Metadata files are often large and identical across thousands of
+invocations. Once start_yaml_cache() is called every file parsed with
+parse_yaml() is stored in the cache directory, keyed by its path,
+modification time and size (or, with key="content", by a hash of its
+contents), and later reads of an unchanged file load it instead of parsing
+it. When the directory grows beyond max_size the least recently used entries
+are removed.
+
+Entries are JSON, with the types YAML has that JSON doesn't (mappings with
+keys that aren't strings, dates, timestamps, binary and sets) tagged, so
+loading an entry never runs code. Even so, an entry decides the meta data
+written to files, so the cache directory is created only accessible by the
+user, and a directory or entry that isn't owned by the user, or can be
+written by anyone else, isn't used.
+"""
+
+import base64
+from datetime import date, datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import stat
+import tempfile
+import time
+
+from .lazy import lazy_import
+
+yaml = lazy_import("yaml")
+
+# Changed whenever the format of cache entries changes
+CACHE_VERSION = 2
+
+KEYS = ("mtime", "content")
+
+_cache = None
+_libyaml = False
+
+
+def use_libyaml(enable=True):
+    """
+    Parse with the libyaml C loader, if PyYAML was built with it. Returns
+    True if it will be used
+    """
+    global _libyaml
+    _libyaml = enable and hasattr(yaml, "CSafeLoader")
+    return _libyaml
+
+def yaml_loader():
+    return yaml.CSafeLoader if _libyaml else yaml.SafeLoader
+
+class UnsafeCacheError(Exception):
+    """
+    The cache directory isn't owned by the user, or can be written by others
+    """
+
+
+def unsafe(st):
+    """
+    Return why a file with stat st can't be trusted, or None if it can
+    """
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return "is not owned by you"
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return "is writable by others"
+    return None
+
+def encode(value):
+    """
+    Return value, as parsed from YAML, in a form json can write. Mappings
+    and the types JSON doesn't have are tagged objects, so every JSON object
+    in an entry is a tag
+    """
+    if isinstance(value, dict):
+        return {"map": [[encode(key), encode(item)] for key, item in value.items()]}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"binary": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, (set, frozenset)):
+        return {"set": [encode(item) for item in value]}
+    if isinstance(value, tuple):
+        return {"tuple": [encode(item) for item in value]}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"Can't cache a {type(value).__name__}")
+
+def decode(value):
+    """
+    Return the value encoded by encode()
+    """
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    (tag, item), = value.items()
+    if tag == "map":
+        return {decode(key): decode(mapped) for key, mapped in item}
+    if tag == "datetime":
+        return datetime.fromisoformat(item)
+    if tag == "date":
+        return date.fromisoformat(item)
+    if tag == "binary":
+        return base64.b64decode(item)
+    if tag == "set":
+        return {decode(member) for member in item}
+    if tag == "tuple":
+        return tuple(decode(member) for member in item)
+    raise ValueError(f"Unknown tag in cache entry: {tag}")
+
+def parse_yaml(fname):
+    """
+    Parse a YAML file, from the cache if one has been started
+    """
+    if _cache is not None:
+        return _cache.load(fname)
+    with open(fname, 'r') as yaml_file:
+        return yaml.load(yaml_file, Loader=yaml_loader())
+
+
+class YamlCache:
+    """
+    Parsed YAML files stored in directory, up to max_size bytes in total.
+    Raises UnsafeCacheError if directory isn't owned by the user or can be
+    written by others
+    """
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024, key="mtime"):
+        if key not in KEYS:
+            raise ValueError(f"Unknown cache key {key}, must be one of {', '.join(KEYS)}")
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        reason = unsafe(self.directory.stat())
+        if reason is not None:
+            raise UnsafeCacheError(f"YAML cache directory {self.directory} {reason}")
+
+    def entry_name(self, fname):
+        """
+        Return the name of the cache entry for fname
+        """
+        if self.key == "content":
+            with open(fname, 'rb') as f:
+                identity = hashlib.sha256(f.read()).hexdigest()
+        else:
+            stat = os.stat(fname)
+            identity = f"{os.path.abspath(fname)}:{stat.st_mtime_ns}:{stat.st_size}"
+        loader = yaml_loader().__name__
+        digest = hashlib.sha256(f"{CACHE_VERSION}:{yaml.__version__}:{loader}:{identity}".encode())
+        return digest.hexdigest() + ".json"
+
+    def load(self, fname):
+        """
+        Return the parsed contents of fname, from the cache if they're there
+        """
+        entry = self.directory / self.entry_name(fname)
+
+        start = time.perf_counter()
+        try:
+            with open(entry, 'r') as f:
+                # Entries written by anyone else are ignored, and replaced
+                if unsafe(os.fstat(f.fileno())) is not None:
+                    raise ValueError(f"{entry} can't be trusted")
+                parse_time, data = json.load(f)
+            data = decode(data)
+        except (OSError, TypeError, ValueError):
+            pass
+        else:
+            self.hits += 1
+            self.saved += max(parse_time - (time.perf_counter() - start), 0.)
+            # Mark the entry as recently used, for eviction
+            os.utime(entry)
+            return data
+
+        self.misses += 1
+        start = time.perf_counter()
+        with open(fname, 'r') as yaml_file:
+            data = yaml.load(yaml_file, Loader=yaml_loader())
+        self.store(entry, [time.perf_counter() - start, data])
+
+        return data
+
+    def store(self, entry, value):
+        """
+        Write an entry atomically, so concurrent readers never see part of one,
+        then evict old entries if the cache is too big
+        """
+        try:
+            parse_time, data = value
+            contents = json.dumps([parse_time, encode(data)])
+        except TypeError:
+            # The cache is only an optimisation, so types it can't store are
+            # parsed every time
+            return
+        try:
+            # Created only readable and writable by the user
+            fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                f.write(contents)
+            os.replace(tmpname, entry)
+        except OSError:
+            # The cache is only an optimisation
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is no more than
+        max_size bytes
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.
+        return (f"YAML cache: {self.hits} hit(s), {self.misses} miss(es), "
+                f"hit rate {rate:.0f}%, saved {self.saved:.3f} s")
+
+
+def start_yaml_cache(directory, max_size=100 * 1024 * 1024, key="mtime"):
+    """
+    Cache parsed YAML files in directory and return the YamlCache
+    """
+    global _cache
+    _cache = YamlCache(directory, max_size=max_size, key=key)
+    return _cache
+
+def stop_yaml_cache():
+    """
+    Stop caching parsed YAML files and return the YamlCache, or None if it
+    wasn't started
+    """
+    global _cache
+    cache, _cache = _cache, None
+    return cache
+
+def current_yaml_cache():
+    return _cache
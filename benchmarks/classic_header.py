@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compare the time taken to apply attribute-only edits to large netCDF classic
+files with the netcdf4 engine and the classic header patching engine.
+
+    python benchmarks/classic_header.py --size-mb 1024 --attributes 200
+
+Each repeat changes the value of every attribute so both engines really
+write the file.
+"""
+
+import argparse
+from pathlib import Path
+import tempfile
+import time
+
+import netCDF4 as nc
+import numpy as np
+
+from addmeta import find_and_add_meta
+
+FORMATS = {
+    'cdf1': 'NETCDF3_CLASSIC',
+    'cdf2': 'NETCDF3_64BIT_OFFSET',
+    'cdf5': 'NETCDF3_64BIT_DATA',
+}
+
+def make_file(fname, size_mb, file_format, free):
+    """
+    Make a classic format file with a single variable of roughly size_mb,
+    with free bytes of space reserved after the header
+    """
+    nx = 1024 * 256
+    nt = max(1, size_mb * 1024 * 1024 // (nx * 4))
+    with nc.Dataset(fname, 'w', format=file_format) as ds:
+        ds.set_fill_off()
+        ds.createDimension('time', nt)
+        ds.createDimension('x', nx)
+        var = ds.createVariable('temp', 'f4', ('time', 'x'))
+        var.units = 'K'
+        # Reserve free space after the header, libnetcdf keeps the data
+        # where it is when the header later shrinks
+        ds.padding = 'x' * free
+        for t in range(nt):
+            var[t] = np.full(nx, t, dtype='f4')
+
+    with nc.Dataset(fname, 'r+') as ds:
+        ds.delncattr('padding')
+
+def make_metadata(attributes, run):
+    return {
+        'global': {f'attribute_{n:04d}': f'value {n} run {run}' for n in range(attributes)},
+        'variables': {'temp': {'long_name': f'Temperature run {run}', 'run': run}},
+    }
+
+def time_engine(engine, files, attributes, repeats, run):
+    times = []
+    for _ in range(repeats):
+        run += 1
+        start = time.perf_counter()
+        find_and_add_meta(files, make_metadata(attributes, run), {}, [], engine=engine)
+        times.append((time.perf_counter() - start) / len(files))
+    return min(times), run
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the netcdf4 and classic engines for attribute-only edits of large classic format files")
+    parser.add_argument('--size-mb', type=int, default=256, help='Size of each file in MB')
+    parser.add_argument('--files', type=int, default=4, help='Number of files')
+    parser.add_argument('--attributes', type=int, default=200, help='Number of global attributes to edit')
+    parser.add_argument('--format', choices=FORMATS, default='cdf1', help='Classic file format')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of timed repeats, the fastest is reported')
+    parser.add_argument('--dir', help='Directory for the test files (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        # Enough free space for the attributes and some growth
+        free = args.attributes * 64 + 4096
+        files = [str(Path(tmpdir) / f'file_{n}.nc') for n in range(args.files)]
+        for fname in files:
+            make_file(fname, args.size_mb, FORMATS[args.format], free)
+
+        run = 0
+        # Make sure all the attributes exist so both engines edit in place
+        find_and_add_meta(files, make_metadata(args.attributes, run), {}, [])
+
+        netcdf4_time, run = time_engine('netcdf4', files, args.attributes, args.repeats, run)
+        classic_time, run = time_engine('classic', files, args.attributes, args.repeats, run)
+
+    print(f"{args.files} x {args.size_mb} MB {args.format} files, {args.attributes} attributes")
+    print(f"{'engine':<10}{'s/file':>12}")
+    print(f"{'netcdf4':<10}{netcdf4_time:>12.4f}")
+    print(f"{'classic':<10}{classic_time:>12.4f}")
+    print(f"speed-up: {netcdf4_time / classic_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
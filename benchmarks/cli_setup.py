@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Setup time of the addmeta command line for very large numbers of files,
+everything done before the first file is opened.
+
+    python benchmarks/cli_setup.py --files 1000 10000 100000 1000000
+
+For each number of files, empty files are created and the time taken to
+parse them from the command line, from a cmdlineargs file and with
+--files-from, and to build the history entry, is measured. The growth of
+each stage with the number of files is fitted as time ~ files^exponent,
+which should be close to 1. With --max-exponent the exit status is non-zero
+if any stage grows faster, so the benchmark can be used as a regression
+check. The results are written to benchmarks/results/cli-setup-<label>.json,
+where the label defaults to the addmeta version.
+"""
+
+import argparse
+import json
+import math
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+import addmeta
+from addmeta.cli import build_history, main_parse_args, read_files_from
+
+RESULTS = Path(__file__).parent / 'results'
+
+def make_files(workdir, count):
+    names = [f'file_{n:07d}.nc' for n in range(count)]
+    for name in names:
+        (workdir / name).touch()
+    (workdir / 'meta.yaml').write_text("global:\n    Publisher: ACCESS-NRI\n")
+    (workdir / 'cmdlineargs').write_text("-m=meta.yaml\n" + "\n".join(names) + "\n")
+    (workdir / 'files').write_text("\n".join(names) + "\n")
+    return [str(workdir / name) for name in names]
+
+def stages(workdir, files):
+    metafile = str(workdir / 'meta.yaml')
+    argv = ['addmeta', '-m', metafile, '--update-history', *files]
+    return {
+        'parse argv': lambda: main_parse_args(argv[1:]),
+        'parse cmdlineargs': lambda: main_parse_args(['-c', str(workdir / 'cmdlineargs')]),
+        'files-from': lambda: sum(1 for _ in read_files_from(str(workdir / 'files'))),
+        'build_history': lambda: build_history(files, argv=argv),
+    }
+
+def time_stage(fn, repeats):
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def exponent(sizes, times):
+    """
+    Least squares slope of log(time) against log(files)
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in times]
+    xmean, ymean = sum(xs) / len(xs), sum(ys) / len(ys)
+    return (sum((x - xmean) * (y - ymean) for x, y in zip(xs, ys))
+            / sum((x - xmean) ** 2 for x in xs))
+
+def main():
+    parser = argparse.ArgumentParser(description="Command line setup time for large numbers of files")
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of files')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of times each stage is run, the fastest is kept')
+    parser.add_argument('--max-exponent', type=float, help='Exit with an error if any stage grows faster than files^MAX_EXPONENT')
+    parser.add_argument('--label', help='Name of the results file (default: the addmeta version)')
+    args = parser.parse_args()
+
+    sizes = sorted(args.files)
+    if len(sizes) < 2:
+        parser.error("at least two numbers of files are needed to measure growth")
+
+    results = {}
+    print(f"{'stage':<20}{'files':>10}{'time (s)':>12}{'per file (us)':>16}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            workdir = Path(tmpdir)
+            files = make_files(workdir, size)
+            for name, fn in stages(workdir, files).items():
+                best = time_stage(fn, args.repeats)
+                results.setdefault(name, {})[size] = best
+                print(f"{name:<20}{size:>10}{best:>12.4f}{1e6 * best / size:>16.2f}")
+
+    print()
+    print(f"{'stage':<20}{'exponent':>10}")
+    failed = []
+    for name, times in results.items():
+        results[name] = {'times': times, 'exponent': exponent(sizes, [times[size] for size in sizes])}
+        print(f"{name:<20}{results[name]['exponent']:>10.2f}")
+        if args.max_exponent is not None and results[name]['exponent'] > args.max_exponent:
+            failed.append(name)
+
+    label = args.label or addmeta.__version__
+    RESULTS.mkdir(exist_ok=True)
+    results_file = RESULTS / f'cli-setup-{label}.json'
+    results_file.write_text(json.dumps({'addmeta': addmeta.__version__, 'python': sys.version, 'results': results}, indent=1))
+    print(f"Results written to {results_file}")
+
+    if failed:
+        sys.exit(f"Setup time grows faster than files^{args.max_exponent}: {', '.join(failed)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Generate a synthetic corpus of netCDF files for benchmarking.
+
+    python benchmarks/corpus.py /scratch/corpus --files 1000 --variables 50 --format cdf2
+
+Files are named like model output, ocean.00001.1day.mean.nc, so filename
+regexes have something to extract. The parameters are recorded in
+corpus.json in the directory, and an existing corpus with the same
+parameters is reused rather than generated again.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import netCDF4 as nc
+import numpy as np
+
+FORMATS = {
+    'nc4': 'NETCDF4',
+    'nc4classic': 'NETCDF4_CLASSIC',
+    'cdf1': 'NETCDF3_CLASSIC',
+    'cdf2': 'NETCDF3_64BIT_OFFSET',
+    'cdf5': 'NETCDF3_64BIT_DATA',
+}
+
+NX = 1024
+
+def corpus_filenames(files):
+    return [f'ocean.{n:05d}.1day.mean.nc' for n in range(files)]
+
+def make_file(fname, variables, attributes, file_format, size_mb):
+    """
+    Make a file with the given number of float variables, each with
+    attributes attributes, holding roughly size_mb of data in total
+    """
+    nt = max(1, int(size_mb * 1024 * 1024 / (4 * NX * max(variables, 1))))
+    with nc.Dataset(fname, 'w', format=FORMATS[file_format]) as ds:
+        ds.set_fill_off()
+        ds.createDimension('time', nt)
+        ds.createDimension('x', NX)
+        ds.title = 'Synthetic benchmark file'
+        ds.source = 'benchmarks/corpus.py'
+        for v in range(variables):
+            var = ds.createVariable(f'var_{v:04d}', 'f4', ('time', 'x'))
+            for a in range(attributes):
+                var.setncattr(f'attribute_{a:03d}', f'value {a} of var_{v:04d}')
+            if size_mb:
+                var[:] = np.full((nt, NX), v, dtype='f4')
+
+def make_corpus(directory, files=10, variables=10, attributes=5, file_format='nc4', size_mb=0.):
+    """
+    Generate a corpus in directory, unless one with the same parameters is
+    already there. Returns the list of files
+    """
+    directory = Path(directory)
+    params = dict(files=files, variables=variables, attributes=attributes,
+                  format=file_format, size_mb=size_mb)
+    manifest = directory / 'corpus.json'
+    fnames = [str(directory / name) for name in corpus_filenames(files)]
+
+    if manifest.exists() and json.loads(manifest.read_text()) == params:
+        return fnames
+
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest.unlink(missing_ok=True)
+    for fname in fnames:
+        make_file(fname, variables, attributes, file_format, size_mb)
+    manifest.write_text(json.dumps(params))
+
+    return fnames
+
+def add_corpus_arguments(parser, files=True):
+    if files:
+        parser.add_argument('--files', type=int, default=10, help='Number of files')
+    parser.add_argument('--variables', type=int, default=10, help='Variables per file')
+    parser.add_argument('--attributes', type=int, default=5, help='Attributes per variable')
+    parser.add_argument('--format', choices=FORMATS, default='nc4', help='File format')
+    parser.add_argument('--size-mb', type=float, default=0., help='Size of the data in each file in MB')
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of netCDF files")
+    parser.add_argument('directory', help='Directory for the corpus')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    fnames = make_corpus(args.directory, args.files, args.variables, args.attributes, args.format, args.size_mb)
+    print(f"{len(fnames)} files in {args.directory}")
+
+if __name__ == '__main__':
+    main()
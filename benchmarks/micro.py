@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Micro-benchmarks of the functions called for every attribute of every file.
+
+    python benchmarks/micro.py --label before
+    ... make changes ...
+    python benchmarks/micro.py --label after --compare before
+
+Attributes are set on an in-memory FakeGroup, so the netCDF library doesn't
+affect the numbers. The inputs are fixed, and each benchmark reports the
+fastest of several repeats, in nanoseconds per call, which is the most
+reproducible measure on a shared machine. The results are written to
+benchmarks/results/micro-<label>.json, where the label defaults to the git
+revision.
+"""
+
+import argparse
+import fnmatch
+import json
+from pathlib import Path
+import platform
+import subprocess
+import timeit
+
+import addmeta
+from addmeta import (
+    CompiledAttribute,
+    FilenameRegexs,
+    array_to_csv,
+    detect_number_filter,
+    dict_merge,
+    match_filename_regex,
+    order_dict,
+    remove_update_sort_attrs,
+    set_attribute,
+)
+
+RESULTS = Path(__file__).parent / 'results'
+
+
+class FakeGroup:
+    """
+    The attribute methods of a netCDF4 Dataset or Variable, on a dict
+    """
+
+    def __init__(self, attributes):
+        self.original = dict(attributes)
+        self.attributes = dict(attributes)
+
+    def reset(self):
+        self.attributes = dict(self.original)
+
+    def ncattrs(self):
+        return list(self.attributes)
+
+    def getncattr(self, name):
+        return self.attributes[name]
+
+    def setncattr(self, name, value):
+        self.attributes[name] = value
+
+    def delncattr(self, name):
+        del self.attributes[name]
+
+
+def attributes(n):
+    return {f'Attribute_{i:04d}' if i % 2 else f'attribute_{i:04d}': f'value {i}' for i in range(n)}
+
+def bench_set_attribute(source):
+    group = FakeGroup({})
+    value = CompiledAttribute(source)
+    template_vars = {'__file__': {'name': 'ocean.00001.1day.mean.nc', 'size': '123456'}}
+    return lambda: set_attribute(group, 'attribute', value, template_vars)
+
+def bench_detect_number_filter(value):
+    return lambda: detect_number_filter(value)
+
+def bench_array_to_csv(n):
+    array = [f'keyword {i}' for i in range(n)]
+    return lambda: array_to_csv(array)
+
+def bench_dict_merge(n):
+    base = {'global': attributes(n), 'variables': {f'var_{v}': attributes(10) for v in range(10)}}
+    merge = {'global': attributes(n // 2), 'variables': {'var_0': {'units': 'K'}}}
+    return lambda: dict_merge(base, merge)
+
+def bench_order_dict(n):
+    unsorted = attributes(n)
+    return lambda: order_dict(unsorted)
+
+def bench_match_filename_regex(n):
+    regexs = [r'.*\.(?P<freq>[^.]+)\.mean\.nc$', r'^(?P<model>[^.]+)\.(?P<number>\d+)\.'] * (n // 2)
+    return lambda: match_filename_regex('ocean.00001.1day.mean.nc', regexs)
+
+def bench_filename_regexs_match(n):
+    regexs = FilenameRegexs([r'.*\.(?P<freq>[^.]+)\.mean\.nc$', r'^(?P<model>[^.]+)\.(?P<number>\d+)\.'] * (n // 2))
+    return lambda: regexs.match('ocean.00001.1day.mean.nc')
+
+def bench_remove_update_sort_attrs(n):
+    group = FakeGroup(attributes(n))
+    attr_dict = {'units': 'K', 'long_name': 'Temperature'}
+
+    def run():
+        group.reset()
+        remove_update_sort_attrs(group, attr_dict)
+    return run
+
+def bench_reset(n):
+    # The cost of resetting the group in remove_update_sort_attrs
+    group = FakeGroup(attributes(n))
+    return group.reset
+
+BENCHMARKS = {
+    'set_attribute constant': lambda: bench_set_attribute('ACCESS-NRI'),
+    'set_attribute template': lambda: bench_set_attribute('{{ __file__.name }}'),
+    'set_attribute number': lambda: bench_set_attribute('{{ __file__.size | number }}'),
+    'detect_number_filter plain': lambda: bench_detect_number_filter('ACCESS-NRI'),
+    'detect_number_filter number': lambda: bench_detect_number_filter('{{ __file__.size | number }}'),
+    'array_to_csv 10': lambda: bench_array_to_csv(10),
+    'dict_merge 100': lambda: bench_dict_merge(100),
+    'order_dict 10': lambda: bench_order_dict(10),
+    'order_dict 500': lambda: bench_order_dict(500),
+    'match_filename_regex 2': lambda: bench_match_filename_regex(2),
+    'match_filename_regex 20': lambda: bench_match_filename_regex(20),
+    'FilenameRegexs.match 2': lambda: bench_filename_regexs_match(2),
+    'FilenameRegexs.match 20': lambda: bench_filename_regexs_match(20),
+    'remove_update_sort_attrs 10': lambda: bench_remove_update_sort_attrs(10),
+    'remove_update_sort_attrs 100': lambda: bench_remove_update_sort_attrs(100),
+    'reset 100 (sort baseline)': lambda: bench_reset(100),
+}
+
+def run_benchmark(func, repeat, number=None):
+    """
+    Return the fastest time per call, in nanoseconds, of repeat runs
+    """
+    timer = timeit.Timer(func)
+    if number is None:
+        # Enough calls to take at least 0.2 s
+        number, _ = timer.autorange()
+    return 1e9 * min(timer.repeat(repeat=repeat, number=number)) / number
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the per attribute functions")
+    parser.add_argument('--filter', default='*', help='Only run benchmarks matching this glob pattern')
+    parser.add_argument('--repeat', type=int, default=7, help='Number of repeats, the fastest is reported')
+    parser.add_argument('--number', type=int, help='Calls per repeat (default: enough to take 0.2 s)')
+    parser.add_argument('--label', help='Name of the results file (default: the git revision)')
+    parser.add_argument('--compare', help='Label of earlier results to compare with')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        previous = json.loads((RESULTS / f'micro-{args.compare}.json').read_text())['results']
+
+    results = {}
+    print(f"{'benchmark':<32}{'ns/call':>12}" + (f"{'before':>12}{'ratio':>8}" if previous else ""))
+    for name, setup in BENCHMARKS.items():
+        if not fnmatch.fnmatch(name, args.filter):
+            continue
+        results[name] = run_benchmark(setup(), args.repeat, args.number)
+        line = f"{name:<32}{results[name]:>12.1f}"
+        if name in previous:
+            line += f"{previous[name]:>12.1f}{results[name] / previous[name]:>8.2f}"
+        print(line)
+
+    revision = git_revision()
+    label = args.label or revision or addmeta.__version__
+    RESULTS.mkdir(exist_ok=True)
+    results_file = RESULTS / f'micro-{label}.json'
+    results_file.write_text(json.dumps({
+        'addmeta': addmeta.__version__,
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }, indent=1))
+    print(f"Results written to {results_file}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+End-to-end scaling benchmark of the addmeta and validatemeta command line
+tools on synthetic corpora (see corpus.py).
+
+    python benchmarks/scaling.py --files 10 100 1000 --jobs 4 --ncatted
+
+For each corpus size every scenario (plain, --sort, --update-history,
+templated attributes with and without --prefetch, the classic or h5py
+engine to suit the format, parallel jobs, validatemeta, and optionally one
+ncatted call per file as a baseline) is timed. The results are appended to
+benchmarks/results/<label>.json, where the label defaults to the addmeta
+version, so runs of different releases can be compared with --compare.
+"""
+
+import argparse
+from datetime import datetime, timezone
+import importlib.util
+import json
+from pathlib import Path
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import netCDF4 as nc
+
+import addmeta
+from corpus import add_corpus_arguments, make_corpus
+
+RESULTS = Path(__file__).parent / 'results'
+
+METADATA = """\
+global:
+    Publisher: ACCESS-NRI
+    license: CC-BY-4.0
+    keywords: [ocean, model, benchmark]
+variables:
+    var_0000:
+        units: K
+        long_name: Benchmark variable
+"""
+
+TEMPLATE_METADATA = """\
+global:
+    frequency: '{{ __file__.freq }}'
+    filename: '{{ __file__.name }}'
+    size: '{{ __file__.size | number }}'
+    date_metadata_modified: '{{ __datetime__.now }}'
+"""
+
+SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "properties": {
+        "global": {
+            "type": "object",
+            "required": ["Publisher", "license"],
+        },
+    },
+}
+
+FNREGEX = r'\.(?P<freq>[^.]+)\.mean\.nc$'
+
+def addmeta_command(*args):
+    return [sys.executable, '-m', 'addmeta.cli', *args]
+
+def validatemeta_command(*args):
+    return [sys.executable, '-m', 'addmeta.validate', *args]
+
+def scenarios(workdir, fnames, jobs, file_format, ncatted=False):
+    """
+    Return a dict of scenario names and the commands they run
+    """
+    metafile = workdir / 'meta.yaml'
+    metafile.write_text(METADATA)
+    templatefile = workdir / 'template.yaml'
+    templatefile.write_text(TEMPLATE_METADATA)
+    schemafile = workdir / 'schema.json'
+    schemafile.write_text(json.dumps(SCHEMA))
+
+    runs = {
+        'addmeta': [addmeta_command('-m', str(metafile), *fnames)],
+        'addmeta --sort': [addmeta_command('--sort', '-m', str(metafile), *fnames)],
+        'addmeta --update-history': [addmeta_command('--update-history', '-m', str(metafile), *fnames)],
+        'addmeta templated': [addmeta_command('-m', str(templatefile), '-f', FNREGEX, *fnames)],
+        'addmeta templated --prefetch 4': [addmeta_command('--prefetch', '4', '-m', str(templatefile), '-f', FNREGEX, *fnames)],
+    }
+    if file_format.startswith('cdf'):
+        runs['addmeta --engine classic'] = [addmeta_command('--engine', 'classic', '-m', str(metafile), *fnames)]
+    elif file_format == 'nc4' and importlib.util.find_spec('h5py') is not None:
+        runs['addmeta --engine h5py'] = [addmeta_command('--engine', 'h5py', '-m', str(metafile), *fnames)]
+    for n in jobs:
+        runs[f'addmeta --jobs {n}'] = [addmeta_command('--jobs', str(n), '-m', str(metafile), *fnames)]
+    runs['validatemeta'] = [validatemeta_command('-s', str(schemafile), *fnames)]
+
+    if ncatted:
+        # The equivalent edit of the global attributes, one file at a time
+        edits = ['-a', 'Publisher,global,o,c,ACCESS-NRI', '-a', 'license,global,o,c,CC-BY-4.0',
+                 '-a', 'keywords,global,o,c,"ocean,model,benchmark"',
+                 '-a', 'units,var_0000,o,c,K', '-a', 'long_name,var_0000,o,c,Benchmark variable']
+        runs['ncatted'] = [['ncatted', '-O', '-h', *edits, fname] for fname in fnames]
+
+    return runs
+
+def time_commands(commands, repeats):
+    """
+    Run the commands repeats times, returning the time of each repeat
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for command in commands:
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def environment():
+    return {
+        'addmeta': addmeta.__version__,
+        'netCDF4': nc.__version__,
+        'libnetcdf': nc.__netcdf4libversion__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.now(timezone.utc).isoformat(),
+    }
+
+def compare(results, label):
+    """
+    Print the ratio of the median times in results to those in the results
+    file for label
+    """
+    previous = {(r['scenario'], json.dumps(r['corpus'], sort_keys=True)): r
+                for r in json.loads((RESULTS / f'{label}.json').read_text())}
+
+    print(f"\nCompared to {label}")
+    print(f"{'scenario':<28}{'files':>8}{'before (s)':>12}{'now (s)':>12}{'ratio':>8}")
+    for result in results:
+        before = previous.get((result['scenario'], json.dumps(result['corpus'], sort_keys=True)))
+        if before is None:
+            continue
+        ratio = result['median'] / before['median']
+        print(f"{result['scenario']:<28}{result['corpus']['files']:>8}"
+              f"{before['median']:>12.3f}{result['median']:>12.3f}{ratio:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end scaling benchmark of addmeta and validatemeta")
+    add_corpus_arguments(parser, files=False)
+    parser.add_argument('--files', type=int, nargs='+', default=[10, 100], help='Numbers of files to benchmark')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[4], help='Numbers of worker processes to benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of times each scenario is run')
+    parser.add_argument('--ncatted', action='store_true', help='Also time ncatted, if it is installed, as a baseline')
+    parser.add_argument('--label', help='Name of the results file (default: the addmeta version)')
+    parser.add_argument('--compare', help='Label of earlier results to compare with')
+    parser.add_argument('--dir', help='Directory for the corpora (default: a temporary directory)')
+    args = parser.parse_args()
+
+    ncatted = args.ncatted and shutil.which('ncatted') is not None
+    if args.ncatted and not ncatted:
+        print("ncatted not found, skipping the baseline")
+
+    label = args.label or addmeta.__version__
+    env = environment()
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        workdir = Path(tmpdir)
+        for files in args.files:
+            corpus = dict(files=files, variables=args.variables, attributes=args.attributes,
+                          format=args.format, size_mb=args.size_mb)
+            fnames = make_corpus(workdir / f'corpus_{files}', files, args.variables, args.attributes,
+                                 args.format, args.size_mb)
+
+            for scenario, commands in scenarios(workdir, fnames, args.jobs, args.format, ncatted).items():
+                times = time_commands(commands, args.repeats)
+                result = dict(scenario=scenario, corpus=corpus, times=times,
+                              median=statistics.median(times), min=min(times), **env)
+                results.append(result)
+                print(f"{scenario:<28}{files:>8} files {result['median']:>10.3f} s"
+                      f" {1000 * result['median'] / files:>10.3f} ms/file")
+
+    RESULTS.mkdir(exist_ok=True)
+    results_file = RESULTS / f'{label}.json'
+    previous = json.loads(results_file.read_text()) if results_file.exists() else []
+    results_file.write_text(json.dumps(previous + results, indent=1))
+    print(f"Results written to {results_file}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
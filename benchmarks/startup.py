@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Startup time of the addmeta and validatemeta command line tools, which
+workflows call once per output stream.
+
+    python benchmarks/startup.py --repeats 20 --label before
+
+Each command is run on a single small file, so the time is dominated by
+starting the interpreter and importing addmeta and its dependencies. The
+bare interpreter is timed as a baseline. The results are written to
+benchmarks/results/startup-<label>.json, where the label defaults to the
+addmeta version, and --compare shows the change from an earlier label.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import addmeta
+from corpus import make_corpus
+
+RESULTS = Path(__file__).parent / 'results'
+
+METADATA = """\
+global:
+    Publisher: ACCESS-NRI
+"""
+
+SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+}
+
+def commands(workdir, fname):
+    metafile = workdir / 'meta.yaml'
+    metafile.write_text(METADATA)
+    schemafile = workdir / 'schema.json'
+    schemafile.write_text(json.dumps(SCHEMA))
+
+    return {
+        'python': [sys.executable, '-c', 'pass'],
+        'addmeta --help': [sys.executable, '-m', 'addmeta.cli', '--help'],
+        'addmeta': [sys.executable, '-m', 'addmeta.cli', '-m', str(metafile), fname],
+        'validatemeta --help': [sys.executable, '-m', 'addmeta.validate', '--help'],
+        'validatemeta': [sys.executable, '-m', 'addmeta.validate', '-s', str(schemafile), fname],
+    }
+
+def time_command(command, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of addmeta and validatemeta")
+    parser.add_argument('--repeats', type=int, default=10, help='Number of times each command is run')
+    parser.add_argument('--label', help='Name of the results file (default: the addmeta version)')
+    parser.add_argument('--compare', help='Label of earlier results to compare with')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        previous = json.loads((RESULTS / f'startup-{args.compare}.json').read_text())['results']
+
+    results = {}
+    print(f"{'command':<24}{'median (ms)':>12}{'min (ms)':>12}" + (f"{'before':>12}{'ratio':>8}" if previous else ""))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = Path(tmpdir)
+        [fname] = make_corpus(workdir / 'corpus', files=1)
+        for name, command in commands(workdir, fname).items():
+            # Warm the filesystem cache before timing
+            time_command(command, 1)
+            times = time_command(command, args.repeats)
+            results[name] = dict(times=times, median=statistics.median(times), min=min(times))
+            line = f"{name:<24}{1000 * results[name]['median']:>12.1f}{1000 * results[name]['min']:>12.1f}"
+            if name in previous:
+                before = previous[name]['median']
+                line += f"{1000 * before:>12.1f}{results[name]['median'] / before:>8.2f}"
+            print(line)
+
+    label = args.label or addmeta.__version__
+    RESULTS.mkdir(exist_ok=True)
+    results_file = RESULTS / f'startup-{label}.json'
+    results_file.write_text(json.dumps({'addmeta': addmeta.__version__, 'python': sys.version, 'results': results}, indent=1))
+    print(f"Results written to {results_file}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compare the time taken to apply meta data to netCDF4 files with many
+variables with the netcdf4 and h5py storage backends.
+
+    python benchmarks/wide_files.py --variables 5000
+
+Only the global attributes and one variable are edited, which is the case
+the h5py backend is meant for.
+"""
+
+import argparse
+from pathlib import Path
+import tempfile
+import time
+
+import netCDF4 as nc
+
+from addmeta import find_and_add_meta
+
+def make_file(fname, variables):
+    """
+    Make a netCDF4 file with the given number of small variables
+    """
+    with nc.Dataset(fname, 'w', format='NETCDF4') as ds:
+        ds.createDimension('time', None)
+        ds.createDimension('x', 10)
+        for n in range(variables):
+            var = ds.createVariable(f'var_{n:05d}', 'f4', ('time', 'x'))
+            var.units = 'K'
+            var.long_name = f'Variable {n}'
+
+def make_metadata(run):
+    return {
+        'global': {f'attribute_{n:02d}': f'value {n} run {run}' for n in range(20)},
+        'variables': {'var_00000': {'comment': f'run {run}'}},
+    }
+
+def time_engine(engine, files, repeats, run):
+    times = []
+    for _ in range(repeats):
+        run += 1
+        start = time.perf_counter()
+        find_and_add_meta(files, make_metadata(run), {}, [], engine=engine)
+        times.append((time.perf_counter() - start) / len(files))
+    return min(times), run
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the netcdf4 and h5py backends for files with many variables")
+    parser.add_argument('--variables', type=int, default=2000, help='Number of variables in each file')
+    parser.add_argument('--files', type=int, default=4, help='Number of files')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of timed repeats, the fastest is reported')
+    parser.add_argument('--dir', help='Directory for the test files (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        files = [str(Path(tmpdir) / f'file_{n}.nc') for n in range(args.files)]
+        for fname in files:
+            make_file(fname, args.variables)
+
+        run = 0
+        netcdf4_time, run = time_engine('netcdf4', files, args.repeats, run)
+        h5py_time, run = time_engine('h5py', files, args.repeats, run)
+
+    print(f"{args.files} netCDF4 files with {args.variables} variables")
+    print(f"{'engine':<10}{'s/file':>12}")
+    print(f"{'netcdf4':<10}{netcdf4_time:>12.4f}")
+    print(f"{'h5py':<10}{h5py_time:>12.4f}")
+    print(f"speed-up: {netcdf4_time / h5py_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,7 @@ limitations under the License.
 from pathlib import Path
 import os
 import shlex
+import shutil
 import subprocess
 import yaml
 
@@ -49,6 +50,20 @@ def make_nc(tmp_path):
     runcmd(cmd)
     return ncfilename
 
+def copy_nc(ncfilename, directory):
+    """
+    Return copies of ncfilename in directory, named with an output frequency
+    """
+    files = [str(Path(directory) / f'ocean_{n:02d}.{freq}.nc')
+             for n, freq in enumerate(['1day', '1mon', '1yr'] * 3)]
+    for file in files:
+        shutil.copy(ncfilename, file)
+    return files
+
+@pytest.fixture
+def ncfiles(make_nc, tmp_path):
+    return copy_nc(make_nc, tmp_path)
+
 @pytest.fixture
 def make_env_data():
     env = dict(os.environ)
@@ -60,6 +75,23 @@ def make_env_data():
     yield fname
     fname.unlink()
 
+def dump(fname):
+    """
+    Return the names, attributes (with types) and data of a file
+    """
+    def attrs(group):
+        return [(attr, repr(group.getncattr(attr))) for attr in group.ncattrs()]
+
+    with nc.Dataset(fname) as ds:
+        # The data as stored, unmasked by any missing_value
+        ds.set_auto_mask(False)
+        return {
+            'format': ds.data_model,
+            'dimensions': {name: len(dim) for name, dim in ds.dimensions.items()},
+            'global': attrs(ds),
+            'variables': {name: (attrs(var), var.dimensions, var[:].tolist()) for name, var in ds.variables.items()},
+        }
+
 def get_meta_data_from_file(fname, var=None):
 
     metadict = {}
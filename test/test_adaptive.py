@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import shutil
+
+import pytest
+
+from addmeta import find_and_add_meta
+from addmeta.adaptive import BASELINE_PERIODS, ConcurrencyController, file_latency, format_decision
+from addmeta.cli import main_parse_args
+from addmeta.schedule import Scheduler, map_scheduled
+from addmeta.timing import start_timing, stop_timing
+from common import make_nc, get_meta_data_from_file
+
+class FakeClock:
+    """
+    A clock that only moves when told to, or when slept on
+    """
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def run_period(controller, clock, files_per_second, latency):
+    """
+    Finish a period of files at the given rate, returning the decision
+    """
+    count = max(4, 2 * controller.limit)
+    decision = None
+    for _ in range(count):
+        clock.now += 1. / files_per_second
+        decision = controller.record(latency) or decision
+    return decision
+
+def test_starts_with_half_the_workers():
+
+    assert ConcurrencyController(8).limit == 4
+    assert ConcurrencyController(1).limit == 1
+    assert ConcurrencyController(8, adaptive=False).limit == 8
+
+def test_climbs_while_throughput_rises():
+
+    clock = FakeClock()
+    controller = ConcurrencyController(8, clock=clock)
+
+    decision = run_period(controller, clock, 10, 0.01)
+    assert (decision['from'], decision['to']) == (4, 5)
+    decision = run_period(controller, clock, 20, 0.01)
+    assert (decision['from'], decision['to'], decision['reason']) == (5, 6, "throughput rising")
+
+    # Throughput levelled off, so the limit holds
+    assert run_period(controller, clock, 20, 0.01) is None
+    assert controller.limit == 6
+
+def test_reverses_when_throughput_falls():
+
+    clock = FakeClock()
+    controller = ConcurrencyController(8, clock=clock)
+
+    run_period(controller, clock, 10, 0.01)
+    decision = run_period(controller, clock, 5, 0.01)
+
+    assert (decision['from'], decision['to'], decision['reason']) == (5, 4, "throughput falling")
+    # And keeps going down while that helps
+    decision = run_period(controller, clock, 10, 0.01)
+    assert (decision['from'], decision['to']) == (4, 3)
+
+def test_backs_off_under_pressure():
+
+    clock = FakeClock()
+    controller = ConcurrencyController(16, clock=clock)
+
+    run_period(controller, clock, 10, 0.01)
+    decision = run_period(controller, clock, 20, 0.05)
+
+    assert (decision['from'], decision['to']) == (9, 4)
+    assert "latency" in decision['reason']
+    assert len(controller.decisions) == 2
+    assert "9 -> 4" in format_decision(decision)
+
+def test_baseline_moves_on():
+
+    clock = FakeClock()
+    controller = ConcurrencyController(16, clock=clock)
+
+    run_period(controller, clock, 10, 0.01)
+    for _ in range(BASELINE_PERIODS):
+        run_period(controller, clock, 10, 0.05)
+    assert controller.limit == 1
+
+    # Once the low latency is out of the window the higher one is the
+    # baseline, so the limit can climb again rather than being held down
+    assert controller.baseline == 0.05
+    decision = run_period(controller, clock, 20, 0.05)
+    assert (decision['from'], decision['to'], decision['reason']) == (1, 2, "throughput rising")
+
+def test_limits():
+
+    clock = FakeClock()
+    controller = ConcurrencyController(2, clock=clock)
+
+    # Can't go above max_workers
+    for rate in (10, 20, 40, 80):
+        run_period(controller, clock, rate, 0.01)
+    assert controller.limit == 2
+
+    # Or below min_workers
+    run_period(controller, clock, 80, 1.)
+    run_period(controller, clock, 80, 10.)
+    assert controller.limit == 1
+
+def test_not_adaptive():
+
+    controller = ConcurrencyController(4, adaptive=False)
+
+    assert all(controller.record(1.) is None for _ in range(20))
+    assert controller.limit == 4
+
+def test_max_rate():
+
+    clock = FakeClock()
+    controller = ConcurrencyController(4, adaptive=False, max_rate=10, clock=clock, sleep=clock.sleep)
+
+    starts = []
+    for _ in range(5):
+        controller.wait()
+        starts.append(clock.now)
+
+    assert starts == pytest.approx([0., 0.1, 0.2, 0.3, 0.4])
+    assert controller.waited == pytest.approx(0.4)
+    assert "waited 0.400 s" in controller.report()
+
+def test_file_latency():
+
+    assert file_latency({'open': {'time': 0.5, 'calls': 1}, 'render': {'time': 2., 'calls': 1}, 'close': {'time': 0.25, 'calls': 1}}) == 0.75
+    assert file_latency({}) == 0.
+
+def test_map_scheduled_controller():
+
+    controller = ConcurrencyController(4, adaptive=False)
+    controller.limit = 2
+    running, peak = 0, 0
+
+    def work(chunk):
+        return [chunk[0].upper()]
+
+    def started():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+
+    controller.wait = started
+    items = [f'file{n}.nc' for n in range(10)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = []
+        for item, result in map_scheduled(executor, work, items, Scheduler(), window=8, controller=controller):
+            running -= 1
+            results.append(result)
+
+    assert results == [item.upper() for item in items]
+    # Counting the finished item about to be yielded
+    assert peak == controller.limit + 1
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_find_and_add_meta_adaptive(make_nc, tmp_path, capsys, jobs):
+
+    ncfiles = [str(tmp_path / f'{n}.nc') for n in range(10)]
+    for ncfile in ncfiles:
+        shutil.copy(make_nc, ncfile)
+
+    timings = start_timing()
+    try:
+        counts = find_and_add_meta(ncfiles, {'global': {'name': '{{ __file__.name }}'}}, {}, [],
+                                   jobs=jobs, adaptive=True, max_rate=1000, verbose=True)
+    finally:
+        stop_timing()
+
+    assert counts['updated'] == len(ncfiles)
+    for ncfile in ncfiles:
+        assert get_meta_data_from_file(ncfile)['name'] == Path(ncfile).name
+    assert len(timings.files) == len(ncfiles)
+    assert "Rate limited to 1000 files/s" in capsys.readouterr().out
+    assert 'decisions' in timings.as_dict()
+
+def test_cli_adaptive(tmp_path):
+
+    args = main_parse_args(["--adaptive", "--max-rate", "50", "-j", "4", "test.nc"])
+    assert args.adaptive and args.max_rate == 50.
+
+    cmdlineargs = tmp_path / "cmdlineargs"
+    (tmp_path / "test.nc").touch()
+    cmdlineargs.write_text("--adaptive\n--max-rate=20\ntest.nc\n")
+    args = main_parse_args(["-c", str(cmdlineargs)])
+    assert args.adaptive and args.max_rate == 20.
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import shutil
+
+import netCDF4 as nc
+import pytest
+
+from addmeta import find_and_add_meta
+from addmeta.backends import BackendError, open_dataset
+from addmeta.validate import get_metadata_from_file
+from common import dump, runcmd
+
+pytest.importorskip("h5py")
+
+metadata = {
+    'global':
+    {
+        'Publisher': 'ACCESS-NRI',
+        'unlikelytobeoverwritten': None,
+        'integer': 5,
+        'float': 1.5,
+        'empty': '',
+        'unicode': 'héllo',
+        'list': ['a', 'b'],
+        'filename': '{{ __file__.name }}',
+    },
+    'variables':
+    {
+        'temp': {'units': 'K', 'long_name': None, 'missing_value': 1.e+20, 'valid_max': 400},
+        'Times': {'axis': 'T'},
+        'missing': {'units': 'm'},
+    },
+}
+
+def make_nc4(fname, kind="nc4"):
+    runcmd(f"ncgen -k {kind} -o {fname} test/test.cdl")
+    return fname
+
+@pytest.mark.parametrize("sort_attrs", [False, True])
+def test_h5py_matches_netcdf4(tmp_path, sort_attrs):
+
+    reference = make_nc4(tmp_path / 'reference.nc')
+    edited = tmp_path / 'edited.nc'
+    shutil.copy(reference, edited)
+
+    # The second run updates history, and rewrites the other attributes
+    # with the same values
+    for history in ['first entry', 'second entry']:
+        find_and_add_meta([str(reference)], metadata, {}, [], sort_attrs=sort_attrs, history=history)
+        find_and_add_meta([str(edited)], metadata, {}, [], sort_attrs=sort_attrs, history=history,
+                          engine='h5py')
+
+    expected = dump(reference)
+    actual = dump(edited)
+    expected['global'].remove(('filename', repr('reference.nc')))
+    actual['global'].remove(('filename', repr('edited.nc')))
+    assert actual == expected
+
+    # Both backends read the same
+    assert get_metadata_from_file(str(edited), engine='h5py') == get_metadata_from_file(str(edited))
+
+def test_h5py_variables(tmp_path):
+
+    fname = make_nc4(tmp_path / 'test.nc')
+
+    with open_dataset(fname, backend='h5py') as ds:
+        assert list(ds.variables) == ['Times', 'temp']
+        assert 'x' not in ds.variables
+        assert 'x' in ds.dimensions
+        assert ds.ncattrs() == ['unlikelytobeoverwritten', 'Publisher']
+        with pytest.raises(AttributeError):
+            ds.getncattr('_NCProperties')
+
+@pytest.mark.parametrize("kind", ["nc3", "nc7"])
+def test_h5py_fallback(tmp_path, kind, capsys):
+
+    fname = make_nc4(tmp_path / 'test.nc', kind=kind)
+
+    with pytest.raises(BackendError):
+        open_dataset(fname, backend='h5py')
+
+    find_and_add_meta([str(fname)], metadata, {}, [], engine='h5py', verbose=True)
+
+    assert "using netCDF4" in capsys.readouterr().out
+    assert get_metadata_from_file(str(fname), engine='h5py')['global']['Publisher'] == 'ACCESS-NRI'
+
+def test_h5py_rename_fallback(tmp_path, capsys):
+
+    fname = make_nc4(tmp_path / 'test.nc')
+
+    meta = {'global': {'Publisher': 'ACCESS-NRI'}, 'rename': {'variables': {'Times': 'time'}}}
+    find_and_add_meta([str(fname)], meta, {}, [], engine='h5py', verbose=True)
+
+    assert "renaming isn't supported by the h5py backend, using netCDF4" in capsys.readouterr().out
+    with nc.Dataset(fname) as ds:
+        assert list(ds.variables) == ['time', 'temp']
+        assert ds.Publisher == 'ACCESS-NRI'
+
+def test_h5py_fill_value(tmp_path):
+
+    fname = make_nc4(tmp_path / 'test.nc')
+
+    with pytest.raises(AttributeError, match="_FillValue attribute must be set when variable is created"):
+        find_and_add_meta([str(fname)], {'variables': {'temp': {'_FillValue': 0.}}}, {}, [], engine='h5py')
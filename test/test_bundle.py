@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import json
+import shutil
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from addmeta import combine_meta
+from addmeta.bundle import BundleError, read_bundle, write_bundle
+from addmeta.cli import main, main_argv, main_parse_args
+from common import get_meta_data_from_file, make_nc
+
+def addmeta_command(*args):
+    with patch.object(sys, 'argv', ['addmeta', *args]):
+        main_argv()
+
+def test_round_trip(tmp_path):
+
+    metadata = combine_meta(['test/meta1.yaml', 'test/meta2.yaml'])
+    kwdata = {'data': {'a': 1}}
+    bundle = tmp_path / 'meta.bundle'
+
+    digest = write_bundle(bundle, metadata, kwdata, [r'(?P<n>\d+)'], sources=['test/meta1.yaml'], addmeta_version='1.0')
+    contents = read_bundle(bundle)
+
+    assert contents['metadata'] == metadata
+    assert contents['kwdata'] == kwdata
+    assert contents['fnregex'] == [r'(?P<n>\d+)']
+    assert contents['sources'] == ['test/meta1.yaml']
+    assert contents['addmeta'] == '1.0'
+    assert contents['digest'] == digest
+
+def test_yaml_types(tmp_path):
+
+    metadata = {'global': {'date': datetime.date(2025, 1, 31), 'count': 3, 'scale': 1.5, 'flag': True}}
+    kwdata = {1: 'one', 'binary': b'hello'}
+    bundle = tmp_path / 'meta.bundle'
+
+    write_bundle(bundle, metadata, kwdata, [])
+    contents = read_bundle(bundle)
+
+    assert contents['metadata'] == metadata
+    assert contents['kwdata'] == kwdata
+    # Bundles are JSON, never pickles
+    header, data = bundle.read_bytes().split(b'\n', 1)
+    json.loads(data)
+
+def test_invalid_regex(tmp_path):
+
+    with pytest.raises(BundleError, match='Invalid filename regex'):
+        write_bundle(tmp_path / 'meta.bundle', {}, {}, [r'(?P<n>\d+'])
+
+def test_invalid_bundles(tmp_path):
+
+    bundle = tmp_path / 'meta.bundle'
+
+    bundle.write_bytes(b'global:\n  a: 1\n')
+    with pytest.raises(BundleError, match='not an addmeta bundle'):
+        read_bundle(bundle)
+
+    write_bundle(bundle, {}, {}, [])
+    header, data = bundle.read_bytes().split(b'\n', 1)
+
+    bundle.write_bytes(header + b'\n' + data[:-1] + b'x')
+    with pytest.raises(BundleError, match='corrupt'):
+        read_bundle(bundle)
+
+    bundle.write_bytes(header.replace(b'bundle 2', b'bundle 999') + b'\n' + data)
+    with pytest.raises(BundleError, match='recompile'):
+        read_bundle(bundle)
+
+def test_compile_and_apply(make_nc, tmp_path):
+
+    bundle = str(tmp_path / 'meta.bundle')
+    template = tmp_path / 'template.yaml'
+    template.write_text('global:\n  filename: "{{ __file__.name }}"\n  matched: "{{ __file__.name_part }}"\n')
+    datafile = tmp_path / 'data.yaml'
+    datafile.write_text('experiment: ocean\n')
+    direct = str(tmp_path / 'direct.nc')
+    shutil.copy(make_nc, direct)
+    args = ['-m', 'test/meta1.yaml', '-m', str(template), '-d', str(datafile),
+            '--datavar', 'run=1', '-f', r'(?P<name_part>[a-z]+)\.nc']
+
+    addmeta_command('compile', bundle, *args)
+
+    main(main_parse_args(['--bundle', bundle, make_nc]))
+    main(main_parse_args([*args, direct]))
+
+    bundled, unbundled = get_meta_data_from_file(make_nc), get_meta_data_from_file(direct)
+    assert bundled.pop('filename') == 'test.nc'
+    assert bundled.pop('matched') == 'test'
+    assert unbundled.pop('filename') == 'direct.nc'
+    assert unbundled.pop('matched') == 'direct'
+    assert bundled == unbundled
+    assert read_bundle(bundle)['kwdata'] == {'data': {'experiment': 'ocean'}, '__argdata__': {'run': '1'}}
+
+def test_bundle_with_metafiles(make_nc, tmp_path):
+
+    bundle = str(tmp_path / 'meta.bundle')
+    addmeta_command('compile', bundle, '-m', 'test/meta1.yaml')
+
+    # Meta data given on the command line overrides the bundle
+    main(main_parse_args(['--bundle', bundle, '-m', 'test/meta2.yaml', make_nc]))
+
+    attributes = get_meta_data_from_file(make_nc)
+    assert attributes['Publisher'] == 'ARC Centre of Excellence for Climate System Science (ARCCSS)'
+    assert attributes['Year'] == 2017
+
+def test_compile_errors(make_nc, tmp_path):
+
+    with pytest.raises(SystemExit, match='Invalid filename regex'):
+        addmeta_command('compile', str(tmp_path / 'meta.bundle'), '-m', 'test/meta1.yaml', '-f', '(')
+
+    with pytest.raises(SystemExit, match="doesn't take netCDF files"):
+        addmeta_command('compile', str(tmp_path / 'meta.bundle'), '-m', 'test/meta1.yaml', make_nc)
+
+    with pytest.raises(SystemExit, match='not an addmeta bundle'):
+        main(main_parse_args(['--bundle', 'test/meta1.yaml', make_nc]))
+
+def test_compile_output_first(tmp_path):
+
+    metafile = tmp_path / 'meta1.yaml'
+    shutil.copy('test/meta1.yaml', metafile)
+    original = metafile.read_bytes()
+
+    # An option's value is never taken for the output
+    with pytest.raises(SystemExit, match='output file must be the first argument'):
+        addmeta_command('compile', '-m', str(metafile), str(tmp_path / 'meta.bundle'))
+
+    assert metafile.read_bytes() == original
+    assert not (tmp_path / 'meta.bundle').exists()
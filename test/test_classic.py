@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import shutil
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+from addmeta import find_and_add_meta, predict_header_growth
+from addmeta.classic import ClassicDataset, HeaderPatchError
+from common import dump, runcmd
+
+metadata = {
+    'global':
+    {
+        'Publisher': 'ACCESS-NRI',
+        'unlikelytobeoverwritten': None,
+        'integer': 5,
+        'float': 1.5,
+        'empty': '',
+        'unicode': 'héllo',
+        'list': ['a', 'b'],
+        'filename': '{{ __file__.name }}',
+    },
+    'variables':
+    {
+        'temp': {'units': 'K', 'long_name': None, '_FillValue': None, 'valid_max': 400},
+        'time': {'axis': 'T'},
+    },
+    'rename':
+    {
+        'variables': {'Times': 'time'},
+        'dimensions': {'x': 'longitude'},
+    },
+}
+
+def make_classic(fname, kind, free=0):
+    """
+    Make a netCDF file of the given kind, and optionally leave free space
+    after the header by adding then removing a large attribute
+    """
+    runcmd(f"ncgen -k {kind} -o {fname} test/test.cdl")
+    if free:
+        with nc.Dataset(fname, 'r+') as ds:
+            ds.padding = 'x' * free
+        with nc.Dataset(fname, 'r+') as ds:
+            ds.delncattr('padding')
+    return fname
+
+@pytest.mark.parametrize("kind", ["nc3", "nc6", "nc5"])
+def test_header_roundtrip(tmp_path, kind):
+
+    fname = make_classic(tmp_path / 'test.nc', kind)
+
+    ds = ClassicDataset(fname)
+
+    with open(fname, 'rb') as f:
+        assert ds.encode() == f.read(ds.header_size)
+
+    assert list(ds.dimensions) == ['x', 'y', 'Times']
+    assert list(ds.variables) == ['Times', 'temp']
+    assert ds.ncattrs() == ['unlikelytobeoverwritten', 'Publisher']
+    assert ds.getncattr('Publisher') == 'Will be overwritten'
+    assert ds.variables['temp'].getncattr('missing_value') == np.float32(1.e+20)
+    assert not ds.changed
+
+@pytest.mark.parametrize("kind", ["nc3", "nc6", "nc5"])
+@pytest.mark.parametrize("sort_attrs", [False, True])
+def test_classic_matches_netcdf4(tmp_path, kind, sort_attrs, capsys):
+
+    reference = make_classic(tmp_path / 'reference.nc', kind, free=1024)
+    patched = tmp_path / 'patched.nc'
+    shutil.copy(reference, patched)
+
+    find_and_add_meta([reference], metadata, {}, [], sort_attrs=sort_attrs, history='history entry')
+    size = patched.stat().st_size
+    find_and_add_meta([str(patched)], metadata, {}, [], sort_attrs=sort_attrs, history='history entry',
+                      engine='classic', verbose=True)
+
+    assert "header rewritten in place" in capsys.readouterr().out
+    assert patched.stat().st_size == size
+
+    expected = dump(reference)
+    actual = dump(patched)
+    # The filename attribute necessarily differs
+    expected['global'].remove(('filename', repr('reference.nc')))
+    actual['global'].remove(('filename', repr('patched.nc')))
+    assert actual == expected
+
+def test_classic_fallback_header_full(tmp_path, capsys):
+
+    fname = make_classic(tmp_path / 'test.nc', 'nc3')
+
+    counts = find_and_add_meta([fname], metadata, {}, [], engine='classic', verbose=True)
+
+    assert counts['updated'] == 1
+    assert "using netCDF4" in capsys.readouterr().out
+    assert nc.Dataset(fname).getncattr('unicode') == 'héllo'
+
+def test_classic_fallback_netcdf4_file(tmp_path, capsys):
+
+    fname = tmp_path / 'test.nc'
+    runcmd(f"ncgen -k nc4 -o {fname} test/test.cdl")
+
+    with pytest.raises(HeaderPatchError):
+        ClassicDataset(fname)
+
+    find_and_add_meta([str(fname)], metadata, {}, [], engine='classic', verbose=True)
+
+    assert "not a netCDF classic format file" in capsys.readouterr().out
+    assert nc.Dataset(fname).getncattr('Publisher') == 'ACCESS-NRI'
+
+def test_classic_unchanged(tmp_path):
+
+    fname = make_classic(tmp_path / 'test.nc', 'nc3', free=1024)
+
+    assert find_and_add_meta([fname], metadata, {}, [], engine='classic')['updated'] == 1
+    assert find_and_add_meta([fname], metadata, {}, [], engine='classic')['unchanged'] == 1
+
+def test_classic_fill_value(tmp_path):
+
+    fname = make_classic(tmp_path / 'test.nc', 'nc3', free=1024)
+
+    with pytest.raises(AttributeError, match="_FillValue attribute must be set when variable is created"):
+        find_and_add_meta([fname], {'variables': {'temp': {'_FillValue': 0.}}}, {}, [], engine='classic')
+
+@pytest.mark.parametrize("free,action", [(0, "data shift"), (1024, "in place")])
+def test_predict_header_growth(tmp_path, free, action):
+
+    fname = make_classic(tmp_path / 'test.nc', 'nc3', free=free)
+    with open(fname, 'rb') as f:
+        before = f.read()
+
+    report, = predict_header_growth([fname], metadata, {}, [])
+
+    assert report['format'] == 'CDF-1'
+    assert report['action'] == action
+    assert report['new_header_size'] > report['header_size']
+    assert (report['shift'] > 0) == (action == "data shift")
+
+    # Nothing is modified
+    with open(fname, 'rb') as f:
+        assert f.read() == before
+
+def test_predict_header_growth_unchanged(tmp_path):
+
+    fname = make_classic(tmp_path / 'test.nc', 'nc3', free=1024)
+    find_and_add_meta([fname], metadata, {}, [])
+
+    report, = predict_header_growth([fname], metadata, {}, [])
+    assert report['action'] == "unchanged"
+
+    nc4 = tmp_path / 'test4.nc'
+    runcmd(f"ncgen -k nc4 -o {nc4} test/test.cdl")
+    report, = predict_header_growth([str(nc4)], metadata, {}, [])
+    assert report['action'] == "not classic"
+
+@pytest.mark.parametrize("engine", ["classic", "netcdf4"])
+def test_header_pad(tmp_path, engine):
+
+    reference = make_classic(tmp_path / 'reference.nc', 'nc3', free=1024)
+    fname = make_classic(tmp_path / 'test.nc', 'nc3')
+
+    find_and_add_meta([reference], metadata, {}, [])
+    find_and_add_meta([fname], metadata, {}, [], engine=engine, header_pad=4096)
+
+    # The data is intact and the space reserved
+    ds = ClassicDataset(fname)
+    assert ds.free_space >= 4096
+    expected = dump(reference)
+    actual = dump(fname)
+    expected['global'].remove(('filename', repr('reference.nc')))
+    actual['global'].remove(('filename', repr('test.nc')))
+    assert actual == expected
+
+    # Later edits fit in the reserved space
+    report, = predict_header_growth([fname], {'global': {'extra': 'x' * 1000}}, {}, [], header_pad=4096)
+    assert report['action'] == "in place"
+
+def test_header_report_cli(tmp_path, capfd):
+
+    fname = make_classic(tmp_path / 'test.nc', 'nc3')
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n    Publisher: ACCESS-NRI\n    extra: some new attribute\n")
+    with open(fname, 'rb') as f:
+        before = f.read()
+
+    runcmd(f"addmeta --header-report -m {metafile} {fname}")
+    output = capfd.readouterr().out
+
+    assert "data shift" in output
+    assert "1 file(s) would need the data moved" in output
+    with open(fname, 'rb') as f:
+        assert f.read() == before
@@ -19,11 +19,14 @@ limitations under the License.
 """
 
 from argparse import Namespace
+from datetime import datetime, timezone
+import shutil
+
 import pytest
 from unittest.mock import patch
 
 import addmeta.cli
-from common import runcmd
+from common import runcmd, make_nc, get_meta_data_from_file
 
 @pytest.fixture
 def touch_nc():
@@ -58,6 +61,37 @@ def test_cmdlinearg_from_file(mock_main, touch_nc):
               sort=False,
               verbose=False, 
               update_history=False,
+              skip_unchanged=False,
+              now=None,
+              engine=None,
+              header_pad=None,
+              header_report=False,
+              profile=False,
+              profile_json=None,
+              profile_dump=None,
+              yaml_cache=None,
+              yaml_cache_size=None,
+              yaml_cache_key=None,
+              libyaml=False,
+              bundle=None,
+              files_from=None,
+              null=False,
+              recursive=None,
+              include=None,
+              exclude=None,
+              scan_threads=None,
+              prefetch=None,
+              schedule=None,
+              max_per_directory=None,
+              adaptive=False,
+              max_rate=None,
+              shard=None,
+              shard_by=None,
+              list_files=False,
+              journal=None,
+              resume=False,
+              keep_going=False,
+              jobs=None,
               files=touch_nc[0:2],
               )
 
@@ -118,6 +152,82 @@ def test_missing_cmdlinearg_file2():
                 sort=False, 
                 verbose=False, 
                 update_history=False,
+                skip_unchanged=False,
+                now=None,
+                engine=None,
+                header_pad=None,
+                header_report=False,
+                profile=False,
+                profile_json=None,
+                profile_dump=None,
+                yaml_cache=None,
+                yaml_cache_size=None,
+                yaml_cache_key=None,
+                libyaml=False,
+                bundle=None,
+                files_from=None,
+                null=False,
+                recursive=None,
+                include=None,
+                exclude=None,
+                scan_threads=None,
+                prefetch=None,
+                schedule=None,
+                max_per_directory=None,
+                adaptive=False,
+                max_rate=None,
+                shard=None,
+                shard_by=None,
+                list_files=False,
+                journal=None,
+                resume=False,
+                keep_going=False,
+                jobs=None,
+                files=['test/ocean_1.nc'])
+        ),
+        # Test jobs option
+        pytest.param(
+            ["--jobs","4"],
+            Namespace(cmdlineargs=None, 
+                metafiles=None, 
+                metalist=None, 
+                datafiles=None, 
+                fnregex=[], 
+                datavar=[], 
+                sort=False, 
+                verbose=False, 
+                update_history=False,
+                skip_unchanged=False,
+                now=None,
+                engine=None,
+                header_pad=None,
+                header_report=False,
+                profile=False,
+                profile_json=None,
+                profile_dump=None,
+                yaml_cache=None,
+                yaml_cache_size=None,
+                yaml_cache_key=None,
+                libyaml=False,
+                bundle=None,
+                files_from=None,
+                null=False,
+                recursive=None,
+                include=None,
+                exclude=None,
+                scan_threads=None,
+                prefetch=None,
+                schedule=None,
+                max_per_directory=None,
+                adaptive=False,
+                max_rate=None,
+                shard=None,
+                shard_by=None,
+                list_files=False,
+                journal=None,
+                resume=False,
+                keep_going=False,
+                jobs=4,
                 files=['test/ocean_1.nc'])
         ),
     ]
@@ -127,3 +237,89 @@ def test_options(mock_main, touch_nc, args, expected_namespace):
     args = [*args, touch_nc[0]]
 
     assert addmeta.cli.main_parse_args(args) == expected_namespace
+
+@pytest.mark.parametrize("null,contents",
+    [
+        (False, b"one.nc\ntwo.nc\r\n\n  \nthree with space.nc"),
+        (True, b"one.nc\0two.nc\0\0three with space.nc\0"),
+    ]
+)
+def test_read_files_from(tmp_path, null, contents):
+
+    listfile = tmp_path / "files"
+    listfile.write_bytes(contents)
+
+    files = addmeta.cli.read_files_from(str(listfile), null=null, chunk_size=4)
+
+    assert list(files) == ["one.nc", "two.nc", "three with space.nc"]
+
+def test_read_files_from_stdin(monkeypatch, tmp_path):
+
+    import io
+    monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(b"one.nc\ntwo.nc\n")))
+
+    assert list(addmeta.cli.read_files_from("-")) == ["one.nc", "two.nc"]
+
+def test_read_files_from_streams(tmp_path):
+
+    # Names are yielded as they are read, not once the whole list has been
+    listfile = tmp_path / "files"
+    listfile.write_bytes(b"".join(f"file{n}.nc\n".encode() for n in range(10000)))
+
+    files = addmeta.cli.read_files_from(str(listfile), chunk_size=64)
+
+    assert next(files) == "file0.nc"
+    assert next(files) == "file1.nc"
+    files.close()
+
+def test_files_from(make_nc, tmp_path, monkeypatch):
+
+    ncfiles = [str(tmp_path / f"file{n}.nc") for n in range(3)]
+    for ncfile in ncfiles:
+        shutil.copy(make_nc, ncfile)
+    listfile = tmp_path / "files"
+    listfile.write_bytes(b"\0".join(name.encode() for name in ncfiles[1:]))
+
+    metafile = tmp_path / "meta.yaml"
+    metafile.write_text("global:\n  Publisher: ACCESS-NRI\n")
+
+    args = addmeta.cli.main_parse_args([f"-m={metafile}", f"--files-from={listfile}", "--null", ncfiles[0]])
+    addmeta.cli.main(args)
+
+    for ncfile in ncfiles:
+        assert get_meta_data_from_file(ncfile)["Publisher"] == "ACCESS-NRI"
+
+def test_files_from_no_files_required():
+
+    args = addmeta.cli.main_parse_args(["-m=meta.yaml", "--files-from=-"])
+
+    assert args.files == []
+    assert args.files_from == "-"
+
+def test_resolve_relative_paths(tmp_path, monkeypatch):
+
+    for name in ["a.nc", "b.nc", "c.txt"]:
+        (tmp_path / name).touch()
+    monkeypatch.setenv("SUFFIX", "txt")
+
+    paths = addmeta.cli.resolve_relative_paths(
+        ["a.nc", "missing.nc", "*.nc", str(tmp_path / "c.$SUFFIX"), str(tmp_path / "*.txt")], tmp_path
+    )
+
+    assert not isinstance(paths, list)
+    assert list(paths) == [
+        str(tmp_path / "a.nc"),
+        *(str(p) for p in tmp_path.glob("*.nc")),
+        str(tmp_path / "c.txt"),
+        str(tmp_path / "c.txt"),
+    ]
+
+def test_build_history_many_files():
+
+    files = [f"file_{n:06d}.nc" for n in range(100000)]
+    argv = ["addmeta", "-m", "meta.yaml", *files]
+
+    history = addmeta.cli.build_history(files, now=datetime(2025, 1, 1, tzinfo=timezone.utc), argv=argv)
+
+    assert history.endswith(" addmeta -m meta.yaml")
+    assert history.startswith("2025-01-01T00:00:00+00:00 : addmeta ")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import shutil
+import subprocess
+import sys
+import traceback
+
+import netCDF4 as nc
+import pytest
+
+from addmeta import AttributePlan, apply_meta, find_and_add_meta
+from addmeta.backends import open_dataset
+from addmeta.batched import BatchedDataset
+from addmeta.classic import ClassicDataset
+from common import runcmd, get_meta_data_from_file
+
+metadata = {
+    'global': {'Publisher': 'ACCESS-NRI', 'unlikelytobeoverwritten': None, 'a': 1, 'b': 'two'},
+    'variables': {'temp': {'units': 'K', 'long_name': None, 'valid_max': 400}},
+    'rename': {'variables': {'Times': 'time'}, 'dimensions': {'x': 'longitude'}},
+}
+
+def apply(fname, batched, sort_attrs=False):
+    plan = AttributePlan(metadata)
+    with BatchedDataset(fname, 'r+') as rootgrp:
+        attributes = plan.render({}, variables=['temp'])
+        if batched:
+            with rootgrp.define_mode():
+                apply_meta(rootgrp, plan, attributes, sort_attrs=sort_attrs, history='history entry')
+        else:
+            apply_meta(rootgrp, plan, attributes, sort_attrs=sort_attrs, history='history entry')
+        return rootgrp.header_writes
+
+@pytest.mark.parametrize("kind", ["nc3", "nc6", "nc7"])
+@pytest.mark.parametrize("sort_attrs", [False, True])
+def test_single_define_mode_session(tmp_path, kind, sort_attrs):
+
+    batched = tmp_path / 'batched.nc'
+    runcmd(f"ncgen -k {kind} -o {batched} test/test.cdl")
+    separate = tmp_path / 'separate.nc'
+    shutil.copy(batched, separate)
+
+    assert apply(batched, True, sort_attrs=sort_attrs) == 1
+    assert apply(separate, False, sort_attrs=sort_attrs) > 5
+
+    with nc.Dataset(batched) as ds, nc.Dataset(separate) as expected:
+        assert list(ds.dimensions) == list(expected.dimensions) == ['longitude', 'y', 'Times']
+        assert ds.__dict__ == expected.__dict__
+        for var in expected.variables:
+            assert ds[var].__dict__ == expected[var].__dict__
+            assert ds[var][:].tolist() == expected[var][:].tolist()
+
+def test_no_define_mode_netcdf4(tmp_path):
+
+    fname = tmp_path / 'test.nc'
+    runcmd(f"ncgen -k nc4 -o {fname} test/test.cdl")
+
+    assert apply(fname, True) == 0
+    assert get_meta_data_from_file(str(fname))['Publisher'] == 'ACCESS-NRI'
+
+def test_header_writes_verbose(tmp_path, capsys):
+
+    fname = tmp_path / 'test.nc'
+    runcmd(f"ncgen -k nc3 -o {fname} test/test.cdl")
+
+    find_and_add_meta([str(fname)], metadata, {}, [], verbose=True)
+    assert "header written 1 time(s)" in capsys.readouterr().out
+
+    # The classic engine also writes the header once
+    ds = ClassicDataset(fname)
+    ds.setncattr('c', 'three')
+    assert ds.close()
+    assert ds.header_writes == 1
+
+def test_failed_open_exits_cleanly(tmp_path):
+
+    bad = tmp_path / 'bad.nc'
+    bad.write_text('not a netCDF file\n')
+
+    # The Dataset that failed to open isn't left for the interpreter to
+    # deallocate as it exits
+    script = f"from addmeta import find_and_add_meta; find_and_add_meta([{str(bad)!r}], {{'global': {{'a': 1}}}}, {{}}, [])"
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+
+    assert result.returncode != 0
+    assert 'Unknown file format' in result.stderr
+    assert 'Exception ignored' not in result.stderr
+
+def test_failed_open_traceback(tmp_path):
+
+    bad = tmp_path / 'bad.nc'
+    bad.write_text('not a netCDF file\n')
+
+    with pytest.raises(OSError, match='Unknown file format') as excinfo:
+        open_dataset(str(bad), 'r+')
+
+    # No frame of the traceback holds the Dataset that failed to open
+    for frame, _ in traceback.walk_tb(excinfo.value.__traceback__):
+        assert not isinstance(frame.f_locals.get('self'), BatchedDataset)
@@ -18,9 +18,13 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import warnings
+
 import pytest
 
-from addmeta import match_filename_regex
+from addmeta import FilenameRegexError, FilenameRegexs, match_filename_regex
+from addmeta.cli import main, main_parse_args
+from common import get_meta_data_from_file, make_nc
 
 @pytest.mark.parametrize(
     "filename,regexs,expected",
@@ -76,3 +80,57 @@ def test_filename_regex(filename, regexs, expected):
 
     assert( expected == match_filename_regex(filename, regexs) )
 
+
+def test_compiled_regexs():
+
+    regexs = FilenameRegexs([r'^(?P<model>[^.]+)\.', r'\.(?P<frequency>[^.]+)\.mean\.nc$', r'(?P<model>ocean)'])
+
+    assert regexs.groups == ['model', 'frequency']
+    assert regexs.match('ice.1day.mean.nc') == {'model': 'ice', 'frequency': '1day'}
+    # Later regexs override earlier ones
+    assert regexs.match('ocean_x.1mon.mean.nc') == {'model': 'ocean', 'frequency': '1mon'}
+    assert match_filename_regex('ice.1day.mean.nc', regexs) == {'model': 'ice', 'frequency': '1day'}
+    assert FilenameRegexs(regexs) is regexs
+    assert list(regexs) == [r'^(?P<model>[^.]+)\.', r'\.(?P<frequency>[^.]+)\.mean\.nc$', r'(?P<model>ocean)']
+
+def test_match_all():
+
+    regexs = FilenameRegexs([r'(?P<number>\d+)'])
+    fnames = (fname for fname in ['a1.nc', 'b22.nc', 'c.nc'])
+
+    # Streamed, one file at a time
+    matches = regexs.match_all(fnames)
+    assert next(matches) == ('a1.nc', {'number': '1'})
+    assert list(matches) == [('b22.nc', {'number': '22'}), ('c.nc', {})]
+
+@pytest.mark.parametrize("regex", [r'(?P<1bad>\d+)', r'(?P<a>\d+', r'(?P<a>x)(?P<a>y)'])
+def test_invalid_regex(regex):
+
+    with pytest.raises(FilenameRegexError, match='Invalid filename regex'):
+        FilenameRegexs([regex])
+
+def test_no_named_groups():
+
+    with pytest.warns(UserWarning, match='has no named groups'):
+        regexs = FilenameRegexs([r'\d+'])
+
+    # Only once, however often it's passed on
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert FilenameRegexs(regexs) is regexs
+        assert match_filename_regex('a1.nc', regexs) == {}
+
+def test_no_named_groups_cli(make_nc):
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        main(main_parse_args(['-m', 'test/meta1.yaml', '-f', r'\d+', make_nc]))
+
+    assert len([w for w in caught if 'has no named groups' in str(w.message)]) == 1
+
+def test_invalid_regex_before_any_file(make_nc):
+
+    with pytest.raises(SystemExit, match='Invalid filename regex'):
+        main(main_parse_args(['-m', 'test/meta_template.yaml', '-f', r'(?P<ok>\d+)', '-f', r'(?P<bad', make_nc]))
+
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'Will be overwritten'
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import addmeta.cli
+from addmeta import AttributePlan, ProcessingErrors, find_and_add_meta
+from addmeta.journal import Journal, plan_digest
+from common import make_nc, ncfiles, get_meta_data_from_file
+
+metadata = {'global': {'Publisher': 'ACCESS-NRI', 'filename': '{{ __file__.name }}'}}
+
+def read_journal(path):
+    return [json.loads(line) for line in Path(path).read_text().splitlines()]
+
+def digest(meta, kwdata=None, fnregexs=(), **options):
+    return plan_digest(AttributePlan(meta).resolve(kwdata or {}), kwdata or {}, fnregexs, **options)
+
+def test_plan_digest():
+
+    assert digest(metadata) == digest(metadata)
+    assert digest(metadata) != digest({'global': {'Publisher': 'someone else'}})
+    assert digest(metadata) != digest(metadata, kwdata={'__argdata__': {'a': 1}})
+    assert digest(metadata) != digest(metadata, fnregexs=['(?P<x>.*)'])
+    assert digest(metadata) != digest(metadata, sort_attrs=True)
+    # The history entry changes every run
+    assert digest(metadata, history="one") == digest(metadata, history="two")
+
+def test_journal_incomplete_line(tmp_path):
+
+    path = tmp_path / 'journal'
+    path.write_text('{"file": "/a.nc", "status": "updated", "plan": "x"}\n{"file": "/b.nc", "sta')
+
+    journal = Journal(path)
+    assert list(journal.load()) == ['/a.nc']
+
+    with journal:
+        journal.record(str(tmp_path / 'c.nc'), "failed", "x", error=ValueError("bad"))
+
+    entries = Journal(path).load()
+    assert list(entries) == ['/a.nc', str(tmp_path / 'c.nc')]
+    assert entries[str(tmp_path / 'c.nc')]['error'] == "ValueError: bad"
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_resume(ncfiles, tmp_path, jobs):
+
+    journal = tmp_path / 'journal'
+
+    counts = find_and_add_meta(ncfiles, metadata, {}, [], journal=journal, jobs=jobs)
+    assert counts['updated'] == len(ncfiles)
+    assert [entry['file'] for entry in read_journal(journal)] == ncfiles
+    assert all(entry['status'] == 'updated' for entry in read_journal(journal))
+
+    # Nothing left to do
+    counts = find_and_add_meta(ncfiles, metadata, {}, [], journal=journal, resume=True, jobs=jobs)
+    assert counts == {'updated': 0, 'unchanged': 0, 'failed': 0, 'skipped': len(ncfiles)}
+
+    # A file changed since it was processed is processed again
+    stat = os.stat(ncfiles[1])
+    os.utime(ncfiles[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    counts = find_and_add_meta(ncfiles, metadata, {}, [], journal=journal, resume=True, jobs=jobs)
+    assert counts == {'updated': 1, 'unchanged': 0, 'failed': 0, 'skipped': len(ncfiles) - 1}
+
+    # As is every file when the meta data changes
+    changed = {'global': {'Publisher': 'someone else'}}
+    counts = find_and_add_meta(ncfiles, changed, {}, [], journal=journal, resume=True, jobs=jobs)
+    assert counts['updated'] == len(ncfiles)
+    assert all(get_meta_data_from_file(file)['Publisher'] == 'someone else' for file in ncfiles)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_keep_going(ncfiles, tmp_path, jobs):
+
+    journal = tmp_path / 'journal'
+    missing = str(tmp_path / 'missing.nc')
+    files = ncfiles[:2] + [missing] + ncfiles[2:]
+
+    with pytest.raises(ProcessingErrors, match="1 file\\(s\\) failed:\n  .*missing.nc: FileNotFoundError") as excinfo:
+        find_and_add_meta(files, metadata, {}, [], journal=journal, keep_going=True, jobs=jobs)
+
+    assert [fname for fname, _ in excinfo.value.failures] == [missing]
+    assert excinfo.value.counts['updated'] == len(ncfiles)
+    for file in ncfiles:
+        assert get_meta_data_from_file(file)['Publisher'] == 'ACCESS-NRI'
+    assert [entry['status'] for entry in read_journal(journal)] == ['updated'] * 2 + ['failed'] + ['updated'] * (len(ncfiles) - 2)
+
+    # Only the failed file is tried again
+    Path(missing).write_bytes(Path(ncfiles[0]).read_bytes())
+    counts = find_and_add_meta(files, metadata, {}, [], journal=journal, resume=True, jobs=jobs)
+    assert counts == {'updated': 1, 'unchanged': 0, 'failed': 0, 'skipped': len(ncfiles)}
+
+def test_stop_at_first_failure(ncfiles, tmp_path):
+
+    journal = tmp_path / 'journal'
+    files = ncfiles[:1] + [str(tmp_path / 'missing.nc')] + ncfiles[1:]
+
+    with pytest.raises(FileNotFoundError):
+        find_and_add_meta(files, metadata, {}, [], journal=journal)
+
+    assert [entry['status'] for entry in read_journal(journal)] == ['updated', 'failed']
+
+def test_cli_resume(ncfiles, tmp_path, capsys):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n  Publisher: ACCESS-NRI\n")
+    args = [f"-m={metafile}", f"--journal={tmp_path / 'journal'}", "--resume", *ncfiles]
+
+    addmeta.cli.main(addmeta.cli.main_parse_args(args))
+    addmeta.cli.main(addmeta.cli.main_parse_args(args))
+
+    assert capsys.readouterr().out.splitlines()[-1] == f"Files updated: 0, unchanged: 0, failed: 0, skipped: {len(ncfiles)}"
+
+def test_cli_keep_going(ncfiles, tmp_path, capsys):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n  filename: '{{ __file__.name }}'\n")
+    args = [f"-m={metafile}", "--keep-going", str(tmp_path / 'missing.nc'), *ncfiles]
+
+    with pytest.raises(SystemExit, match="Error: 1 file\\(s\\) failed"):
+        addmeta.cli.main(addmeta.cli.main_parse_args(args))
+
+    assert capsys.readouterr().out.splitlines()[-1] == f"Files updated: {len(ncfiles)}, unchanged: 0, failed: 1"
+
+def test_cli_resume_requires_journal():
+
+    with pytest.raises(SystemExit, match="Error: --resume requires --journal"):
+        addmeta.cli.main_parse_args(["-m=meta.yaml", "--resume", "file.nc"])
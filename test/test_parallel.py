@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from addmeta import find_and_add_meta
+from common import make_nc, ncfiles, get_meta_data_from_file
+
+metadata = {
+    'global':
+    {
+        'Publisher': 'ACCESS-NRI',
+        'frequency': '{{ __file__.frequency }}',
+        'filename': '{{ __file__.name }}',
+        'realm': '{{ __argdata__.realm }}',
+    },
+    'variables':
+    {
+        'temp': {'units': 'K'},
+    },
+}
+
+fnregexs = [r'^.*?\.(?P<frequency>.*?)\.nc$']
+
+@pytest.mark.parametrize("jobs", [2, 0])
+def test_parallel_matches_serial(ncfiles, jobs):
+
+    find_and_add_meta(ncfiles, metadata, {'__argdata__': {'realm': 'ocean'}}, fnregexs, jobs=jobs)
+
+    for file in ncfiles:
+        attrs = get_meta_data_from_file(file)
+        assert attrs['Publisher'] == 'ACCESS-NRI'
+        assert attrs['frequency'] == file.split('.')[-2]
+        assert attrs['filename'] == Path(file).name
+        assert attrs['realm'] == 'ocean'
+        assert get_meta_data_from_file(file, 'temp')['units'] == 'K'
+
+def test_parallel_verbose_order(ncfiles, capsys):
+
+    find_and_add_meta(ncfiles, metadata, {'__argdata__': {'realm': 'ocean'}}, fnregexs, verbose=True, jobs=3)
+
+    output = capsys.readouterr().out.splitlines()
+
+    assert output[0] == "Processing netCDF files:"
+    assert [line.strip() for line in output if line.startswith("  /")] == ncfiles
+
+def test_parallel_warnings(ncfiles):
+
+    # __file__.missing is not defined so the attribute is skipped for every file
+    meta = {'global': {'missing': '{{ __file__.missing }}'}}
+    with pytest.warns(UserWarning, match="Skip setting attribute 'missing'") as record:
+        find_and_add_meta(ncfiles, meta, {}, fnregexs, jobs=2)
+
+    assert len([w for w in record if 'missing' in str(w.message)]) == len(ncfiles)
+
+def test_parallel_error(ncfiles):
+
+    # Insert a missing file, files after it should not be reported as processed
+    missing = str(Path(ncfiles[0]).parent / 'missing.1day.nc')
+    ncfiles.insert(4, missing)
+
+    with pytest.raises(FileNotFoundError, match='missing.1day.nc'):
+        find_and_add_meta(ncfiles, metadata, {'__argdata__': {'realm': 'ocean'}}, fnregexs, jobs=2)
+
+    for file in ncfiles[:4]:
+        assert get_meta_data_from_file(file)['Publisher'] == 'ACCESS-NRI'
+
+def test_parallel_generator(ncfiles):
+
+    # Files can come from a generator, e.g. reading a pipe, of unknown length
+    find_and_add_meta((file for file in ncfiles), metadata, {'__argdata__': {'realm': 'ocean'}}, fnregexs, jobs=2)
+
+    for file in ncfiles:
+        assert get_meta_data_from_file(file)['frequency'] == file.split('.')[-2]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import pickle
+
+import jinja2
+import pytest
+
+import addmeta.addmeta
+from addmeta import AttributePlan, CompiledAttribute, find_and_add_meta
+from common import make_nc, get_meta_data_from_file
+
+@pytest.mark.parametrize(
+    "source,value,is_constant,convert_to_number",
+    [
+        ("plain string", "plain string", True, False),
+        ("trailing newline\n", "trailing newline", True, False),
+        (5, 5, True, False),
+        (1.5, 1.5, True, False),
+        (None, None, True, False),
+        (['a', 'b', 'c'], "a,b,c", True, False),
+        (('1', '2'), "1,2", True, False),
+        ("{{ x }}", "{{ x }}", False, False),
+        ("{{ x | number }}", "{{ x  }}", False, True),
+    ]
+)
+def test_compile_attribute(source, value, is_constant, convert_to_number):
+
+    compiled = CompiledAttribute(source)
+
+    assert compiled.is_constant == is_constant
+    assert compiled.convert_to_number == convert_to_number
+    if is_constant:
+        assert compiled.value == value
+        assert compiled.render({}) == value
+
+def test_compile_attribute_render():
+
+    assert CompiledAttribute("{{ x }}").render({'x': 'one'}) == 'one'
+    assert CompiledAttribute("{{ x | number }}").render({'x': '5'}) == 5
+    assert CompiledAttribute("{{ x | number }}").render({'x': '5.5'}) == 5.5
+
+    with pytest.raises(jinja2.UndefinedError):
+        CompiledAttribute("{{ x }}").render({})
+
+def test_compile_attribute_bad_filter():
+
+    # Template errors are raised when compiling, before any file is touched
+    with pytest.raises(jinja2.exceptions.TemplateAssertionError, match="No filter named 'number'"):
+        CompiledAttribute("{{ x | number | float }}")
+
+def test_compile_attribute_pickle():
+
+    compiled = pickle.loads(pickle.dumps(CompiledAttribute("{{ x | number }}")))
+
+    assert compiled.render({'x': '5'}) == 5
+
+def test_attribute_plan():
+
+    plan = AttributePlan({
+        'global': {'a': 'a', 'b': '{{ x }}', 'c': '{{ y }}', 'd': None},
+        'variables': {'temp': {'units': 'K'}, 'salt': {'units': 'psu'}},
+        'rename': {'variables': {'T': 'temp'}},
+    })
+
+    assert plan.has_global
+    assert plan.rename == {'variables': {'T': 'temp'}, 'dimensions': {}}
+
+    with pytest.warns(UserWarning, match="Skip setting attribute 'c'"):
+        rendered = plan.render({'x': 'ex'}, variables=['temp'])
+
+    assert rendered == {
+        'global': {'a': 'a', 'b': 'ex', 'd': None},
+        'variables': {'temp': {'units': 'K'}},
+    }
+
+@pytest.mark.parametrize(
+    "source,variables",
+    [
+        ("plain", set()),
+        ("{{ __file__.name }}", {'__file__'}),
+        ("{{ __datetime__.now }} {{ job.id }}", {'__datetime__', 'job'}),
+        ("{% set a = 1 %}{{ a }}{{ __argdata__.freq | number }}", {'__argdata__'}),
+    ]
+)
+def test_compile_attribute_variables(source, variables):
+
+    assert CompiledAttribute(source).variables == variables
+
+def test_attribute_plan_resolve():
+
+    plan = AttributePlan({
+        'global': {
+            'freq': '{{ __argdata__.freq }}',
+            'n': '{{ __argdata__.n | number }}',
+            'name': '{{ __file__.name }}',
+            'undefined': '{{ job.id }}',
+        },
+        'variables': {'temp': {'units': '{{ __argdata__.units }}'}},
+    })
+
+    assert plan.file_variables == {'__file__'}
+
+    with pytest.warns(UserWarning, match="Skip setting attribute 'undefined'"):
+        resolved = plan.resolve({'__argdata__': {'freq': '1day', 'n': '3', 'units': 'K'}})
+
+    # Run-constant attributes are rendered once, per-file ones are left as templates
+    assert resolved.global_attrs['freq'].is_constant
+    assert resolved.global_attrs['n'].value == 3
+    assert not resolved.global_attrs['name'].is_constant
+    assert 'undefined' not in resolved.global_attrs
+    assert resolved.variables['temp']['units'].value == 'K'
+
+    # The original plan is unchanged
+    assert not plan.global_attrs['freq'].is_constant
+    assert resolved.file_variables == {'__file__'}
+
+    # Constants survive pickling without being re-templated
+    resolved = pickle.loads(pickle.dumps(resolved))
+    assert resolved.render({'__file__': {'name': 'file.nc'}})['global'] == {
+        'freq': '1day', 'n': 3, 'name': 'file.nc',
+    }
+
+def test_file_metadata_only_when_referenced(make_nc, monkeypatch):
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should not be called")
+
+    monkeypatch.setattr(addmeta.addmeta, 'get_file_metadata', fail)
+    monkeypatch.setattr(addmeta.addmeta, 'match_filename_regex', fail)
+
+    find_and_add_meta([make_nc], {'global': {'freq': '{{ __argdata__.freq }}'}}, {'__argdata__': {'freq': '1day'}}, ['.*'])
+
+    assert get_meta_data_from_file(make_nc)['freq'] == '1day'
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_filename_vars_reported_when_unused(make_nc, capsys, prefetch):
+
+    find_and_add_meta([make_nc], {'global': {'Publisher': 'ACCESS-NRI'}}, {}, [r'(?P<name>test)\.nc'], verbose=True, prefetch=prefetch)
+
+    assert "Matched following filename variables: {'name': 'test'}" in capsys.readouterr().out
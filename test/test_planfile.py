@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import warnings
+
+import pytest
+
+import addmeta.cli
+from addmeta import (
+    PlanError,
+    ProcessingErrors,
+    apply_plan,
+    find_and_add_meta,
+    make_plan,
+    read_plan_file,
+)
+from addmeta.planfile import PLAN_VERSION, read_plan
+from addmeta.shard import shard_files
+from common import copy_nc, make_nc, ncfiles, get_meta_data_from_file
+
+metadata = {
+    'rename': {'variables': {'temp': 'temperature'}},
+    'global': {
+        'frequency': '{{ __file__.frequency }}',
+        'filename': '{{ __file__.name }}',
+        'size': '{{ __file__.size | number }}',
+        'Publisher': 'ACCESS-NRI',
+        'unlikelytobeoverwritten': None,
+    },
+    'variables': {
+        'temperature': {'units': 'K', 'long_name': 'Temperature {{ __file__.frequency }}'},
+        'notinfile': {'units': 'm'},
+    },
+}
+
+fnregexs = [r'^.*?\.(?P<frequency>.*?)\.nc$']
+
+def attributes(fname):
+    return get_meta_data_from_file(fname), get_meta_data_from_file(fname, 'temperature')
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_plan_matches_direct(make_nc, ncfiles, tmp_path, jobs):
+
+    (tmp_path / 'direct').mkdir()
+    direct = copy_nc(make_nc, tmp_path / 'direct')
+    find_and_add_meta(direct, metadata, {}, fnregexs, sort_attrs=True, history="planned history")
+
+    planfile = tmp_path / 'files.plan'
+    counts = make_plan(planfile, ncfiles, metadata, {}, fnregexs, sort_attrs=True, history="planned history", jobs=jobs)
+    assert counts['planned'] == len(ncfiles)
+
+    header, plan, prepared = read_plan_file(planfile)
+    counts = apply_plan(prepared, plan, sort_attrs=header['sort_attrs'], history=header['history'], jobs=jobs)
+    assert counts['updated'] == len(ncfiles)
+
+    for planned, expected in zip(ncfiles, direct):
+        assert attributes(planned) == attributes(expected)
+    assert get_meta_data_from_file(ncfiles[1])['frequency'] == '1mon'
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_plan_contents(ncfiles, tmp_path, jobs):
+
+    mtimes = [os.stat(f).st_mtime_ns for f in ncfiles]
+    planfile = tmp_path / 'files.plan'
+    make_plan(planfile, ncfiles, metadata, {}, fnregexs, jobs=jobs, addmeta_version='1.0')
+
+    # Planning doesn't modify any file
+    assert [os.stat(f).st_mtime_ns for f in ncfiles] == mtimes
+    assert not Path(f'{planfile}.tmp').exists()
+
+    header, entries = read_plan(planfile)
+    entries = list(entries)
+    assert header['addmeta_plan'] == PLAN_VERSION
+    assert header['addmeta'] == '1.0'
+    assert header['rename'] == {'variables': {'temp': 'temperature'}, 'dimensions': {}}
+    assert header['variables'] == ['temperature', 'notinfile']
+    assert [entry['file'] for entry in entries] == ncfiles
+
+    entry = entries[0]
+    assert entry['global']['frequency'] == '1day'
+    assert entry['global']['size'] == os.path.getsize(ncfiles[0])
+    assert entry['global']['unlikelytobeoverwritten'] is None
+    assert entry['variables']['temperature'] == {'units': 'K', 'long_name': 'Temperature 1day'}
+    # The file's stat is used, so its state is recorded
+    assert entry['state'] == {'mtime_ns': mtimes[0], 'size': os.path.getsize(ncfiles[0])}
+
+def test_plan_template_errors(ncfiles, tmp_path):
+
+    meta = {'global': {'title': 'Model {{ __file__.model }}', 'Publisher': 'ACCESS-NRI'}}
+    planfile = tmp_path / 'files.plan'
+
+    # Reported for every file before any is modified
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        make_plan(planfile, ncfiles, meta, {}, [])
+    messages = [str(w.message) for w in caught]
+    assert len(messages) == len(ncfiles)
+    assert all("Skip setting attribute 'title'" in message for message in messages)
+    assert all(get_meta_data_from_file(f)['Publisher'] == 'Will be overwritten' for f in ncfiles)
+
+    header, plan, prepared = read_plan_file(planfile)
+    with pytest.warns(UserWarning, match="Skip setting attribute 'title'"):
+        apply_plan(prepared, plan)
+    assert all(get_meta_data_from_file(f)['Publisher'] == 'ACCESS-NRI' for f in ncfiles)
+
+@pytest.mark.parametrize("keep_going", [False, True])
+def test_plan_missing_files(ncfiles, tmp_path, keep_going):
+
+    planfile = tmp_path / 'files.plan'
+    missing = [str(tmp_path / 'missing_1.1day.nc'), str(tmp_path / 'missing_2.1day.nc')]
+
+    with pytest.raises(ProcessingErrors) as excinfo:
+        make_plan(planfile, [missing[0], *ncfiles, missing[1]], metadata, {}, fnregexs, keep_going=keep_going)
+
+    # All failures are reported
+    assert [fname for fname, _ in excinfo.value.failures] == missing
+    assert excinfo.value.counts['planned'] == len(ncfiles)
+    if keep_going:
+        _, entries = read_plan(planfile)
+        assert [entry['file'] for entry in entries] == ncfiles
+    else:
+        assert not planfile.exists()
+    assert not Path(f'{planfile}.tmp').exists()
+
+def test_plan_unstorable_value(ncfiles, tmp_path):
+
+    planfile = tmp_path / 'files.plan'
+    with pytest.raises(ProcessingErrors, match="can't be stored in a plan"):
+        make_plan(planfile, ncfiles, {'global': {'date': datetime.date(2025, 1, 1)}}, {}, [])
+
+def test_apply_changed_file(ncfiles, tmp_path):
+
+    planfile = tmp_path / 'files.plan'
+    make_plan(planfile, ncfiles, metadata, {}, fnregexs)
+    with open(ncfiles[1], 'ab') as f:
+        f.write(b'\0')
+
+    header, plan, prepared = read_plan_file(planfile)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        counts = apply_plan(prepared, plan)
+
+    assert [str(w.message) for w in caught] == [f"{ncfiles[1]} has changed since it was planned, attributes from its size or modification time may be out of date"]
+    assert counts['updated'] == len(ncfiles)
+
+def test_read_plan_errors(tmp_path):
+
+    notplan = tmp_path / 'notplan'
+    notplan.write_text("global:\n  Publisher: ACCESS-NRI\n")
+    with pytest.raises(PlanError, match="not an addmeta plan"):
+        read_plan(notplan)
+
+    newer = tmp_path / 'newer.plan'
+    newer.write_text(json.dumps({'addmeta_plan': PLAN_VERSION + 1}) + "\n")
+    with pytest.raises(PlanError, match="version"):
+        read_plan(newer)
+
+def test_read_plan_corrupt_entry(ncfiles, tmp_path):
+
+    planfile = tmp_path / 'files.plan'
+    make_plan(planfile, ncfiles, metadata, {}, fnregexs)
+    lines = planfile.read_text().splitlines(keepends=True)
+    lines[2] = lines[2][:20] + "\n"
+    planfile.write_text("".join(lines))
+
+    header, entries = read_plan(planfile)
+    assert next(entries)['file'] == ncfiles[0]
+    with pytest.raises(PlanError, match="line 3 is not a valid plan entry"):
+        next(entries)
+
+    with pytest.raises(SystemExit, match="Error: .*line 3 is not a valid plan entry"):
+        addmeta.cli.COMMANDS['apply']([str(planfile)])
+    assert get_meta_data_from_file(ncfiles[0])['frequency'] == '1day'
+
+def test_cli_plan_apply(ncfiles, tmp_path, capsys, monkeypatch):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n  Publisher: ACCESS-NRI\n  filename: '{{ __file__.name }}'\n")
+    planfile = tmp_path / 'files.plan'
+
+    monkeypatch.setattr(sys, 'argv', ['addmeta', 'plan', str(planfile), '-m', str(metafile), '--update-history', *ncfiles])
+    addmeta.cli.main_argv()
+    assert all(get_meta_data_from_file(f)['Publisher'] == 'Will be overwritten' for f in ncfiles)
+
+    header, _ = read_plan(planfile)
+    assert header['history'].endswith(f"plan {planfile} -m {metafile} --update-history")
+
+    addmeta.cli.COMMANDS['apply']([str(planfile), '--shard=0/2', '-v'])
+    shard = list(shard_files(ncfiles, (0, 2)))
+    for ncfile in ncfiles:
+        meta = get_meta_data_from_file(ncfile)
+        if ncfile in shard:
+            assert meta['Publisher'] == 'ACCESS-NRI'
+            assert meta['filename'] == Path(ncfile).name
+            assert meta['history'].endswith(header['history'])
+        else:
+            assert meta['Publisher'] == 'Will be overwritten'
+    assert "Files updated: " in capsys.readouterr().out
+
+@pytest.mark.parametrize("options", [['-m', 'meta.yaml'], ['--jobs', '4']])
+def test_cli_plan_output_first(ncfiles, tmp_path, monkeypatch, options):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n  Publisher: ACCESS-NRI\n")
+    original = metafile.read_bytes()
+    monkeypatch.chdir(tmp_path)
+
+    # An option's value is never taken for the output
+    with pytest.raises(SystemExit, match='output file must be the first argument'):
+        addmeta.cli.COMMANDS['plan']([*options, 'files.plan', *ncfiles])
+
+    assert metafile.read_bytes() == original
+    assert not {'files.plan', '4', '4.tmp', 'meta.yaml.tmp'} & set(os.listdir(tmp_path))
+
+def test_cli_apply_not_a_plan(tmp_path):
+
+    with pytest.raises(SystemExit, match="Error: .*not an addmeta plan"):
+        addmeta.cli.COMMANDS['apply'](["test/meta1.yaml"])
+
+def test_cli_command_and_file(make_nc, tmp_path, monkeypatch):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n  Publisher: ACCESS-NRI\n")
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(make_nc, 'plan')
+
+    # The command wins, with a warning
+    monkeypatch.setattr(sys, 'argv', ['addmeta', 'plan', 'files.plan', '-m', str(metafile), make_nc])
+    with pytest.warns(UserWarning, match="give it as ./plan"):
+        addmeta.cli.main_argv()
+    assert (tmp_path / 'files.plan').exists()
+    assert get_meta_data_from_file('plan')['Publisher'] == 'Will be overwritten'
+
+    monkeypatch.setattr(sys, 'argv', ['addmeta', '-m', str(metafile), './plan'])
+    addmeta.cli.main_argv()
+    assert get_meta_data_from_file('plan')['Publisher'] == 'ACCESS-NRI'
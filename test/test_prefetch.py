@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from pathlib import Path
+import shutil
+import threading
+import warnings
+
+import pytest
+
+from addmeta import find_and_add_meta
+from addmeta.timing import start_timing, stop_timing, timed, timed_file
+from common import make_nc, ncfiles, get_meta_data_from_file
+
+metadata = {
+    'global': {
+        'frequency': '{{ __file__.frequency }}',
+        'filename': '{{ __file__.name }}',
+        'size': '{{ __file__.size }}',
+    },
+    'variables': {
+        'temp': {'units': 'K', 'missing': '{{ __file__.missing }}'},
+        'notinfile': {'missing': '{{ __file__.missing }}'},
+    },
+}
+
+fnregexs = [r'^.*?\.(?P<frequency>.*?)\.nc$']
+
+def run(ncfiles, prefetch, **kwargs):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        find_and_add_meta(ncfiles, metadata, {}, fnregexs, prefetch=prefetch, **kwargs)
+    return [str(w.message) for w in caught]
+
+@pytest.mark.parametrize("prefetch", [1, 4])
+def test_prefetch_matches_serial(ncfiles, tmp_path, capsys, prefetch):
+
+    (tmp_path / 'serial').mkdir()
+    serial = [str(tmp_path / 'serial' / Path(file).name) for file in ncfiles]
+    for file, copy in zip(ncfiles, serial):
+        shutil.copy(file, copy)
+
+    serial_warnings = run(serial, 0, verbose=True)
+    serial_output = capsys.readouterr().out.replace(str(tmp_path / 'serial'), str(tmp_path))
+
+    prefetch_warnings = run(ncfiles, prefetch, verbose=True)
+    prefetch_output = capsys.readouterr().out
+
+    # Same output and warnings, in the same order. Attributes for variables
+    # that aren't in the file don't warn
+    assert prefetch_output == serial_output
+    assert prefetch_warnings == serial_warnings
+    assert len(prefetch_warnings) == len(ncfiles)
+    assert all("temp:missing" in message for message in prefetch_warnings)
+
+    for file in ncfiles:
+        attrs = get_meta_data_from_file(file)
+        assert attrs['frequency'] == file.split('.')[-2]
+        assert attrs['filename'] == Path(file).name
+        assert int(attrs['size']) > 0
+        assert get_meta_data_from_file(file, 'temp')['units'] == 'K'
+
+def test_prefetch_error(ncfiles):
+
+    # Files before the missing one are written, none after it
+    missing = str(Path(ncfiles[0]).parent / 'missing.1day.nc')
+    ncfiles.insert(4, missing)
+
+    with pytest.raises(FileNotFoundError, match='missing.1day.nc'):
+        run(ncfiles, 4)
+
+    for file in ncfiles[:4]:
+        assert get_meta_data_from_file(file)['frequency'] == file.split('.')[-2]
+    for file in ncfiles[5:]:
+        assert 'frequency' not in get_meta_data_from_file(file)
+
+def test_prefetch_timings(ncfiles):
+
+    timings = start_timing()
+    try:
+        run(ncfiles, 3)
+    finally:
+        stop_timing()
+
+    assert list(timings.files) == ncfiles
+    totals = timings.totals()
+    assert totals["per file total"]["calls"] == len(ncfiles)
+    assert totals["file stat"]["calls"] == len(ncfiles)
+    assert totals["render"]["calls"] == len(ncfiles)
+
+def test_timing_threads():
+
+    # Each thread attributes phases to its own file
+    timings = start_timing()
+    try:
+        def work(fname):
+            with timed_file(fname, total=False):
+                with timed("render"):
+                    pass
+        threads = [threading.Thread(target=work, args=(f"{n}.nc",)) for n in range(4)]
+        with timed_file("main.nc"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with timed("open"):
+                pass
+    finally:
+        stop_timing()
+
+    assert list(timings.files["main.nc"]) == ["open", "total"]
+    for n in range(4):
+        assert timings.files[f"{n}.nc"] == {"render": {"time": pytest.approx(0, abs=1), "calls": 1}}
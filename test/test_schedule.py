@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import shutil
+import threading
+import time
+
+import pytest
+
+from addmeta import find_and_add_meta
+from addmeta.schedule import (
+    SCHEDULERS,
+    Scheduler,
+    make_scheduler,
+    map_scheduled,
+    register_scheduler,
+)
+from addmeta.walk import walk_files
+from common import make_nc, get_meta_data_from_file
+
+@pytest.fixture
+def files(tmp_path):
+    sizes = {'a/1.nc': 10, 'b/1.nc': 30, 'a/2.nc': 20, 'c/1.nc': 30, 'b/2.nc': 5}
+    paths = []
+    for name, size in sizes.items():
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'x' * size)
+        paths.append(str(path))
+    return paths
+
+def names(files, root):
+    return [str(Path(f).relative_to(root)) for f in files]
+
+def test_input_order(files, tmp_path):
+
+    assert make_scheduler().order(files) == files
+
+def test_directory_order(files, tmp_path):
+
+    ordered = make_scheduler("directory").order(iter(files))
+
+    assert names(ordered, tmp_path) == ['a/1.nc', 'a/2.nc', 'b/1.nc', 'b/2.nc', 'c/1.nc']
+
+def test_size_order(files, tmp_path):
+
+    ordered = make_scheduler("size").order(files)
+
+    assert names(ordered, tmp_path) == ['b/1.nc', 'c/1.nc', 'a/2.nc', 'a/1.nc', 'b/2.nc']
+
+def test_fnregex_order(files, tmp_path):
+
+    scheduler = make_scheduler("fnregex", fnregexs=[r'/(?P<number>\d+)\.nc$'])
+    ordered = scheduler.order(iter(files))
+
+    assert names(ordered, tmp_path) == ['a/1.nc', 'b/1.nc', 'c/1.nc', 'a/2.nc', 'b/2.nc']
+
+def test_size_order_walked(files, tmp_path, monkeypatch):
+
+    # The stat of files found by walk_files is reused
+    walked = list(walk_files([tmp_path], stat=True))
+    monkeypatch.setattr("os.stat", None)
+
+    ordered = make_scheduler("size").order(walked)
+
+    assert names(ordered, tmp_path) == ['b/1.nc', 'c/1.nc', 'a/2.nc', 'a/1.nc', 'b/2.nc']
+
+@pytest.mark.parametrize("limit", [None, 1, 2])
+def test_map_scheduled(limit):
+
+    items = [f'a/{n}' for n in range(6)] + [f'b/{n}' for n in range(3)]
+    lock = threading.Lock()
+    active, peak = Counter(), Counter()
+
+    def work(chunk):
+        [item] = chunk
+        group = item.split('/')[0]
+        with lock:
+            active[group] += 1
+            peak[group] = max(peak[group], active[group])
+        time.sleep(0.005)
+        with lock:
+            active[group] -= 1
+        return [item.upper()]
+
+    scheduler = Scheduler(max_per_group=limit)
+    scheduler.group = lambda item: item.split('/')[0]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(map_scheduled(executor, work, iter(items), scheduler, window=4))
+
+    assert sorted(results) == sorted((item, item.upper()) for item in items)
+    if limit is None:
+        assert [item for item, _ in results] == items
+    else:
+        assert max(peak.values()) <= limit
+        # b files are started while a files wait for room
+        assert [item for item, _ in results].index('b/0') < items.index('b/0')
+
+def test_register_scheduler(files, tmp_path):
+
+    class ReverseScheduler(Scheduler):
+        def order(self, files):
+            return list(files)[::-1]
+
+    register_scheduler("reverse", ReverseScheduler)
+    try:
+        assert make_scheduler("reverse").order(files) == files[::-1]
+    finally:
+        del SCHEDULERS["reverse"]
+
+@pytest.mark.parametrize("scheduler,jobs", [("size", 1), ("directory", 2), ("fnregex", 2), (Scheduler(max_per_group=1), 2)])
+def test_find_and_add_meta_scheduler(make_nc, tmp_path, scheduler, jobs):
+
+    ncfiles = [str(tmp_path / d / f'{n}.nc') for n in range(3) for d in 'xy']
+    for ncfile in ncfiles:
+        Path(ncfile).parent.mkdir(exist_ok=True)
+        shutil.copy(make_nc, ncfile)
+
+    counts = find_and_add_meta(ncfiles, {'global': {'name': '{{ __file__.name }}'}}, {}, [], jobs=jobs, scheduler=scheduler)
+
+    assert counts['updated'] == len(ncfiles)
+    for ncfile in ncfiles:
+        assert get_meta_data_from_file(ncfile)['name'] == Path(ncfile).name
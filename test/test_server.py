@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from addmeta.bundle import write_bundle
+from addmeta.server import AddmetaServer, Profile, ProfileError, RequestHandler, remove_stale_socket, request, submit
+from common import get_meta_data_from_file, make_nc
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    (tmp_path / 'meta.yaml').write_text('global:\n  Publisher: ACCESS-NRI\n  filename: "{{ __file__.name }}"\n')
+    (tmp_path / 'profile.args').write_text('-m=meta.yaml\n--sort\n')
+    return tmp_path
+
+@pytest.fixture
+def server(profile_dir):
+    socket_path = str(profile_dir / 'addmeta.sock')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'addmeta.cli', 'serve', '--socket', socket_path,
+         '--profile', f"ocean={profile_dir / 'profile.args'}"],
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(200):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    yield socket_path
+    if proc.poll() is None:
+        list(request({"command": "shutdown"}, socket_path))
+    proc.wait(timeout=10)
+    assert not os.path.exists(socket_path)
+
+def test_profile_reload(profile_dir):
+
+    profile = Profile('ocean', profile_dir / 'profile.args')
+
+    assert profile.refresh()
+    assert not profile.refresh()
+    assert profile.args.sort
+    assert set(profile.plan.global_attrs) == {'Publisher', 'filename'}
+
+    (profile_dir / 'meta.yaml').write_text('global:\n  Publisher: Someone else\n')
+
+    assert profile.refresh()
+    assert profile.loads == 2
+    assert set(profile.plan.global_attrs) == {'Publisher'}
+
+def test_profile_options(profile_dir):
+
+    for option in ['--jobs=4', '--recursive=output', 'meta.yaml', '--journal=run.journal']:
+        (profile_dir / 'bad.args').write_text(f'-m=meta.yaml\n{option}\n')
+        with pytest.raises(ProfileError, match="can't be used in a profile"):
+            Profile('bad', profile_dir / 'bad.args').load()
+
+    (profile_dir / 'bad.args').write_text('--bundle=missing.bundle\n')
+    with pytest.raises(ProfileError, match="missing.bundle"):
+        Profile('bad', profile_dir / 'bad.args').load()
+
+def test_submit_bundle(server, profile_dir, make_nc):
+
+    bundle = profile_dir / 'meta.bundle'
+    write_bundle(bundle, {'global': {'Publisher': 'FROM_BUNDLE'}}, {}, [])
+    (profile_dir / 'bundle.args').write_text('--bundle=meta.bundle\n')
+
+    counts = submit([make_nc], str(profile_dir / 'bundle.args'), server)
+    assert counts['updated'] == 1
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'FROM_BUNDLE'
+
+    # Recompiling the bundle reloads the profile
+    write_bundle(bundle, {'global': {'Publisher': 'RECOMPILED'}}, {}, [])
+    submit([make_nc], str(profile_dir / 'bundle.args'), server)
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'RECOMPILED'
+
+def test_submit(server, profile_dir, make_nc, capfd):
+
+    second = str(profile_dir / 'ocean.nc')
+    shutil.copy(make_nc, second)
+
+    counts = submit([make_nc, second], 'ocean', server, verbose=True)
+
+    assert counts == {'updated': 2, 'unchanged': 0, 'failed': 0}
+    for fname in (make_nc, second):
+        attributes = get_meta_data_from_file(fname)
+        assert attributes['Publisher'] == 'ACCESS-NRI'
+        assert attributes['filename'] == os.path.basename(fname)
+        # --sort from the profile
+        assert list(attributes) == sorted(attributes, key=str.lower)
+
+    out, _ = capfd.readouterr()
+    assert f'  {second}' in out
+    assert 'Loaded profile ocean' not in out
+
+    # The profile is recompiled when its meta data changes
+    (profile_dir / 'meta.yaml').write_text('global:\n  Publisher: Someone else\n')
+    submit([make_nc], 'ocean', server, verbose=True)
+
+    assert 'Loaded profile ocean' in capfd.readouterr().out
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'Someone else'
+    assert list(request({"command": "status"}, server))[0]['ocean']['loads'] == 2
+
+def test_submit_cmdlineargs_file(server, profile_dir, make_nc):
+
+    counts = submit([make_nc], str(profile_dir / 'profile.args'), server)
+
+    assert counts['updated'] == 1
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'ACCESS-NRI'
+
+def test_submit_stops_at_failure(server, profile_dir, make_nc, capfd):
+
+    missing = str(profile_dir / 'missing' / 'missing.nc')
+
+    counts = submit([missing, make_nc], 'ocean', server)
+
+    assert counts == {'updated': 0, 'unchanged': 0, 'failed': 1}
+    assert f'Error processing {missing}' in capfd.readouterr().err
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'Will be overwritten'
+
+def test_submit_unknown_profile(server, make_nc):
+
+    with pytest.raises(RuntimeError, match='no profile named nonsense'):
+        submit([make_nc], 'nonsense', server)
+
+def test_stale_socket(server, tmp_path):
+
+    with pytest.raises(RuntimeError, match='already listening'):
+        remove_stale_socket(server)
+
+    # Left behind by a server that didn't remove it
+    stale = tmp_path / 'stale.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(stale))
+    remove_stale_socket(str(stale))
+    assert not stale.exists()
+
+    # Anything else is never removed
+    notsocket = tmp_path / 'metadata.yaml'
+    notsocket.write_text('global: {}\n')
+    with pytest.raises(RuntimeError, match='not a socket'):
+        remove_stale_socket(str(notsocket))
+    assert notsocket.exists()
+
+def test_request_timeout(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(RequestHandler, 'timeout', 0.2)
+    server = AddmetaServer(tmp_path / 'addmeta.sock')
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(server.socket_path)
+            # Connect, but never send a request
+            with sock.makefile('rb') as reply:
+                assert json.loads(reply.readline()) == {'error': 'no request received within 0.2 s'}
+    finally:
+        thread.join(timeout=10)
+        server.server_close()
+
+    assert not thread.is_alive()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+
+import pytest
+
+import addmeta.cli
+import addmeta.validate
+from addmeta.shard import parse_shard, path_shard, shard_files, size_shards
+from common import make_nc, get_meta_data_from_file
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for n in range(40):
+        path = tmp_path / f'{n:02d}.nc'
+        path.write_bytes(b'x' * (n * 7 % 23))
+        paths.append(str(path))
+    return paths
+
+def test_parse_shard():
+
+    assert parse_shard("0/1") == (0, 1)
+    assert parse_shard("3/4") == (3, 4)
+    for value in ("4/4", "-1/4", "0/0", "1", "a/b", "1/2/3"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+
+@pytest.mark.parametrize("method", ["hash", "size"])
+@pytest.mark.parametrize("count", [1, 3, 8])
+def test_shards_cover_files_once(files, method, count):
+
+    shards = [list(shard_files(files, (index, count), method)) for index in range(count)]
+
+    assert sorted(fname for shard in shards for fname in shard) == sorted(files)
+    # Files keep the order they were given in
+    for shard in shards:
+        assert shard == [fname for fname in files if fname in shard]
+
+@pytest.mark.parametrize("method", ["hash", "size"])
+def test_shards_are_stable(files, method, tmp_path, monkeypatch):
+
+    shard = list(shard_files(files, (1, 4), method))
+
+    # Whatever the order, or the working directory the paths are relative to
+    monkeypatch.chdir(tmp_path)
+    relative = [os.path.basename(fname) for fname in reversed(files)]
+    assert sorted(shard_files(relative, (1, 4), method)) == sorted(os.path.basename(fname) for fname in shard)
+
+def test_path_shard():
+
+    # Only depends on the path, so can be checked anywhere
+    digest = hashlib.sha256(b'/archive/output000/ocean.nc').digest()
+    assert path_shard('/archive/output000/ocean.nc', 7) == int.from_bytes(digest[:8], 'big') % 7
+    assert path_shard('/archive/output000/../output000/ocean.nc', 7) == path_shard('/archive/output000/ocean.nc', 7)
+
+def test_size_shards_balanced(tmp_path):
+
+    sizes = [50, 40, 30, 20, 20, 10, 10, 10, 5, 5]
+    files = []
+    for n, size in enumerate(sizes):
+        path = tmp_path / f'{n}.nc'
+        path.write_bytes(b'x' * size)
+        files.append(str(path))
+
+    _, shards = size_shards(files, 3)
+
+    totals = [sum(size for size, shard in zip(sizes, shards) if shard == index) for index in range(3)]
+    assert sorted(totals) == [65, 65, 70]
+
+def test_cli_list_files(files, tmp_path, capsys):
+
+    listed = []
+    for index in range(3):
+        args = addmeta.cli.main_parse_args([f"--recursive={tmp_path}", f"--shard={index}/3", "--list-files"])
+        addmeta.cli.main(args)
+        listed.append(capsys.readouterr().out.splitlines())
+
+    assert sorted(fname for shard in listed for fname in shard) == sorted(files)
+    assert listed[1] == list(shard_files(files, (1, 3)))
+
+def test_cli_shard(make_nc, tmp_path):
+
+    ncfiles = [str(tmp_path / f'{n}.nc') for n in range(6)]
+    for ncfile in ncfiles:
+        shutil.copy(make_nc, ncfile)
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n    Publisher: ACCESS-NRI\n")
+    filelist = tmp_path / 'files'
+    filelist.write_text("\n".join(ncfiles) + "\n")
+
+    args = addmeta.cli.main_parse_args([f"-m={metafile}", f"--files-from={filelist}", "--shard=0/2", "--shard-by=size"])
+    assert args.shard == (0, 2)
+    addmeta.cli.main(args)
+
+    shard = shard_files(ncfiles, (0, 2), "size")
+    for ncfile in ncfiles:
+        publisher = get_meta_data_from_file(ncfile).get('Publisher')
+        assert (publisher == 'ACCESS-NRI') == (ncfile in shard)
+
+def test_validate_shard(make_nc, tmp_path, capsys):
+
+    ncfiles = [str(tmp_path / f'{n}.nc') for n in range(6)]
+    for ncfile in ncfiles:
+        shutil.copy(make_nc, ncfile)
+
+    addmeta.validate.main(["-s", "test/examples/schema/test_schema.json", "--shard=2/3", "-v", *ncfiles])
+
+    validated = [line.removeprefix("Validating ") for line in capsys.readouterr().out.splitlines()]
+    assert validated == list(shard_files(ncfiles, (2, 3)))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import datetime, timezone
+import os
+
+import pytest
+
+from addmeta import find_and_add_meta, predict_attributes, attribute_equal
+from addmeta.cli import parse_datetime
+from common import runcmd, make_nc, get_meta_data_from_file
+
+now = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+metadata = {
+    'global':
+    {
+        'Publisher': 'ACCESS-NRI',
+        'unlikelytobeoverwritten': None,
+        'number': 5,
+        'date_metadata_modified': '{{ __datetime__.now }}',
+        'filename': '{{ __file__.name }}',
+    },
+    'variables':
+    {
+        'temp': {'units': 'K', 'long_name': None},
+    },
+    'rename':
+    {
+        'variables': {'Times': 'time'},
+    },
+}
+
+def mtime(fname):
+    return os.stat(fname).st_mtime_ns
+
+@pytest.mark.parametrize("sort_attrs", [False, True])
+def test_skip_unchanged(make_nc, sort_attrs):
+
+    history = f"{now.isoformat()} : addmeta test"
+    kwargs = dict(sort_attrs=sort_attrs, history=history, skip_unchanged=True, now=now)
+
+    counts = find_and_add_meta([make_nc], metadata, {}, [], **kwargs)
+    assert counts == {'updated': 1, 'unchanged': 0, 'failed': 0}
+
+    attrs = get_meta_data_from_file(make_nc)
+    assert attrs['date_metadata_modified'] == '2025-01-02T03:04:05Z'
+    assert attrs['history'] == history
+
+    before = mtime(make_nc)
+
+    # Rerunning with the same pinned time leaves the file untouched
+    counts = find_and_add_meta([make_nc], metadata, {}, [], **kwargs)
+    assert counts == {'updated': 0, 'unchanged': 1, 'failed': 0}
+    assert mtime(make_nc) == before
+    assert get_meta_data_from_file(make_nc) == attrs
+
+    # A real difference is written
+    changed = {'global': {'Publisher': 'Someone else'}}
+    counts = find_and_add_meta([make_nc], changed, {}, [], **kwargs)
+    assert counts == {'updated': 1, 'unchanged': 0, 'failed': 0}
+    assert get_meta_data_from_file(make_nc)['Publisher'] == 'Someone else'
+    # History is not duplicated
+    assert get_meta_data_from_file(make_nc)['history'] == history
+
+def test_skip_unchanged_sort_order(make_nc):
+
+    meta = {'global': {'a': 'a'}}
+
+    # Adding an existing value unsorted is a no-op, sorting is a change
+    find_and_add_meta([make_nc], meta, {}, [])
+    assert find_and_add_meta([make_nc], meta, {}, [], skip_unchanged=True)['unchanged'] == 1
+    assert find_and_add_meta([make_nc], meta, {}, [], sort_attrs=True, skip_unchanged=True)['updated'] == 1
+    assert find_and_add_meta([make_nc], meta, {}, [], sort_attrs=True, skip_unchanged=True)['unchanged'] == 1
+
+def test_skip_unchanged_cli(make_nc, tmp_path):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n    modified: '{{ __datetime__.now }}'\n")
+
+    cmd = f"addmeta --skip-unchanged --update-history --now 2025-01-02T03:04:05Z -m {metafile} {make_nc}"
+    runcmd(cmd)
+    before = get_meta_data_from_file(make_nc)
+    assert before['modified'] == '2025-01-02T03:04:05Z'
+
+    runcmd(cmd)
+    assert get_meta_data_from_file(make_nc) == before
+
+@pytest.mark.parametrize(
+    "current,attr_dict,sort_attrs,is_var,expected",
+    [
+        ({'b': 1, 'a': 2}, {'c': 3}, False, False, {'b': 1, 'a': 2, 'c': 3}),
+        ({'b': 1, 'a': 2}, {'b': None}, False, False, {'a': 2}),
+        ({'b': 1, 'a': 2}, {'c': 3}, True, False, {'a': 2, 'b': 1, 'c': 3}),
+        ({'b': 1, '_FillValue': 2}, {'a': 3}, True, True, {'_FillValue': 2, 'a': 3, 'b': 1}),
+    ]
+)
+def test_predict_attributes(current, attr_dict, sort_attrs, is_var, expected):
+
+    actual = predict_attributes(current, attr_dict, sort_attrs=sort_attrs, is_var=is_var)
+
+    assert list(actual.items()) == list(expected.items())
+
+@pytest.mark.parametrize(
+    "current,value,expected",
+    [
+        ('a', 'a', True),
+        ('5', 5, False),
+        (5, 5.0, False),
+        (5, 5, True),
+        (1.5, 1.5, True),
+    ]
+)
+def test_attribute_equal(current, value, expected):
+
+    assert attribute_equal(current, value) == expected
+
+def test_parse_datetime():
+
+    assert parse_datetime('2025-01-02T03:04:05Z') == now
+    assert parse_datetime('2025-01-02T03:04:05') == now
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from addmeta.lazy import lazy_import
+
+# Submodules that are only imported when their package is actually loaded
+HEAVY_MODULES = ['netCDF4._netCDF4', 'numpy.linalg', 'jinja2.environment', 'yaml.loader',
+                 'requests.api', 'jsonschema.validators', 'referencing.jsonschema']
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+@pytest.mark.parametrize("module", ["addmeta", "addmeta.cli", "addmeta.validate"])
+def test_heavy_dependencies_not_imported(module):
+
+    loaded = run_python(f"import sys, {module}; print(' '.join(sys.modules))").split()
+
+    assert [name for name in HEAVY_MODULES if name in loaded] == []
+
+def test_no_subprocess_at_import():
+
+    output = run_python(
+        "import subprocess\n"
+        "def fail(*args, **kwargs): raise AssertionError('subprocess run at import')\n"
+        "subprocess.Popen = fail\n"
+        "import addmeta, addmeta.cli, addmeta.validate\n"
+        "print('imported')\n"
+    )
+
+    assert output.strip() == 'imported'
+
+def test_version():
+
+    import addmeta
+
+    assert isinstance(addmeta.__version__, str)
+    assert addmeta.__version__ == addmeta.get_version()
+
+def test_lazy_import():
+
+    assert lazy_import('sys') is sys
+
+    sys.modules.pop('colorsys', None)
+    colorsys = lazy_import('colorsys')
+    assert 'colorsys' not in sys.modules
+    assert colorsys.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert 'colorsys' in sys.modules
+
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import('addmeta_no_such_module')
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import pstats
+
+import pytest
+
+from addmeta import find_and_add_meta
+from addmeta.timing import start_timing, stop_timing, timed, timed_file
+from common import make_nc, ncfiles, runcmd
+
+metadata = {
+    'global': {'name': '{{ __file__.name }}'},
+    'variables': {'temp': {'units': 'K'}},
+    'rename': {'variables': {'Times': 'time'}},
+}
+
+def test_timing_disabled():
+
+    # The same do-nothing context manager is returned every time
+    assert timed("open") is timed("close")
+    assert timed_file("file.nc") is timed("open")
+
+def test_timing_phases():
+
+    timings = start_timing()
+    try:
+        with timed("load"):
+            pass
+        for fname in ["a.nc", "b.nc"]:
+            with timed_file(fname):
+                with timed("open"):
+                    pass
+                with timed("open"):
+                    pass
+    finally:
+        assert stop_timing() is timings
+
+    assert timed("open") is timed("close")
+    assert timings.wall_time > 0
+    assert list(timings.run) == ["load"]
+    assert list(timings.files) == ["a.nc", "b.nc"]
+    assert timings.files["a.nc"]["open"]["calls"] == 2
+
+    totals = timings.totals()
+    assert list(totals) == ["load", "open", "per file total"]
+    assert totals["open"]["calls"] == 4
+    assert totals["per file total"]["calls"] == 2
+
+    assert "2 file(s) in" in timings.report()
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_timing_files(ncfiles, jobs):
+
+    timings = start_timing()
+    try:
+        find_and_add_meta(ncfiles, metadata, {}, [], sort_attrs=True, jobs=jobs)
+    finally:
+        stop_timing()
+
+    assert list(timings.files) == ncfiles
+    for phases in timings.files.values():
+        assert {"file stat", "open", "render", "rename", "sort", "attributes", "close", "total"} <= set(phases)
+    assert timings.totals()["open"]["calls"] == len(ncfiles)
+
+def test_profile_cli(ncfiles, tmp_path, capfd):
+
+    metafile = tmp_path / 'meta.yaml'
+    metafile.write_text("global:\n    Publisher: ACCESS-NRI\n")
+    json_file = tmp_path / 'timings.json'
+    dump_file = tmp_path / 'profile.out'
+
+    runcmd(f"addmeta --profile --profile-json {json_file} --profile-dump {dump_file} -m {metafile} {' '.join(ncfiles)}")
+
+    assert "per file total" in capfd.readouterr().out
+
+    timings = json.loads(json_file.read_text())
+    assert timings["files"] == len(ncfiles)
+    assert timings["phases"]["read yaml"]["calls"] == 1
+    assert sorted(timings["per_file"]) == sorted(ncfiles)
+
+    assert pstats.Stats(str(dump_file)).total_calls > 0
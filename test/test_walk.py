@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from pathlib import Path
+import pickle
+import shutil
+
+import pytest
+
+import addmeta.cli
+from addmeta import get_file_metadata
+from addmeta.walk import ScannedPath, walk_files
+from common import make_nc, get_meta_data_from_file
+
+@pytest.fixture
+def tree(tmp_path):
+    names = [
+        'run/output000/ocean/ocean.nc',
+        'run/output000/ocean/ocean.nc.bak',
+        'run/output000/ice/ice.nc',
+        'run/output001/ocean/ocean.nc',
+        'run/output001/restart/restart.nc',
+        'run/a.nc',
+        'run/z.nc',
+        'run/log.txt',
+    ]
+    for name in names:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).touch()
+    return tmp_path / 'run'
+
+def relative(files, root):
+    return [str(Path(f).relative_to(root)) for f in files]
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_walk_order(tree, threads):
+
+    files = list(walk_files([tree], threads=threads))
+
+    assert relative(files, tree) == [
+        'a.nc',
+        'z.nc',
+        'output000/ice/ice.nc',
+        'output000/ocean/ocean.nc',
+        'output001/ocean/ocean.nc',
+        'output001/restart/restart.nc',
+    ]
+    assert all(isinstance(f, ScannedPath) for f in files)
+
+def test_walk_include_exclude(tree):
+
+    files = walk_files([tree / 'output000', tree / 'output001'], include=['*.nc', '*.txt', '*.bak'], exclude=['restart', 'ice*'])
+
+    assert relative(files, tree) == [
+        'output000/ocean/ocean.nc',
+        'output000/ocean/ocean.nc.bak',
+        'output001/ocean/ocean.nc',
+    ]
+
+def test_walk_missing_directory(tmp_path):
+
+    with pytest.raises(FileNotFoundError):
+        list(walk_files([tmp_path / 'missing']))
+
+@pytest.mark.parametrize("stat", [False, True])
+def test_scanned_path_stat(tree, monkeypatch, stat):
+
+    [fname] = walk_files([tree / 'output000' / 'ice'], stat=stat)
+    expected = Path(fname).stat()
+
+    # The stat result of the DirEntry is used rather than stat'ing again
+    def fail(self, *args, **kwargs):
+        raise AssertionError("stat called")
+    monkeypatch.setattr(Path, "stat", fail)
+
+    metadata = get_file_metadata(fname)
+
+    assert metadata['size'] == expected.st_size
+    assert metadata['name'] == 'ice.nc'
+    assert metadata['fullpath'] == str(tree / 'output000' / 'ice' / 'ice.nc')
+
+def test_scanned_path_pickle(tree):
+
+    fname = next(walk_files([tree]))
+    unpickled = pickle.loads(pickle.dumps(fname))
+
+    assert type(unpickled) is str
+    assert unpickled == fname
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_recursive(make_nc, tmp_path, jobs):
+
+    ncfiles = [tmp_path / 'data' / sub / 'file.nc' for sub in ['a', 'b', 'c']]
+    for ncfile in ncfiles:
+        ncfile.parent.mkdir(parents=True)
+        shutil.copy(make_nc, ncfile)
+    (tmp_path / 'data' / 'b' / 'skip.nc').touch()
+
+    metafile = tmp_path / "meta.yaml"
+    metafile.write_text("global:\n  fullpath: '{{ __file__.fullpath }}'\n")
+
+    args = addmeta.cli.main_parse_args([f"-m={metafile}", f"--recursive={tmp_path / 'data'}", "--exclude=skip.nc", f"--jobs={jobs}"])
+    addmeta.cli.main(args)
+
+    for ncfile in ncfiles:
+        assert get_meta_data_from_file(str(ncfile))["fullpath"] == str(ncfile)
+
+def test_recursive_missing_directory(tmp_path):
+
+    metafile = tmp_path / "meta.yaml"
+    metafile.write_text("global:\n  Publisher: ACCESS-NRI\n")
+
+    args = addmeta.cli.main_parse_args([f"-m={metafile}", f"--recursive={tmp_path / 'missing'}"])
+    with pytest.raises(SystemExit, match="Error: .*missing is not a directory"):
+        addmeta.cli.main(args)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 ACCESS-NRI
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import pytest
+import yaml
+
+from addmeta import combine_meta
+from addmeta.cli import main_parse_args, main
+from addmeta.yamlcache import (
+    UnsafeCacheError,
+    YamlCache,
+    parse_yaml,
+    start_yaml_cache,
+    stop_yaml_cache,
+    use_libyaml,
+    yaml_loader,
+)
+from common import get_meta_data_from_file, make_nc
+
+@pytest.fixture
+def yaml_cache(tmp_path):
+    cache = start_yaml_cache(tmp_path / 'cache')
+    yield cache
+    stop_yaml_cache()
+
+def test_cache_hit(yaml_cache):
+
+    expected = combine_meta(['test/meta1.yaml', 'test/meta2.yaml'])
+
+    assert yaml_cache.misses == 2 and yaml_cache.hits == 0
+    assert combine_meta(['test/meta1.yaml', 'test/meta2.yaml']) == expected
+    assert yaml_cache.misses == 2 and yaml_cache.hits == 2
+    assert 'hit rate 50%' in yaml_cache.report()
+
+@pytest.mark.parametrize("key", ["mtime", "content"])
+def test_changed_file(tmp_path, key):
+
+    cache = YamlCache(tmp_path / 'cache', key=key)
+    fname = tmp_path / 'meta.yaml'
+    fname.write_text('a: 1\n')
+
+    assert cache.load(fname) == {'a': 1}
+    assert cache.load(fname) == {'a': 1}
+
+    fname.write_text('a: 22\n')
+
+    assert cache.load(fname) == {'a': 22}
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_content_key_ignores_mtime(tmp_path):
+
+    cache = YamlCache(tmp_path / 'cache', key='content')
+    fname = tmp_path / 'meta.yaml'
+    fname.write_text('a: 1\n')
+    cache.load(fname)
+
+    os.utime(fname, ns=(0, 0))
+    cache.load(fname)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_eviction(tmp_path):
+
+    cache = YamlCache(tmp_path / 'cache', max_size=0)
+    fname = tmp_path / 'meta.yaml'
+    fname.write_text('a: 1\n')
+
+    cache.load(fname)
+
+    assert list((tmp_path / 'cache').glob('*.json')) == []
+
+    # The least recently used entries are removed first
+    cache.max_size = 10**6
+    fnames = []
+    for n in range(3):
+        fnames.append(tmp_path / f'meta{n}.yaml')
+        fnames[-1].write_text(f'a: {n}\n' * 100)
+        cache.load(fnames[-1])
+    entries = {fname: tmp_path / 'cache' / cache.entry_name(fname) for fname in fnames}
+    os.utime(entries[fnames[1]], ns=(0, 0))
+    cache.max_size = sum(entry.stat().st_size for entry in entries.values()) - 1
+
+    cache.evict()
+
+    assert [entries[fname].exists() for fname in fnames] == [True, False, True]
+
+def test_corrupt_entry(tmp_path):
+
+    cache = YamlCache(tmp_path / 'cache')
+    fname = tmp_path / 'meta.yaml'
+    fname.write_text('a: 1\n')
+    cache.load(fname)
+    (tmp_path / 'cache' / cache.entry_name(fname)).write_bytes(b'rubbish')
+
+    assert cache.load(fname) == {'a': 1}
+    assert cache.misses == 2
+
+def test_yaml_types(tmp_path):
+
+    cache = YamlCache(tmp_path / 'cache')
+    fname = tmp_path / 'meta.yaml'
+    fname.write_text("date: 2025-01-31\n"
+                     "time: 2025-01-31 12:30:00+10:00\n"
+                     "1: one\n"
+                     "binary: !!binary aGVsbG8=\n"
+                     "set: !!set {a, b}\n"
+                     "map: {map: [1, 2.5, true, null]}\n")
+    expected = yaml.safe_load(fname.read_text())
+
+    assert cache.load(fname) == expected
+    assert cache.load(fname) == expected
+    assert cache.hits == 1
+
+def test_unsafe_directory(tmp_path):
+
+    YamlCache(tmp_path / 'cache')
+    assert (tmp_path / 'cache').stat().st_mode & 0o777 == 0o700
+
+    (tmp_path / 'cache').chmod(0o777)
+    with pytest.raises(UnsafeCacheError, match="writable by others"):
+        YamlCache(tmp_path / 'cache')
+
+def test_unsafe_entry(tmp_path):
+
+    cache = YamlCache(tmp_path / 'cache')
+    fname = tmp_path / 'meta.yaml'
+    fname.write_text('a: 1\n')
+    cache.load(fname)
+    entry = tmp_path / 'cache' / cache.entry_name(fname)
+    assert entry.stat().st_mode & 0o777 == 0o600
+
+    entry.write_text('[1.0, {"map": [["a", "tampered"]]}]')
+    entry.chmod(0o666)
+    assert cache.load(fname) == {'a': 1}
+    assert cache.misses == 2
+    # And replaced
+    assert entry.stat().st_mode & 0o777 == 0o600
+
+def test_libyaml():
+
+    try:
+        available = use_libyaml()
+        assert available == hasattr(yaml, 'CSafeLoader')
+        assert yaml_loader() is (yaml.CSafeLoader if available else yaml.SafeLoader)
+        assert parse_yaml('test/meta1.yaml') == yaml.safe_load(open('test/meta1.yaml'))
+    finally:
+        use_libyaml(False)
+
+    assert yaml_loader() is yaml.SafeLoader
+
+def test_cli_yaml_cache(make_nc, tmp_path, capfd):
+
+    args = ['-m', 'test/meta1.yaml', '--yaml-cache', str(tmp_path / 'cache'), '--libyaml', '-v', make_nc]
+
+    main(main_parse_args(args))
+    assert 'YAML cache: 0 hit(s), 1 miss(es)' in capfd.readouterr().out
+
+    main(main_parse_args(args))
+    assert 'YAML cache: 1 hit(s), 0 miss(es), hit rate 100%' in capfd.readouterr().out
+
+    assert get_meta_data_from_file(make_nc)['Year'] == 2017
+
+def test_cli_unsafe_yaml_cache(make_nc, tmp_path):
+
+    (tmp_path / 'cache').mkdir()
+    (tmp_path / 'cache').chmod(0o777)
+    args = ['-m', 'test/meta1.yaml', '--yaml-cache', str(tmp_path / 'cache'), make_nc]
+
+    with pytest.warns(UserWarning, match="writable by others, not caching"):
+        main(main_parse_args(args))
+    assert get_meta_data_from_file(make_nc)['Year'] == 2017
+    assert list((tmp_path / 'cache').iterdir()) == []